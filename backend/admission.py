@@ -0,0 +1,384 @@
+"""Per-client admission control for the story pipeline.
+
+This module provides:
+- Client identification by known token or IP address
+- A quota on the /analyze streams one client may have open at once
+- Weighted fair queuing of expensive stage work (browser page loads,
+  screenshots, LLM calls) across clients, with a cap on the slots one
+  client may hold in each pool
+
+Each pool is a start-time fair queue: work is tagged with a virtual start
+time and served in tag order, so a client with many streams queued gets
+its turn after every other waiting client rather than in front of them.
+Weights scale a client's share; background work such as revalidation
+runs at BACKGROUND_WEIGHT.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from deadline import Deadline, DeadlineExceeded
+from metrics import ADMISSION_WAIT, ADMISSION_QUEUED, ADMISSION_REJECTIONS
+from screenshot_jobs import SCREENSHOT_JOB_WORKERS
+from tracing import trace_event
+from utils.browser import BROWSER_MAX_PAGES
+from utils.gemini import LLM_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# /analyze streams one client may have open at once
+CLIENT_MAX_STREAMS = int(os.getenv("CLIENT_MAX_STREAMS", "2"))
+
+# Slots one client may hold at once in each pool
+CLIENT_MAX_INFLIGHT = int(os.getenv("CLIENT_MAX_INFLIGHT", "2"))
+
+# Per-client weights ("ip:10.0.0.5=2,token:partner=4"); others weigh 1
+CLIENT_WEIGHTS = os.getenv("CLIENT_WEIGHTS", "")
+
+# Tokens accepted in X-Client-Token, as "name=token" (accounted to "token:<name>")
+# or a bare token without "=" (accounted to "token:<hash prefix>"); others are ignored
+CLIENT_TOKENS = os.getenv("CLIENT_TOKENS", "")
+
+# Weight of work not started by a client (revalidation)
+BACKGROUND_CLIENT = "background"
+BACKGROUND_WEIGHT = float(os.getenv("BACKGROUND_WEIGHT", "0.5"))
+
+# Identify clients by the first X-Forwarded-For address (only behind a trusted proxy)
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0") == "1"
+
+# Queue waits at least this long are reported as stream `log` events
+ADMISSION_LOG_MIN_WAIT = float(os.getenv("ADMISSION_LOG_MIN_WAIT", "0.25"))
+
+# Stage pools and their capacity; these match the limits of the resources behind them
+POOL_CAPACITIES = {
+    "browser": BROWSER_MAX_PAGES,
+    "screenshot": SCREENSHOT_JOB_WORKERS,
+    "llm": LLM_CONCURRENCY,
+}
+POOL_LABELS = {"browser": "browser page", "screenshot": "screenshot", "llm": "LLM"}
+
+# Finish tags kept per pool before those behind the virtual time are dropped
+MAX_TRACKED_CLIENTS = 1024
+
+class QuotaExceeded(Exception):
+    """Raised when a client is over one of its quotas."""
+
+def token_id(token: str) -> str:
+    """Return the hash prefix a token is logged and accounted under."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:12]
+
+def parse_tokens(spec: str) -> Dict[str, str]:
+    """Parse 'name=token,token' into a dictionary of token -> client name."""
+    tokens = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, separator, token = item.partition("=")
+        if not separator:
+            name, token = "", item
+        if not token:
+            logger.warning(f"Ignoring empty client token for '{name}'")
+            continue
+        tokens[token] = name or token_id(token)
+    return tokens
+
+# Known client tokens; a token is only trusted if the operator handed it out
+KNOWN_TOKENS = parse_tokens(CLIENT_TOKENS)
+
+def client_key(
+    host: Optional[str],
+    token: Optional[str] = None,
+    forwarded_for: Optional[str] = None,
+    known_tokens: Optional[Dict[str, str]] = None,
+) -> str:
+    """Return the key work is accounted to.
+
+    Only tokens listed in CLIENT_TOKENS identify a client: any other token
+    is ignored, so a client cannot mint a fresh quota by sending a new
+    token with each request. Unnamed tokens are hashed so they never show
+    up in logs or metrics.
+
+    Args:
+        host: Address of the connecting peer
+        token: Client token, if the client sent one
+        forwarded_for: X-Forwarded-For header value
+        known_tokens: Token -> client name (KNOWN_TOKENS by default)
+
+    Returns:
+        "token:<name>" or "ip:<address>"
+    """
+    known_tokens = KNOWN_TOKENS if known_tokens is None else known_tokens
+    if token and token in known_tokens:
+        return "token:" + known_tokens[token]
+    if TRUST_FORWARDED_FOR and forwarded_for:
+        host = forwarded_for.split(",")[0].strip() or host
+    return f"ip:{host or 'unknown'}"
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Parse 'client=weight,client=weight' into a dictionary."""
+    weights = {}
+    for item in spec.split(","):
+        client, _, weight = item.strip().rpartition("=")
+        try:
+            if client and float(weight) > 0:
+                weights[client] = float(weight)
+        except ValueError:
+            logger.warning(f"Ignoring invalid client weight '{item}'")
+    return weights
+
+class _Waiter:
+    __slots__ = ("start", "sequence", "future")
+
+    def __init__(self, start: float, sequence: int, future: asyncio.Future):
+        self.start = start
+        self.sequence = sequence
+        self.future = future
+
+class FairQueue:
+    """Start-time fair queue in front of one pool of stage slots."""
+
+    def __init__(self, name: str, capacity: int, max_inflight: int = CLIENT_MAX_INFLIGHT):
+        """Initialize the queue.
+
+        Args:
+            name: Pool name used in metrics and logs
+            capacity: Slots handed out at once
+            max_inflight: Slots one client may hold at once
+        """
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.max_inflight = max(1, max_inflight)
+        self.in_use = 0
+        self.virtual_time = 0.0
+        self._sequence = itertools.count()
+        self._last_finish: Dict[str, float] = {}
+        self._waiting: Dict[str, Deque[_Waiter]] = {}
+        self._held: Dict[str, int] = {}
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._waiting.values())
+
+    def _eligible(self, client: str) -> bool:
+        return self._held.get(client, 0) < self.max_inflight
+
+    def _dispatch(self):
+        """Grant free slots to the eligible waiters with the lowest start tags."""
+        while self.in_use < self.capacity:
+            best_client, best = None, None
+            for client, queue in self._waiting.items():
+                head = queue[0]
+                if self._eligible(client) and (best is None or (head.start, head.sequence) < (best.start, best.sequence)):
+                    best_client, best = client, head
+            if best is None:
+                break
+            queue = self._waiting[best_client]
+            queue.popleft()
+            if not queue:
+                del self._waiting[best_client]
+            self.in_use += 1
+            self._held[best_client] = self._held.get(best_client, 0) + 1
+            self.virtual_time = max(self.virtual_time, best.start)
+            best.future.set_result(None)
+        ADMISSION_QUEUED.labels(self.name).set(self.waiting)
+
+    def _withdraw(self, client: str, waiter: _Waiter):
+        queue = self._waiting.get(client)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._waiting[client]
+        if client not in self._waiting and client not in self._held:
+            self._last_finish.pop(client, None)
+        ADMISSION_QUEUED.labels(self.name).set(self.waiting)
+
+    async def acquire(self, client: str, weight: float = 1.0, cost: float = 1.0, timeout: Optional[float] = None) -> float:
+        """Wait for a slot in this pool.
+
+        Args:
+            client: Client key the work is accounted to
+            weight: Client's share relative to other clients
+            cost: Relative cost of the work
+            timeout: Longest to wait, in seconds
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            asyncio.TimeoutError: If no slot was granted within timeout
+        """
+        started = time.monotonic()
+        start = max(self.virtual_time, self._last_finish.get(client, 0.0))
+        self._last_finish[client] = start + cost / weight
+        waiter = _Waiter(start, next(self._sequence), asyncio.get_running_loop().create_future())
+        self._waiting.setdefault(client, deque()).append(waiter)
+        self._dispatch()
+        if not waiter.future.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            except BaseException:
+                if waiter.future.done():
+                    # Granted while the wait was being abandoned
+                    self.release(client)
+                else:
+                    waiter.future.cancel()
+                    self._withdraw(client, waiter)
+                raise
+        return time.monotonic() - started
+
+    def release(self, client: str):
+        """Return a slot and hand it to the next waiter."""
+        self.in_use -= 1
+        held = self._held.get(client, 0) - 1
+        if held > 0:
+            self._held[client] = held
+        else:
+            self._held.pop(client, None)
+        if self.in_use == 0 and not self._waiting:
+            # Nobody is competing, so past shares no longer matter
+            self._last_finish.clear()
+        elif len(self._last_finish) > MAX_TRACKED_CLIENTS:
+            # Clients behind the virtual time start from it anyway
+            self._last_finish = {c: f for c, f in self._last_finish.items() if f > self.virtual_time}
+        self._dispatch()
+
+    def to_dict(self) -> Dict[str, Any]:
+        clients = set(self._held) | set(self._waiting)
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "clients": {
+                client: {"held": self._held.get(client, 0), "waiting": len(self._waiting.get(client, ()))}
+                for client in sorted(clients)
+            },
+        }
+
+class StreamTicket:
+    """An open /analyze stream counted against its client's quota."""
+
+    __slots__ = ("client", "_admission", "_closed")
+
+    def __init__(self, client: str, admission: "Admission"):
+        self.client = client
+        self._admission = admission
+        self._closed = False
+
+    def close(self):
+        """Release the stream; safe to call more than once."""
+        if not self._closed:
+            self._closed = True
+            self._admission._close_stream(self.client)
+
+class Admission:
+    """Stream quotas and fair stage queues for every client of this worker."""
+
+    def __init__(
+        self,
+        max_streams: int = CLIENT_MAX_STREAMS,
+        max_inflight: int = CLIENT_MAX_INFLIGHT,
+        weights: Optional[Dict[str, float]] = None,
+    ):
+        """Initialize admission control.
+
+        Args:
+            max_streams: Streams one client may have open
+            max_inflight: Slots one client may hold in each pool
+            weights: Per-client weights (CLIENT_WEIGHTS by default)
+        """
+        self.max_streams = max_streams
+        self.weights = parse_weights(CLIENT_WEIGHTS) if weights is None else weights
+        self.pools = {name: FairQueue(name, capacity, max_inflight) for name, capacity in POOL_CAPACITIES.items()}
+        self._streams: Dict[str, int] = {}
+
+    def weight(self, client: str) -> float:
+        if client == BACKGROUND_CLIENT:
+            return self.weights.get(client, BACKGROUND_WEIGHT)
+        return self.weights.get(client, 1.0)
+
+    def open_stream(self, client: str) -> StreamTicket:
+        """Count a new stream against the client's quota.
+
+        Returns:
+            Ticket to close when the stream ends
+
+        Raises:
+            QuotaExceeded: If the client already has max_streams streams open
+        """
+        open_streams = self._streams.get(client, 0)
+        if open_streams >= self.max_streams:
+            ADMISSION_REJECTIONS.labels("streams").inc()
+            logger.info(f"[ADMISSION] {client} rejected: {open_streams} streams open")
+            raise QuotaExceeded(f"Too many concurrent streams ({open_streams} open, limit {self.max_streams})")
+        self._streams[client] = open_streams + 1
+        return StreamTicket(client, self)
+
+    def _close_stream(self, client: str):
+        remaining = self._streams.get(client, 0) - 1
+        if remaining > 0:
+            self._streams[client] = remaining
+        else:
+            self._streams.pop(client, None)
+
+    @asynccontextmanager
+    async def slot(self, pool: str, client: Optional[str] = None, deadline: Optional[Deadline] = None) -> AsyncIterator[float]:
+        """Hold a slot in a stage pool, waiting for the client's fair turn.
+
+        Args:
+            pool: "browser", "screenshot" or "llm"
+            client: Client key (background work when None)
+            deadline: Story deadline bounding the wait
+
+        Yields:
+            Seconds spent waiting for the slot
+
+        Raises:
+            DeadlineExceeded: If no slot was free before the deadline
+        """
+        client = client or BACKGROUND_CLIENT
+        queue = self.pools[pool]
+        timeout = max(0.0, deadline.remaining()) if deadline is not None else None
+        try:
+            waited = await queue.acquire(client, self.weight(client), timeout=timeout)
+        except asyncio.TimeoutError:
+            ADMISSION_REJECTIONS.labels("deadline").inc()
+            trace_event("admission", pool=pool, action="timed_out")
+            raise DeadlineExceeded(f"No {POOL_LABELS[pool]} slot free before the story deadline")
+        ADMISSION_WAIT.labels(pool).observe(waited)
+        if waited >= ADMISSION_LOG_MIN_WAIT:
+            trace_event("admission", pool=pool, waited_ms=round(waited * 1000, 2))
+        try:
+            yield waited
+        finally:
+            queue.release(client)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "streams": dict(sorted(self._streams.items())),
+            "pools": {name: queue.to_dict() for name, queue in self.pools.items()},
+        }
+
+def wait_event(pool: str, waited: float) -> Optional[str]:
+    """Return a `log` event reporting a queue wait, or None if it was short."""
+    if waited < ADMISSION_LOG_MIN_WAIT:
+        return None
+    return f"event: log\ndata: Waited {waited:.1f}s in the queue for a {POOL_LABELS[pool]} slot\n\n"
+
+async def admitted_stream(ticket: StreamTicket, stream):
+    """Pass a stream through, closing its ticket when it ends or is abandoned."""
+    try:
+        async for event in stream:
+            yield event
+    finally:
+        ticket.close()
+
+# Create global admission controller
+admission = Admission()
@@ -0,0 +1,5 @@
+"""Benchmarks for the backend.
+
+- load: offline end-to-end load benchmark of /analyze against local stubs
+- micro: micro-benchmarks of parsing and validation hot paths with baselines
+"""
@@ -0,0 +1,369 @@
+"""Offline end-to-end load benchmark for /analyze.
+
+Starts local stand-ins for news.ycombinator.com, the article sites and
+Gemini (see the stubs package), launches the backend under uvicorn pointed
+at them, and drives /analyze at several concurrency levels and cold/warm
+cache ratios. For every scenario it reports time-to-first-event, per-story
+latency percentiles, throughput and peak RSS of the backend process tree.
+
+Results are written as JSON so runs can be compared across commits:
+
+    python -m bench.load --concurrency 1 4 8 --warm-ratios 0 0.5 1 --output results.json
+    python -m bench.load --compare baseline.json results.json
+
+Chromium must be installed for Playwright (`playwright install chromium`).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+from stubs import articles, gemini, hn_site
+
+try:
+    import psutil
+except ImportError:  # RSS then covers the server process only
+    psutil = None
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_CACHE_DIR = os.path.join(BACKEND_DIR, "cache")
+
+def percentiles(values: List[float], points=(50, 90, 99)) -> Dict[str, Optional[float]]:
+    """Nearest-rank percentiles, in the same unit as values."""
+    if not values:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(values)
+    result = {}
+    for p in points:
+        rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+        result[f"p{p}"] = round(ordered[rank], 2)
+    result["mean"] = round(sum(ordered) / len(ordered), 2)
+    return result
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def prepare_cache(cache_dir: str, stories: List[dict], warm_ratio: float) -> int:
+    """Pre-populate the story cache for a fraction of the frontpage.
+
+    Warm stories are spread evenly over the page so cold and warm work
+    interleave the way they do in production.
+
+    Returns:
+        Number of stories written to the cache
+    """
+    fixtures = {}
+    for name in os.listdir(FIXTURE_CACHE_DIR):
+        if name.endswith(".json"):
+            with open(os.path.join(FIXTURE_CACHE_DIR, name), encoding="utf-8") as f:
+                fixtures[name[:-5]] = json.load(f)
+
+    warm = 0
+    for i, story in enumerate(stories):
+        if int((i + 1) * warm_ratio) == int(i * warm_ratio):
+            continue
+        cached = dict(fixtures[str(story["fixture_id"])])
+        cached["hn_id"] = str(story["id"])
+        cached["url"] = f"https://news.ycombinator.com/item?id={story['id']}"
+        cached["article_url"] = story["url"]
+        cached["screenshot_path"] = None
+        with open(os.path.join(cache_dir, f"{story['id']}.json"), "w", encoding="utf-8") as f:
+            json.dump(cached, f, ensure_ascii=False)
+        warm += 1
+    return warm
+
+class RSSSampler:
+    """Tracks peak resident memory of a process and its children."""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_bytes = 0
+        self.scope = "process_tree" if psutil else "server"
+        if psutil is None:
+            print("[bench] psutil is not installed; peak RSS excludes browser processes "
+                  "(pip install -r requirements.txt)", file=sys.stderr)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> int:
+        if psutil is not None:
+            try:
+                proc = psutil.Process(self.pid)
+                total = proc.memory_info().rss
+                for child in proc.children(recursive=True):
+                    try:
+                        total += child.memory_info().rss
+                    except psutil.Error:
+                        pass
+                return total
+            except psutil.Error:
+                return 0
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, self._sample())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+class Backend:
+    """The FastAPI app running under uvicorn in a subprocess."""
+
+    def __init__(self, env: Dict[str, str], log_path: str):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.env = env
+        self.log_path = log_path
+        self.process: Optional[subprocess.Popen] = None
+        self.startup: Dict = {}
+
+    def start(self, timeout: float = 60):
+        """Launch uvicorn and wait for /ready, keeping its startup timings."""
+        log = open(self.log_path, "ab")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=self.env, stdout=log, stderr=subprocess.STDOUT
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Backend exited during startup, see {self.log_path}")
+            try:
+                response = httpx.get(f"{self.base_url}/ready", timeout=1)
+                if response.status_code == 200:
+                    self.startup = response.json().get("timings", {})
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"Backend did not start within {timeout}s, see {self.log_path}")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+async def run_client(client: httpx.AsyncClient, url: str, token: str) -> Dict:
+    """Consume one /analyze stream as a distinct client and time its events."""
+    start = time.perf_counter()
+    first_event = None
+    last = start
+    story_latencies = []
+    errors = 0
+    event = None
+    try:
+        async with client.stream("GET", url, headers={"X-Client-Token": token}) as response:
+            if response.status_code != 200:
+                errors += 1
+            async for line in response.aiter_lines():
+                now = time.perf_counter()
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                    continue
+                if not line.startswith("data:"):
+                    if not line:
+                        event = None
+                    continue
+                if first_event is None:
+                    first_event = now - start
+                if event is None:
+                    story_latencies.append((now - last) * 1000)
+                    last = now
+                elif event == "error":
+                    errors += 1
+                elif event == "complete":
+                    break
+    except httpx.HTTPError:
+        errors += 1
+    return {
+        "ttfe_ms": first_event * 1000 if first_event is not None else None,
+        "story_latencies_ms": story_latencies,
+        "errors": errors,
+        "duration_s": time.perf_counter() - start,
+    }
+
+async def drive(base_url: str, concurrency: int, limit: int) -> Dict:
+    """Open `concurrency` simultaneous /analyze streams and aggregate them."""
+    url = f"{base_url}/analyze?offset=0&limit={limit}"
+    timeout = httpx.Timeout(None, connect=10)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(run_client(client, url, f"bench-{i}") for i in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    ttfes = [r["ttfe_ms"] for r in results if r["ttfe_ms"] is not None]
+    latencies = [lat for r in results for lat in r["story_latencies_ms"]]
+    return {
+        "ttfe_ms": percentiles(ttfes),
+        "story_latency_ms": percentiles(latencies),
+        "stories": len(latencies),
+        "errors": sum(r["errors"] for r in results),
+        "wall_s": round(wall, 3),
+        "throughput_stories_per_s": round(len(latencies) / wall, 3) if wall else None,
+    }
+
+def run_benchmark(args) -> Dict:
+    workdir = tempfile.mkdtemp(prefix="hn-bench-")
+    article_server, articles_base = articles.start_server(latency=args.article_latency)
+    site_server, site_base = hn_site.start_server(story_count=args.stories, articles_base=articles_base)
+    gemini_server, gemini_base = gemini.start_server(latency=args.llm_latency, jitter=args.llm_jitter)
+    stories = hn_site.build_frontpage(args.stories, articles_base)
+
+    scenarios = []
+    try:
+        for warm_ratio in args.warm_ratios:
+            for concurrency in args.concurrency:
+                cache_dir = os.path.join(workdir, f"cache-{warm_ratio}-{concurrency}")
+                screenshot_dir = os.path.join(workdir, f"screenshots-{warm_ratio}-{concurrency}")
+                os.makedirs(cache_dir)
+                os.makedirs(screenshot_dir)
+                warm = prepare_cache(cache_dir, stories[:args.limit], warm_ratio)
+
+                env = dict(os.environ)
+                env.update({
+                    "HN_SOURCE": "html",
+                    "HN_BASE_URL": site_base,
+                    "GEMINI_API_BASE": gemini_base,
+                    "GEMINI_API_KEY": env.get("GEMINI_API_KEY", "bench"),
+                    "CACHE_DIR": cache_dir,
+                    "SCREENSHOT_DIR": screenshot_dir,
+                    # Keep warm-cache scenarios free of background re-fetches
+                    "REVALIDATE_AFTER": "0",
+                    # Measure the full pipeline; degraded modes would skew the baselines
+                    "OVERLOAD_CONTROL": "0",
+                    # Each simulated client is a distinct known token
+                    "CLIENT_TOKENS": ",".join(f"bench-{i}=bench-{i}" for i in range(concurrency)),
+                })
+                backend = Backend(env, os.path.join(workdir, "backend.log"))
+                print(f"[bench] warm_ratio={warm_ratio} concurrency={concurrency} ...", file=sys.stderr)
+                backend.start()
+                try:
+                    with RSSSampler(backend.process.pid) as sampler:
+                        result = asyncio.run(drive(backend.base_url, concurrency, args.limit))
+                finally:
+                    backend.stop()
+
+                result.update({
+                    "warm_ratio": warm_ratio,
+                    "warm_stories": warm,
+                    "concurrency": concurrency,
+                    "peak_rss_mb": round(sampler.peak_bytes / 2**20, 1),
+                    "rss_scope": sampler.scope,
+                    "startup": backend.startup,
+                })
+                scenarios.append(result)
+                print(f"[bench]   {json.dumps(result)}", file=sys.stderr)
+    finally:
+        for server in (article_server, site_server, gemini_server):
+            server.shutdown()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "benchmark": "analyze_load",
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "limit": args.limit,
+            "stories": args.stories,
+            "llm_latency_s": args.llm_latency,
+            "llm_jitter_s": args.llm_jitter,
+            "article_latency_s": args.article_latency,
+        },
+        "scenarios": scenarios,
+    }
+
+def compare(baseline_path: str, current_path: str):
+    """Print per-scenario deltas between two result files."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(current_path) as f:
+        current = json.load(f)
+    base = {(s["warm_ratio"], s["concurrency"]): s for s in baseline["scenarios"]}
+    print(f"{'scenario':<18}{'metric':<28}{'baseline':>12}{'current':>12}{'change':>10}")
+    for scenario in current["scenarios"]:
+        key = (scenario["warm_ratio"], scenario["concurrency"])
+        old = base.get(key)
+        if old is None:
+            continue
+        rows = [
+            ("ttfe_ms.p50", old["ttfe_ms"]["p50"], scenario["ttfe_ms"]["p50"]),
+            ("story_latency_ms.p50", old["story_latency_ms"]["p50"], scenario["story_latency_ms"]["p50"]),
+            ("story_latency_ms.p99", old["story_latency_ms"]["p99"], scenario["story_latency_ms"]["p99"]),
+            ("throughput_stories_per_s", old["throughput_stories_per_s"], scenario["throughput_stories_per_s"]),
+            ("peak_rss_mb", old["peak_rss_mb"], scenario["peak_rss_mb"]),
+        ]
+        for metric, before, after in rows:
+            change = f"{(after - before) / before * 100:+.1f}%" if before and after is not None else "n/a"
+            print(f"{f'warm={key[0]} c={key[1]}':<18}{metric:<28}{str(before):>12}{str(after):>12}{change:>10}")
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end load benchmark for /analyze")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--warm-ratios", type=float, nargs="+", default=[0.0, 1.0])
+    parser.add_argument("--limit", type=int, default=5, help="stories per /analyze request")
+    parser.add_argument("--stories", type=int, default=30, help="stories on the stub frontpage")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="mean stub Gemini latency (s)")
+    parser.add_argument("--llm-jitter", type=float, default=0.2)
+    parser.add_argument("--article-latency", type=float, default=0.05)
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    parser.add_argument("--keep-workdir", action="store_true")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = run_benchmark(args)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""Micro-benchmarks for the CPU-bound parsing and validation hot paths.
+
+Covers article extraction and URL rewriting in utils.scraper, bot
+detection, content and comment validation and HTML-to-text cleanup in
+utils.gemini, and story record decoding/encoding in records. The corpus is built
+from the saved articles in backend/cache plus synthetic large and deeply
+nested pages.
+
+Methodology: each case is warmed up, calibrated so one repeat takes at
+least --min-time seconds, then timed over --repeats repeats with the
+garbage collector disabled. Per-call min and median are reported; the
+median is compared against the saved baseline.
+
+    python -m bench.micro                       # print results
+    python -m bench.micro --save-baseline       # record bench/baselines/micro.json
+    python -m bench.micro --check --threshold 0.2
+"""
+
+import argparse
+import copy
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+from stubs.articles import CACHE_FIXTURES_DIR, build_page
+from records import Story, decode_story, encode_story
+from utils.gemini import html_to_text, validate_comments, validate_content
+from utils.scraper import extract_article, has_bot_detection, rewrite_article_urls
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "micro.json")
+
+def load_cached_stories() -> List[dict]:
+    stories = []
+    for name in sorted(os.listdir(CACHE_FIXTURES_DIR)):
+        if name.endswith(".json"):
+            with open(os.path.join(CACHE_FIXTURES_DIR, name), encoding="utf-8") as f:
+                stories.append(json.load(f))
+    return stories
+
+def synthetic_large_page(paragraphs: int = 2000) -> str:
+    """A ~1 MB article with many images, links and relative URLs."""
+    blocks = []
+    for i in range(paragraphs):
+        blocks.append(
+            f'<p class="para p{i}" style="margin:0">Paragraph {i} discusses caching, latency and '
+            f'<a href="/ref/{i}">reference {i}</a> with an inline figure '
+            f'<img src="img/{i}.png" srcset="img/{i}@2x.png 2x" class="figure"></p>'
+        )
+        if i % 50 == 0:
+            blocks.append(f'<video src="media/{i}.mp4"></video>')
+    return (
+        "<html><head><title>Large synthetic article</title>"
+        '<meta name="description" content="synthetic"></head>'
+        f"<body><article>{''.join(blocks)}</article></body></html>"
+    )
+
+def synthetic_nested_page(depth: int = 300) -> str:
+    """A page whose content sits under deeply nested wrappers and has no <main>/<article>."""
+    text = "Nested content about distributed systems and queueing theory. " * 20
+    inner = f'<p>{text}<a href="deep/link">link</a><img src="deep.png"></p>'
+    return (
+        "<html><head><title>Nested synthetic page</title></head><body>"
+        + "<div class=\"wrap\">" * depth + inner + "</div>" * depth
+        + "</body></html>"
+    )
+
+def build_corpus() -> Dict[str, dict]:
+    """Build named pages with their URL, article HTML, text and comments."""
+    corpus = {}
+    for story in load_cached_stories():
+        if not story.get("full_article_html"):
+            continue
+        corpus[f"cached-{story['hn_id']}"] = {
+            "url": story["article_url"],
+            "page": build_page(story),
+            "story": story,
+        }
+    corpus["synthetic-large"] = {"url": "https://example.com/large/post", "page": synthetic_large_page()}
+    corpus["synthetic-nested"] = {"url": "https://example.com/nested/post", "page": synthetic_nested_page()}
+
+    comments = [c for story in load_cached_stories() for c in story.get("top_comments", [])]
+    reference_story = load_cached_stories()[0]
+    for entry in corpus.values():
+        extracted = extract_article(entry["page"], entry["url"])
+        entry["article_html"] = extracted.get("html", "")
+        entry["text"] = extracted.get("text", "")
+        entry["comments"] = comments
+        entry.setdefault("story", reference_story)
+    return corpus
+
+def make_cases(corpus: Dict[str, dict]) -> Dict[str, Tuple[Callable, Optional[Callable]]]:
+    """Map case names to (function, per-call setup) pairs.
+
+    Setup results are passed to the function and excluded from timing.
+    """
+    cases = {}
+    for name, entry in corpus.items():
+        page, url, article_html, text = entry["page"], entry["url"], entry["article_html"], entry["text"]
+        story, comments = entry["story"], entry["comments"]
+        parsed = BeautifulSoup(page, "html.parser")
+        root = parsed.find("main") or parsed.find("article") or parsed.body
+
+        cases[f"extract_article/{name}"] = (lambda _, p=page, u=url: extract_article(p, u), None)
+        cases[f"rewrite_article_urls/{name}"] = (
+            lambda soup, u=url: rewrite_article_urls(soup, u),
+            lambda r=root: copy.copy(r)
+        )
+        cases[f"has_bot_detection/{name}"] = (lambda _, p=page: has_bot_detection(p), None)
+        cases[f"validate_content/{name}"] = (lambda _, t=text: validate_content(t), None)
+        cases[f"html_to_text/{name}"] = (lambda _, h=article_html: html_to_text(h), None)
+        if name.startswith("cached-"):
+            encoded = json.dumps(story).encode("utf-8")
+            record = Story.from_dict(story)
+            cases[f"decode_story/{name}"] = (lambda _, b=encoded: decode_story(b), None)
+            cases[f"encode_story/{name}"] = (lambda _, r=record: encode_story(r), None)
+    cases["validate_comments/all-cached"] = (lambda _, c=comments: validate_comments(c), None)
+    return cases
+
+def time_case(func: Callable, setup: Optional[Callable], repeats: int, min_time: float) -> Dict[str, float]:
+    """Time one case, returning per-call statistics in microseconds."""
+    # Warm up and calibrate the number of calls per repeat
+    loops = 1
+    while True:
+        elapsed = _run(func, setup, loops)
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    samples = [_run(func, setup, loops) / loops * 1e6 for _ in range(repeats)]
+    return {
+        "min_us": round(min(samples), 3),
+        "median_us": round(statistics.median(samples), 3),
+        "stdev_us": round(statistics.pstdev(samples), 3),
+        "loops": loops,
+    }
+
+def _run(func: Callable, setup: Optional[Callable], loops: int) -> float:
+    args = [setup() for _ in range(loops)] if setup else [None] * loops
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for arg in args:
+            func(arg)
+        return time.perf_counter() - start
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+def check_against_baseline(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """Return a message per case whose median regressed beyond threshold."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = result["median_us"] / base["median_us"] if base["median_us"] else 1.0
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{name}: {base['median_us']:.1f}us -> {result['median_us']:.1f}us ({(ratio - 1) * 100:+.1f}%)"
+            )
+    return regressions
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for parsing and validation hot paths")
+    parser.add_argument("--filter", default="", help="only run cases containing this substring")
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.05, help="minimum seconds per repeat")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="exit non-zero on regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed median slowdown (0.2 = 20%%)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    cases = make_cases(build_corpus())
+    results = {}
+    for name, (func, setup) in sorted(cases.items()):
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = time_case(func, setup, args.repeats, args.min_time)
+        if not args.json:
+            r = results[name]
+            print(f"{name:<52} median {r['median_us']:>12.1f} us   min {r['min_us']:>12.1f} us", file=sys.stderr)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": results,
+            }, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}", file=sys.stderr)
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; run with --save-baseline first", file=sys.stderr)
+            sys.exit(2)
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = check_against_baseline(results, baseline, args.threshold)
+        if regressions:
+            print("Regressions beyond threshold:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+        print("No regressions beyond threshold", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
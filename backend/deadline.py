@@ -0,0 +1,78 @@
+"""Per-story deadline budgets.
+
+A Deadline is created for each story processed by stream_articles and
+passed to every stage. Stages size their own timeouts from the time left
+(keeping back a reserve for the stages after them) and degrade instead of
+failing when it runs short: the screenshot is skipped, long-document
+condensing is skipped and the analysis prompt is shortened.
+"""
+
+import os
+import time
+from typing import Any, Dict, Optional
+
+# Total time one story may take through the pipeline
+STORY_DEADLINE_SECONDS = float(os.getenv("STORY_DEADLINE_SECONDS", "90"))
+
+# Time held back for the hook and analysis calls when budgeting page loads
+LLM_RESERVE_SECONDS = float(os.getenv("LLM_RESERVE_SECONDS", "20"))
+
+# A stage is skipped rather than started with less than this much time
+MIN_STAGE_SECONDS = 2.0
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a stage has no time left in the story budget."""
+
+class Deadline:
+    """Monotonic-clock deadline shared by the stages of one story."""
+
+    __slots__ = ("budget", "started", "expires_at")
+
+    def __init__(self, budget: float = STORY_DEADLINE_SECONDS):
+        """Start a deadline.
+
+        Args:
+            budget: Seconds from now until the deadline
+        """
+        self.budget = budget
+        self.started = time.monotonic()
+        self.expires_at = self.started + budget
+
+    def remaining(self) -> float:
+        """Seconds left, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, default: float, reserve: float = 0.0) -> float:
+        """Timeout for a stage: its default, capped by the time left.
+
+        Args:
+            default: The stage's own timeout in seconds
+            reserve: Seconds to keep for the stages that follow
+
+        Returns:
+            Timeout in seconds (0 when nothing is left)
+        """
+        return max(0.0, min(default, self.remaining() - reserve))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "budget_s": self.budget,
+            "elapsed_s": round(self.elapsed(), 3),
+            "remaining_s": round(self.remaining(), 3),
+        }
+
+def stage_timeout(deadline: Optional[Deadline], default: float, reserve: float = 0.0) -> float:
+    """Timeout for a stage that may run without a deadline.
+
+    Returns:
+        default when deadline is None, otherwise Deadline.timeout()
+    """
+    if deadline is None:
+        return default
+    return deadline.timeout(default, reserve)
@@ -0,0 +1,466 @@
+"""Caching proxy for article images.
+
+This module provides:
+- A proxy that fetches each article image once and serves it from a
+  bounded on-disk cache under CACHE_DIR/images
+- Resized variants at a few fixed widths suited to the article card, so
+  clients download card-sized images instead of full-size originals
+- The URL rewrite used by the scraper to point images at the proxy
+
+Variants are content-addressed by source URL and width, so responses are
+served with long-lived immutable caching headers. Fetches are shared
+between workers with the same leases as the story cache; the least
+recently used files are evicted when the cache grows past its limit.
+"""
+
+import asyncio
+import hashlib
+import ipaddress
+import logging
+import os
+import socket
+import time
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import quote, urljoin, urlparse
+
+import httpx
+
+from metrics import IMAGE_PROXY_REQUESTS, IMAGE_PROXY_BYTES, IMAGE_CACHE_BYTES
+from storage import CACHE_DIR, atomic_write, lease
+
+logger = logging.getLogger(__name__)
+
+# Rewrite article images to the proxy (set to 0 to keep origin URLs)
+IMAGE_PROXY = os.getenv("IMAGE_PROXY", "1") == "1"
+
+# Public base URL of this API as seen by the frontend ("" for same-origin, e.g. "/api")
+IMAGE_PROXY_BASE_URL = os.getenv("IMAGE_PROXY_BASE_URL", "").rstrip("/")
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(CACHE_DIR, "images"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Variant widths in pixels; requests snap up to the nearest one. The article
+# card is at most 1200px wide, so the default variant covers it at 1x.
+IMAGE_WIDTHS = sorted(int(w) for w in os.getenv("IMAGE_WIDTHS", "400,800,1200,1600").split(",") if w.strip())
+IMAGE_DEFAULT_WIDTH = int(os.getenv("IMAGE_DEFAULT_WIDTH", "800"))
+
+# Limits on fetching originals
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "15"))
+IMAGE_MAX_SOURCE_BYTES = int(os.getenv("IMAGE_MAX_SOURCE_BYTES", str(10 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_MAX_REDIRECTS = 5
+
+# Allow fetching from private and loopback addresses (local stubs only)
+IMAGE_PROXY_ALLOW_PRIVATE = os.getenv("IMAGE_PROXY_ALLOW_PRIVATE", "0") == "1"
+
+# Browser cache lifetime of served variants, and how long failed sources are not retried
+IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", str(30 * 24 * 3600)))
+IMAGE_NEGATIVE_TTL = float(os.getenv("IMAGE_NEGATIVE_TTL", "300"))
+IMAGE_NEGATIVE_CACHE_SIZE = 1024
+
+# Only evict down to this fraction of the limit so eviction does not run on every write
+EVICT_TO_FRACTION = 0.9
+
+USER_AGENT = "Mozilla/5.0 (compatible; HNArticleImageProxy/1.0)"
+
+CONTENT_TYPE_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "image/avif": "avif",
+    "image/svg+xml": "svg",
+}
+EXTENSION_CONTENT_TYPES = {ext: content_type for content_type, ext in CONTENT_TYPE_EXTENSIONS.items()}
+
+# Formats Pillow re-encodes; anything else (SVG, AVIF) is served as fetched
+RESIZABLE_FORMATS = {"JPEG", "PNG", "GIF", "WEBP"}
+
+# Served images must not be able to run script if opened directly
+RESPONSE_SECURITY_HEADERS = {
+    "Content-Security-Policy": "default-src 'none'; style-src 'unsafe-inline'; sandbox",
+    "X-Content-Type-Options": "nosniff",
+}
+
+class ImageProxyError(Exception):
+    """Raised when an image cannot be proxied; status is the HTTP status to return."""
+    def __init__(self, message: str, status: int):
+        self.message = message
+        self.status = status
+        super().__init__(self.message)
+
+def snap_width(width: Optional[int]) -> int:
+    """Return the smallest variant width at least as wide as requested."""
+    if not width or width <= 0:
+        width = IMAGE_DEFAULT_WIDTH
+    for candidate in IMAGE_WIDTHS:
+        if candidate >= width:
+            return candidate
+    return IMAGE_WIDTHS[-1]
+
+def proxy_url(src: str, width: int = IMAGE_DEFAULT_WIDTH) -> str:
+    """Return the proxy URL serving an image at a variant width.
+
+    Args:
+        src: Absolute http(s) URL of the original image
+        width: Requested display width in pixels
+
+    Returns:
+        Proxy URL, or src unchanged when proxying is disabled or src is not http(s)
+    """
+    if not IMAGE_PROXY or urlparse(src).scheme not in ("http", "https"):
+        return src
+    return f"{IMAGE_PROXY_BASE_URL}/image?url={quote(src, safe='')}&w={snap_width(width)}"
+
+def image_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+def _is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address)
+    return ip.is_global and not ip.is_multicast
+
+def _resize(data: bytes, width: int) -> Optional[Tuple[bytes, str]]:
+    """Downscale an image to width (runs in a worker thread).
+
+    Returns:
+        Tuple of (encoded bytes, content type), or None to serve the original
+        (already narrow enough, animated, or not a format Pillow handles)
+    """
+    from PIL import Image, features
+
+    with Image.open(BytesIO(data)) as image:
+        if image.format not in RESIZABLE_FORMATS or getattr(image, "is_animated", False):
+            return None
+        if image.width <= width or image.width * image.height > IMAGE_MAX_PIXELS:
+            return None
+        height = max(1, round(image.height * width / image.width))
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB").resize((width, height), Image.LANCZOS)
+
+        out = BytesIO()
+        if features.check("webp"):
+            image.save(out, "WEBP", quality=80, method=4)
+            content_type = "image/webp"
+        elif has_alpha:
+            image.save(out, "PNG", optimize=True)
+            content_type = "image/png"
+        else:
+            image.save(out, "JPEG", quality=82, optimize=True, progressive=True)
+            content_type = "image/jpeg"
+    return out.getvalue(), content_type
+
+class ImageProxy:
+    """Fetches, resizes and caches article images on disk."""
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        """Initialize the proxy.
+
+        Args:
+            cache_dir: Directory for cached variants (defaults to IMAGE_CACHE_DIR)
+            max_bytes: Size above which least recently used variants are evicted
+        """
+        self.cache_dir = cache_dir or IMAGE_CACHE_DIR
+        self.max_bytes = max_bytes
+        Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+        # Bytes on disk as last scanned plus what this worker wrote since
+        self._cache_bytes: Optional[int] = None
+        self._evicting = False
+        # url -> (monotonic time until which it is not refetched, the error)
+        self._failures: "OrderedDict[str, Tuple[float, ImageProxyError]]" = OrderedDict()
+
+    def _path_prefix(self, key: str, width: int) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}-{width}")
+
+    def _find(self, key: str, width: int) -> Optional[Tuple[str, str]]:
+        """Return (path, content type) of a cached variant, if present."""
+        prefix = self._path_prefix(key, width)
+        directory, name = os.path.split(prefix)
+        try:
+            entries = os.listdir(directory)
+        except FileNotFoundError:
+            return None
+        for entry in entries:
+            stem, _, ext = entry.rpartition(".")
+            if stem == name and ext in EXTENSION_CONTENT_TYPES:
+                return os.path.join(directory, entry), EXTENSION_CONTENT_TYPES[ext]
+        return None
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared keep-alive client, creating it on first use."""
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    self._client = httpx.AsyncClient(
+                        timeout=IMAGE_FETCH_TIMEOUT,
+                        headers={"User-Agent": USER_AGENT, "Accept": "image/webp,image/*;q=0.8"},
+                    )
+        return self._client
+
+    async def _check_destination(self, url: str) -> Optional[str]:
+        """Reject URLs that are not http(s) or resolve to private addresses.
+
+        Returns:
+            The checked address to connect to, or None when private
+            destinations are allowed (httpx then resolves the host itself)
+
+        Raises:
+            ImageProxyError: 400 for malformed URLs, 403 for private destinations
+        """
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ImageProxyError("Only absolute http(s) image URLs can be proxied", 400)
+        if IMAGE_PROXY_ALLOW_PRIVATE:
+            return None
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80),
+                type=socket.SOCK_STREAM
+            )
+        except socket.gaierror as e:
+            raise ImageProxyError(f"Cannot resolve {parsed.hostname}: {e}", 502)
+        addresses = [info[4][0] for info in infos]
+        if not addresses or not all(_is_public_address(address) for address in addresses):
+            raise ImageProxyError("Image host resolves to a private address", 403)
+        return addresses[0]
+
+    async def _fetch(self, url: str) -> Tuple[bytes, str]:
+        """Download an original image, enforcing type and size limits.
+
+        Redirects are followed here rather than by httpx so every hop's
+        destination is checked. Each request connects to the address that
+        was checked (with the original Host header and TLS server name), so
+        a host re-resolving to a private address in between is not reached.
+
+        Raises:
+            ImageProxyError: If the origin fails or the response is not an acceptable image
+        """
+        client = await self._get_client()
+        try:
+            for _ in range(IMAGE_MAX_REDIRECTS + 1):
+                address = await self._check_destination(url)
+                target, headers, extensions = httpx.URL(url), {}, {}
+                if address is not None:
+                    headers["Host"] = target.netloc.decode("ascii")
+                    extensions["sni_hostname"] = target.host
+                    target = target.copy_with(host=address)
+                async with client.stream("GET", target, headers=headers, extensions=extensions) as response:
+                    if response.is_redirect:
+                        url = urljoin(url, response.headers["location"])
+                        continue
+                    if response.status_code >= 400:
+                        raise ImageProxyError(f"Origin returned HTTP {response.status_code}", 502)
+                    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                    if content_type not in CONTENT_TYPE_EXTENSIONS:
+                        raise ImageProxyError(f"Unsupported content type '{content_type or 'none'}'", 415)
+                    declared = response.headers.get("content-length")
+                    if declared and declared.isdigit() and int(declared) > IMAGE_MAX_SOURCE_BYTES:
+                        raise ImageProxyError("Image exceeds the size limit", 413)
+                    chunks, size = [], 0
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        if size > IMAGE_MAX_SOURCE_BYTES:
+                            raise ImageProxyError("Image exceeds the size limit", 413)
+                        chunks.append(chunk)
+                    IMAGE_PROXY_BYTES.labels("origin").inc(size)
+                    return b"".join(chunks), content_type
+        except httpx.TimeoutException:
+            raise ImageProxyError("Timed out fetching image", 504)
+        except httpx.HTTPError as e:
+            raise ImageProxyError(f"Error fetching image: {type(e).__name__}", 502)
+        raise ImageProxyError("Too many redirects", 502)
+
+    def _store(self, key: str, width: int, data: bytes, content_type: str) -> str:
+        path = f"{self._path_prefix(key, width)}.{CONTENT_TYPE_EXTENSIONS[content_type]}"
+        Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
+        atomic_write(path, data)
+        if self._cache_bytes is not None:
+            self._cache_bytes += len(data)
+        return path
+
+    def _link(self, original_path: str, key: str, width: int) -> str:
+        path = f"{self._path_prefix(key, width)}.{original_path.rpartition('.')[2]}"
+        try:
+            os.link(original_path, path)
+        except FileExistsError:
+            pass
+        except OSError:
+            return original_path
+        return path
+
+    def _record_failure(self, url: str, error: ImageProxyError):
+        # Client errors (bad URL, private host) are cheap to detect again; only back off from origins
+        if error.status < 500 and error.status not in (413, 415):
+            return
+        self._failures[url] = (time.monotonic() + IMAGE_NEGATIVE_TTL, error)
+        self._failures.move_to_end(url)
+        while len(self._failures) > IMAGE_NEGATIVE_CACHE_SIZE:
+            self._failures.popitem(last=False)
+
+    def _recent_failure(self, url: str) -> Optional[ImageProxyError]:
+        entry = self._failures.get(url)
+        if entry is None:
+            return None
+        until, error = entry
+        if until <= time.monotonic():
+            del self._failures[url]
+            return None
+        return error
+
+    async def get(self, url: str, width: Optional[int] = None) -> Tuple[str, str]:
+        """Return a cached variant of an image, fetching and resizing it on a miss.
+
+        Args:
+            url: Absolute URL of the original image
+            width: Requested width in pixels (snapped to a variant width)
+
+        Returns:
+            Tuple of (file path, content type)
+
+        Raises:
+            ImageProxyError: If the image cannot be fetched or is not acceptable
+        """
+        width = snap_width(width)
+        key = image_key(url)
+        cached = self._find(key, width)
+        if cached:
+            IMAGE_PROXY_REQUESTS.labels("hit").inc()
+            self._touch(cached[0])
+            return cached
+
+        error = self._recent_failure(url)
+        if error is not None:
+            IMAGE_PROXY_REQUESTS.labels("negative").inc()
+            raise error
+
+        async with lease(f"image-{key}") as waited:
+            # Another request or worker may have produced this variant meanwhile
+            if waited:
+                cached = self._find(key, width)
+                if cached:
+                    IMAGE_PROXY_REQUESTS.labels("hit").inc()
+                    return cached
+            IMAGE_PROXY_REQUESTS.labels("miss").inc()
+
+            # Other widths of the same image reuse the stored original
+            original = self._find(key, 0)
+            if original:
+                with open(original[0], "rb") as f:
+                    data, content_type = f.read(), original[1]
+            else:
+                try:
+                    data, content_type = await self._fetch(url)
+                except ImageProxyError as e:
+                    IMAGE_PROXY_REQUESTS.labels("error").inc()
+                    self._record_failure(url, e)
+                    raise
+                original = (self._store(key, 0, data, content_type), content_type)
+
+            try:
+                resized = await asyncio.to_thread(_resize, data, width)
+            except Exception as e:
+                logger.warning(f"Could not resize {url}: {e}")
+                resized = None
+            if resized is None:
+                # The original is served as this variant; link it so later hits skip the resize
+                result = (self._link(original[0], key, width), original[1])
+            else:
+                result = (self._store(key, width, *resized), resized[1])
+
+        await self._maybe_evict()
+        return result
+
+    def _touch(self, path: str):
+        # Access times are often disabled; mtime orders the LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _scan(self) -> list:
+        files = []
+        for directory, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _evict(self) -> int:
+        """Delete least recently used files until the cache is under its limit.
+
+        Returns:
+            Bytes left in the cache
+        """
+        files = self._scan()
+        total = sum(size for _, size, _ in files)
+        if total > self.max_bytes:
+            target = self.max_bytes * EVICT_TO_FRACTION
+            files.sort()
+            removed = 0
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            logger.info(f"Evicted {removed} cached image(s); {total / 1024 / 1024:.1f} MiB left")
+        return total
+
+    async def _maybe_evict(self):
+        if self._evicting:
+            return
+        if self._cache_bytes is not None and self._cache_bytes <= self.max_bytes:
+            return
+        self._evicting = True
+        try:
+            self._cache_bytes = await asyncio.to_thread(self._evict)
+            IMAGE_CACHE_BYTES.set(self._cache_bytes)
+        finally:
+            self._evicting = False
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# Create global image proxy instance
+image_proxy = ImageProxy()
+
+def response_headers(path: str) -> dict:
+    """Caching and security headers for a served variant."""
+    stat = os.stat(path)
+    return {
+        "Cache-Control": f"public, max-age={IMAGE_CACHE_MAX_AGE}, immutable",
+        "ETag": f'"{os.path.basename(path).rpartition(".")[0]}-{stat.st_size:x}"',
+        **RESPONSE_SECURITY_HEADERS,
+    }
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag.
+
+    The header is a comma-separated list of entity tags or "*"; tags are
+    compared weakly, so W/"x" matches "x".
+    """
+    def opaque(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+
+    wanted = opaque(etag)
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or (candidate and opaque(candidate) == wanted):
+            return True
+    return False
@@ -3,17 +3,55 @@
 This module sets up the FastAPI application with:
 - CORS middleware for frontend communication
 - Static file serving for screenshots
+- Asynchronous screenshot jobs with polling and event streams
+- A caching proxy for article images
 - API endpoints for article analysis and debugging
+- Startup warm-up and a /ready readiness probe
+- Per-client stream quotas and fair queuing of pipeline work
+- Degraded service modes and load shedding under overload
+- Admin endpoints for profiling, revalidation and admission state
 """
 
-from fastapi import FastAPI
+from startup import mark_imported, start_warm_up, stop_warm_up, readiness
+from fastapi import FastAPI, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from utils.scraper import scrape_hn_frontpage, scrape_full_article, scrape_hn_comments, close_browser
-from stream import stream_articles
-from fastapi.responses import StreamingResponse
-from screenshot import screenshot_manager
+from utils.scraper import scrape_hn_frontpage, scrape_full_article, scrape_hn_comments, scrape_hn_comment_subtree, close_browser, close_source
+from stream import stream_articles, analyze_batch, BATCH_CONCURRENCY, BATCH_MAX_IDS
+from fastapi.responses import StreamingResponse, Response, JSONResponse, FileResponse
+from screenshot import screenshot_manager, SCREENSHOT_DIR, SCREENSHOT_MAX_SECONDS
+from screenshot_jobs import screenshot_jobs, QueueFull, TERMINAL_STATUSES
+from image_proxy import image_proxy, ImageProxyError, etag_matches, response_headers
+from revalidation import revalidator
+from search_index import search_index, SEARCH_INDEX, SEARCH_MAX_RESULTS
+from admission import admission, admitted_stream, client_key, QuotaExceeded
+from overload import overload, SHED, OVERLOAD_COOLDOWN
+from starlette.background import BackgroundTask
+from metrics import registry, PROMETHEUS_CONTENT_TYPE, IMAGE_PROXY_REQUESTS, IMAGE_PROXY_BYTES, REQUESTS_SHED
+from profiler import start_profile, finish_profile, get_profile, ProfilerBusy, PROFILE_MAX_SECONDS
+import asyncio
+import json
 import os
+from typing import List, Optional
+from pydantic import BaseModel
+
+# Token required by admin/profiling endpoints; they are disabled when unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Comment sent on idle event streams so proxies keep them open
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+# Longest a screenshot submission may wait for its job to finish
+SCREENSHOT_MAX_WAIT_SECONDS = SCREENSHOT_MAX_SECONDS
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+    "Access-Control-Allow-Origin": "*"  # Add CORS header for SSE
+}
+
+mark_imported()
 
 app = FastAPI(
     title="Hacker News Article Analysis",
@@ -32,14 +70,38 @@ app.add_middleware(
 )
 
 # Mount static files directory for screenshots
-screenshots_dir = os.path.join(os.path.dirname(__file__), "static/screenshots")
-os.makedirs(screenshots_dir, exist_ok=True)
-app.mount("/static/screenshots", StaticFiles(directory=screenshots_dir), name="screenshots")
+os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+app.mount("/static/screenshots", StaticFiles(directory=SCREENSHOT_DIR), name="screenshots")
+
+@app.on_event("startup")
+async def startup_event():
+    """Start warming browsers and clients (/ready reports when done) and the overload monitor."""
+    start_warm_up()
+    overload.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Clean up browser resources on application shutdown."""
+    """Clean up browser and HTTP client resources on application shutdown."""
+    await stop_warm_up()
+    await overload.close()
     await close_browser()
+    await screenshot_jobs.close()
+    await screenshot_manager.close()
+    await image_proxy.close()
+    await revalidator.close()
+    await search_index.close()
+    await close_source()
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once warm-up has finished and configuration is valid, 503 before."""
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Expose pipeline, cache, browser and LLM metrics in Prometheus text format."""
+    return Response(content=registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
 
 @app.get("/debug/frontpage")
 async def test_frontpage():
@@ -56,51 +118,391 @@ async def test_article(url: str):
     return {"html": await scrape_full_article(url)}
 
 @app.get("/debug/comments")
-async def test_comments(id: int, offset: int = 0):
+async def test_comments(id: int, offset: int = 0, limit: int = 10):
     """Debug endpoint to test comment scraping.
     
     Args:
         id: Hacker News story ID
         offset: Number of comments to skip
+        limit: Maximum number of comments to return
+    """
+    return await scrape_hn_comments(id, offset=offset, limit=limit)
+
+@app.get("/debug/comments/subtree")
+async def test_comment_subtree(id: int, index: int, limit: Optional[int] = None):
+    """Debug endpoint returning a comment and all of its replies.
+    
+    Args:
+        id: Hacker News story ID
+        index: Thread index of the root comment
+        limit: Maximum number of comments to return
+    """
+    try:
+        return await scrape_hn_comment_subtree(id, index, limit=limit)
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+def shed_load(endpoint: str):
+    """Refuse work while the overload controller is shedding load.
+    
+    Raises:
+        HTTPException: 503 with Retry-After in shed mode
+    """
+    if overload.level >= SHED:
+        REQUESTS_SHED.labels(endpoint).inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Server overloaded, retry later",
+            headers={"Retry-After": str(int(OVERLOAD_COOLDOWN))}
+        )
+
+def require_admin(token: Optional[str]):
+    """Reject requests without the configured admin token.
+    
+    Raises:
+        HTTPException: 403 if admin access is disabled or the token is wrong
+    """
+    if not ADMIN_TOKEN or token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin access denied")
+
+async def profiled_stream(stream):
+    """Run a stream under the sampling profiler and append a `profile` event.
+    
+    The profile covers the whole process while the stream is open: the
+    sampler captures every thread's stack, so work for other concurrent
+    requests (which share the event loop thread) is included. Profile an
+    otherwise idle server to see one request on its own. The event's
+    `scope` is "process" to make this explicit.
+    
+    Args:
+        stream: Server-sent events generator to profile
     """
-    comments = await scrape_hn_comments(id, offset=offset)
-    return {"comments": comments, "has_more": len(comments) > 0}
+    try:
+        profiler = start_profile()
+    except ProfilerBusy as e:
+        yield f"event: log\ndata: Profiling skipped: {e}\n\n"
+        async for event in stream:
+            yield event
+        return
+
+    profile_id = None
+    try:
+        async for event in stream:
+            yield event
+    finally:
+        profile_id = finish_profile(profiler)
+    yield f"event: profile\ndata: {json.dumps({'profile_id': profile_id, 'url': f'/admin/profile/{profile_id}', 'scope': 'process', 'samples': profiler.sample_count, 'duration_s': round(profiler.duration, 3)})}\n\n"
 
 @app.get("/analyze")
-async def analyze(offset: int = 0, limit: int = 10):
+async def analyze(
+    request: Request,
+    offset: int = 0,
+    limit: int = 10,
+    trace: bool = False,
+    x_profile: Optional[str] = Header(None),
+    x_admin_token: Optional[str] = Header(None),
+    x_client_token: Optional[str] = Header(None),
+    x_forwarded_for: Optional[str] = Header(None)
+):
     """Stream articles with AI analysis results.
     
+    Work is accounted to the client (a known X-Client-Token, else its address):
+    each client may have CLIENT_MAX_STREAMS streams open, and pipeline
+    stages are queued fairly across clients. While shedding load the
+    request is refused with 503; the `complete` event reports the
+    service mode.
+    
     Args:
+        request: Incoming request, for the client address
         offset: Number of stories to skip
         limit: Maximum number of stories to process
+        trace: Emit a per-story `trace` event with the stage timeline
+        x_profile: Set to "1" (with a valid X-Admin-Token) to profile the
+            process while this request runs (all concurrent requests are
+            included); a final `profile` event links to the folded stacks
+        x_admin_token: Admin token for profiling
+        x_client_token: Identifies the client for quotas and fair queuing (if listed in CLIENT_TOKENS)
+        x_forwarded_for: Client address behind a trusted proxy
         
     Returns:
         Server-sent events stream with article data and analysis
     """
+    shed_load("analyze")
+    client = client_key(request.client.host if request.client else None, x_client_token, x_forwarded_for)
+    stream = stream_articles(offset, limit, trace=trace, client=client)
+    if x_profile == "1":
+        require_admin(x_admin_token)
+        stream = profiled_stream(stream)
+    try:
+        ticket = admission.open_stream(client)
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
     return StreamingResponse(
-        stream_articles(offset, limit),
+        admitted_stream(ticket, stream),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-            "Access-Control-Allow-Origin": "*"  # Add CORS header for SSE
-        }
+        headers=SSE_HEADERS,
+        background=BackgroundTask(ticket.close)
     )
 
+class BatchRequest(BaseModel):
+    """Body of POST /analyze/batch."""
+
+    ids: List[int]
+    concurrency: Optional[int] = None
+
+@app.post("/analyze/batch")
+async def analyze_many(
+    body: BatchRequest,
+    request: Request,
+    x_client_token: Optional[str] = Header(None),
+    x_forwarded_for: Optional[str] = Header(None)
+):
+    """Return processed stories for many HN IDs as newline-delimited JSON.
+    
+    Cached stories are read in one pass and sent first; the others run
+    through the pipeline (at most BATCH_CONCURRENCY at a time) and are
+    sent as they finish. Every line has `hn_id` and `status` (cached,
+    processed, pending, not_found, error) and, when there is one, the
+    `story`; a final `complete` line has counts per status. The request
+    counts against the client's stream quota like /analyze.
+    
+    Args:
+        body: Story IDs (at most BATCH_MAX_IDS) and optional concurrency
+        request: Incoming request, for the client address
+        x_client_token: Identifies the client for quotas and fair queuing (if listed in CLIENT_TOKENS)
+        x_forwarded_for: Client address behind a trusted proxy
+        
+    Returns:
+        NDJSON stream of per-story results in completion order
+    """
+    if not 1 <= len(body.ids) <= BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {BATCH_MAX_IDS} story IDs")
+    concurrency = min(body.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+    if concurrency < 1:
+        raise HTTPException(status_code=400, detail="concurrency must be at least 1")
+    shed_load("analyze_batch")
+    client = client_key(request.client.host if request.client else None, x_client_token, x_forwarded_for)
+    try:
+        ticket = admission.open_stream(client)
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return StreamingResponse(
+        admitted_stream(ticket, analyze_batch(body.ids, concurrency, client=client)),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(ticket.close)
+    )
+
+def job_response(job: dict) -> dict:
+    """Add polling and event URLs to a screenshot job."""
+    job_id = job["job_id"]
+    return {**job, "status_url": f"/screenshot/jobs/{job_id}", "events_url": f"/screenshot/jobs/{job_id}/events"}
+
+@app.get("/screenshot/jobs/{job_id}")
+async def screenshot_job_status(job_id: str):
+    """Poll a screenshot job.
+    
+    Args:
+        job_id: Id returned when the job was submitted
+        
+    Returns:
+        Job dictionary with status queued, running, done or failed
+    """
+    job = screenshot_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Screenshot job not found")
+    return job_response(job)
+
+@app.get("/screenshot/jobs/{job_id}/events")
+async def screenshot_job_events(job_id: str):
+    """Stream a screenshot job's progress as server-sent events.
+    
+    A `status` event is sent now and on every change, followed by a final
+    `complete` event once the job is done or failed.
+    
+    Args:
+        job_id: Id returned when the job was submitted
+    """
+    state = screenshot_jobs.get(job_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Screenshot job not found")
+    job = screenshot_jobs.find(job_id)
+
+    async def events():
+        if job is None:
+            # Finished by another worker; only the screenshot file is known
+            yield f"event: complete\ndata: {json.dumps(job_response(state))}\n\n"
+            return
+        last = None
+        async for update in job.changes(keepalive=SSE_KEEPALIVE_SECONDS):
+            if update is None:
+                yield ": keepalive\n\n"
+                continue
+            last = update
+            yield f"event: status\ndata: {json.dumps(job_response(update))}\n\n"
+        yield f"event: complete\ndata: {json.dumps(job_response(last))}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.get("/screenshot/{article_id}")
-async def take_screenshot(article_id: str, url: str):
-    """Take a screenshot of an article.
+async def take_screenshot(article_id: str, url: str, priority: str = "interactive", wait: float = 0):
+    """Submit a screenshot job for an article.
+    
+    Returns at once (or after at most `wait` seconds) with the job; pending
+    jobs for the same article are merged. Poll `status_url` or subscribe
+    to `events_url` for completion.
     
     Args:
         article_id: Unique identifier for the article
         url: URL of the article to screenshot
+        priority: "interactive" or "prefetch"
+        wait: Seconds to wait for the job to finish before responding
+        
+    Returns:
+        Job dictionary; 200 once the job has finished, 202 while it is pending
+    """
+    shed_load("screenshot")
+    try:
+        job = screenshot_jobs.submit(url, article_id, priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    if wait > 0:
+        await job.wait(min(wait, SCREENSHOT_MAX_WAIT_SECONDS))
+    finished = job.status in TERMINAL_STATUSES
+    return JSONResponse(job_response(job.to_dict()), status_code=200 if finished else 202)
+
+@app.get("/search")
+async def search(q: str, offset: int = 0, limit: int = 10):
+    """Search processed stories by title, hook, analysis, article text and comments.
+    
+    Args:
+        q: Search terms; stories matching any term are ranked by relevance
+        offset: Number of results to skip
+        limit: Results per page (at most SEARCH_MAX_RESULTS)
+        
+    Returns:
+        Dictionary with the total number of matches, the time taken and one
+        page of results (hn_id, title, score, hook, time, points)
+    """
+    if not SEARCH_INDEX:
+        raise HTTPException(status_code=404, detail="Search is disabled")
+    if offset < 0 or not 1 <= limit <= SEARCH_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"offset must be >= 0 and limit between 1 and {SEARCH_MAX_RESULTS}")
+    return await search_index.search(q, offset, limit)
+
+@app.get("/image")
+async def proxy_image(url: str, w: Optional[int] = None, if_none_match: Optional[str] = Header(None)):
+    """Serve an article image from the image cache, fetching it once on a miss.
+    
+    Args:
+        url: Absolute URL of the original image
+        w: Display width in pixels (snapped to a cached variant width)
+        if_none_match: ETag from a previous response, answered with 304
+        
+    Returns:
+        The image variant with long-lived caching headers
+    """
+    try:
+        path, content_type = await image_proxy.get(url, w)
+    except ImageProxyError as e:
+        raise HTTPException(status_code=e.status, detail=e.message)
+    headers = response_headers(path)
+    if if_none_match and etag_matches(if_none_match, headers["ETag"]):
+        IMAGE_PROXY_REQUESTS.labels("not_modified").inc()
+        return Response(status_code=304, headers=headers)
+    IMAGE_PROXY_BYTES.labels("served").inc(os.path.getsize(path))
+    return FileResponse(path, media_type=content_type, headers=headers)
+
+@app.post("/admin/profile")
+async def profile_process(seconds: float = 10, x_admin_token: Optional[str] = Header(None)):
+    """Sample the whole process for a while and return folded stacks.
+    
+    The output can be fed to flamegraph.pl, inferno or speedscope.
+    
+    Args:
+        seconds: Sampling duration (capped at PROFILE_MAX_SECONDS)
+        x_admin_token: Admin token
+    """
+    require_admin(x_admin_token)
+    try:
+        profiler = start_profile()
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await asyncio.sleep(max(0.0, min(seconds, PROFILE_MAX_SECONDS)))
+    finally:
+        profile_id = finish_profile(profiler)
+    return Response(
+        content=get_profile(profile_id),
+        media_type="text/plain",
+        headers={"X-Profile-Id": profile_id}
+    )
+
+@app.post("/admin/revalidate/{hn_id}")
+async def revalidate_story(hn_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Check a cached story's article for changes now, reprocessing it if it changed.
+    
+    Args:
+        hn_id: Hacker News story ID
+        x_admin_token: Admin token
         
     Returns:
-        Dictionary containing screenshot path or error message
+        Dictionary with the revalidation result
+    """
+    require_admin(x_admin_token)
+    result = await revalidator.revalidate(hn_id, force=True)
+    if result["result"] == "missing":
+        raise HTTPException(status_code=404, detail="Story not cached")
+    return result
+
+@app.get("/admin/admission")
+async def admission_state(x_admin_token: Optional[str] = Header(None)):
+    """Show open streams per client and the fair-queue state of each stage pool.
+    
+    Args:
+        x_admin_token: Admin token
+    """
+    require_admin(x_admin_token)
+    return admission.to_dict()
+
+@app.get("/admin/overload")
+async def overload_state(x_admin_token: Optional[str] = Header(None)):
+    """Show the service mode and the signals behind it.
+    
+    Args:
+        x_admin_token: Admin token
+    """
+    require_admin(x_admin_token)
+    return overload.to_dict()
+
+@app.post("/admin/overload")
+async def pin_overload_mode(mode: str, x_admin_token: Optional[str] = Header(None)):
+    """Hold a service mode regardless of load, or resume automatic control.
+    
+    Args:
+        mode: One of normal, no_screenshots, hook_only, cache_only, shed,
+            or "auto"
+        x_admin_token: Admin token
+    """
+    require_admin(x_admin_token)
+    try:
+        overload.pin(None if mode == "auto" else mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return overload.to_dict()
+
+@app.get("/admin/profile/{profile_id}")
+async def fetch_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Return a stored profile in folded stack format.
+    
+    Args:
+        profile_id: Id from a `profile` event or X-Profile-Id header
+        x_admin_token: Admin token
     """
-    screenshot_path, error = await screenshot_manager.take_screenshot(url, article_id)
-    if screenshot_path:
-        return {"screenshot_path": screenshot_path}
-    else:
-        return {"error": error or "Failed to take screenshot"}
+    require_admin(x_admin_token)
+    folded = get_profile(profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(content=folded, media_type="text/plain")
@@ -0,0 +1,350 @@
+"""In-process metrics registry with Prometheus text exposition.
+
+This module provides:
+- Counter, Gauge and Histogram metric types with optional labels
+- A registry rendering all metrics in Prometheus text format
+- A `track_stage` context manager timing pipeline stages
+
+Updating a metric is a dictionary lookup plus an add under a lock, so the
+instrumentation can sit on the hot path without measurable overhead.
+"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from tracing import current_trace
+
+# Latency buckets (seconds) covering fast cache hits up to slow page renders
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric(ABC):
+    """Base class holding one child per label-value combination."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+
+    @abstractmethod
+    def _new_child(self):
+        """Create the child that records values for one label combination."""
+
+    def labels(self, *values):
+        """Return the child metric for the given label values."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for key, child in list(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"]
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = float(value)
+
+    def get(self) -> float:
+        return self.value
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type_name = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed buckets."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _render_child(self, key, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render all metrics in Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry
+registry = Registry()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Pipeline metrics
+STAGE_DURATION = registry.histogram(
+    "hn_stage_duration_seconds", "Duration of story pipeline stages", ["stage"])
+STAGE_FAILURES = registry.counter(
+    "hn_stage_failures_total", "Pipeline stage calls that failed or returned an error", ["stage"])
+CACHE_REQUESTS = registry.counter(
+    "hn_cache_requests_total", "Story cache lookups by result (hit, miss, invalid, degraded)", ["result"])
+STORIES_STREAMED = registry.counter(
+    "hn_stories_streamed_total", "Stories sent to clients by source (cache, pipeline, placeholder)", ["source"])
+ACTIVE_STREAMS = registry.gauge(
+    "hn_active_streams", "Open /analyze event streams and /analyze/batch responses")
+BATCH_ITEMS = registry.counter(
+    "hn_batch_items_total", "Stories returned by /analyze/batch by status (cached, processed, pending, not_found, error)", ["status"])
+
+# Admission control
+ADMISSION_WAIT = registry.histogram(
+    "hn_admission_wait_seconds", "Time stage work waited for a fair-queue slot", ["pool"])
+ADMISSION_QUEUED = registry.gauge(
+    "hn_admission_queued", "Stage work waiting for a fair-queue slot", ["pool"])
+ADMISSION_REJECTIONS = registry.counter(
+    "hn_admission_rejections_total", "Work refused by admission control by reason (streams, deadline)", ["reason"])
+
+# Overload control
+OVERLOAD_LEVEL = registry.gauge(
+    "hn_overload_level",
+    "Current service mode (0 normal, 1 no_screenshots, 2 hook_only, 3 cache_only, 4 shed)")
+OVERLOAD_SIGNALS = registry.gauge(
+    "hn_overload_signal", "Last sampled overload signal (saturation, loop_lag_s, llm_headroom)", ["signal"])
+OVERLOAD_TRANSITIONS = registry.counter(
+    "hn_overload_transitions_total", "Service mode changes by the mode entered", ["mode"])
+DEGRADED_STORIES = registry.counter(
+    "hn_degraded_stories_total", "Stories processed degraded or sent as placeholders, by mode", ["mode"])
+REQUESTS_SHED = registry.counter(
+    "hn_requests_shed_total", "Requests refused with 503 while shedding load", ["endpoint"])
+
+# Browser pool metrics
+BROWSERS_RUNNING = registry.gauge(
+    "hn_browsers_running", "Running Chromium instances", ["pool"])
+BROWSER_PAGES_OPEN = registry.gauge(
+    "hn_browser_pages_open", "Open browser pages", ["pool"])
+BROWSER_RECYCLES = registry.counter(
+    "hn_browser_recycles_total", "Browsers replaced by reason (pages, memory, crash)", ["pool", "reason"])
+BROWSER_RSS_BYTES = registry.gauge(
+    "hn_browser_rss_bytes", "Resident memory of the current browser's processes at the last sample", ["pool"])
+
+# Request blocking in browser pages
+REQUESTS_BLOCKED = registry.counter(
+    "hn_browser_requests_blocked_total", "Page subresource requests blocked by profile, resource type and rule (type, domain)",
+    ["profile", "resource_type", "rule"])
+REQUESTS_ALLOWED = registry.counter(
+    "hn_browser_requests_allowed_total", "Page requests let through by the routing profile", ["profile"])
+REQUEST_BYTES_BLOCKED = registry.counter(
+    "hn_browser_request_bytes_blocked_total",
+    "Estimated bytes not downloaded because of blocked requests (mean Content-Length by resource type)", ["profile"])
+
+# Screenshot job queue
+SCREENSHOT_JOBS = registry.counter(
+    "hn_screenshot_jobs_total",
+    "Screenshot job events (submitted, merged, existing, rejected, completed, failed)", ["event"])
+SCREENSHOT_QUEUE_DEPTH = registry.gauge(
+    "hn_screenshot_queue_depth", "Screenshot jobs waiting for a worker")
+
+# Search index
+SEARCH_DURATION = registry.histogram(
+    "hn_search_duration_seconds", "Time to answer /search queries",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+SEARCH_INDEX_DOCS = registry.gauge(
+    "hn_search_index_documents", "Stories in this worker's copy of the search index")
+SEARCH_INDEX_UPDATES = registry.counter(
+    "hn_search_index_updates_total", "Search index events (added, loaded, compacted, error)", ["event"])
+
+# Article HTML size before and after sanitizing
+ARTICLE_HTML_BYTES = registry.counter(
+    "hn_article_html_bytes_total", "Extracted article HTML bytes by stage (original, sanitized)", ["stage"])
+
+# Image proxy metrics
+IMAGE_PROXY_REQUESTS = registry.counter(
+    "hn_image_proxy_requests_total", "Image proxy lookups by result (hit, miss, negative, error, not_modified)", ["result"])
+IMAGE_PROXY_BYTES = registry.counter(
+    "hn_image_proxy_bytes_total", "Image bytes fetched from origins and served to clients", ["stage"])
+IMAGE_CACHE_BYTES = registry.gauge(
+    "hn_image_cache_bytes", "Size of the on-disk image cache at the last scan")
+
+# Cached article revalidation
+REVALIDATIONS = registry.counter(
+    "hn_revalidations_total",
+    "Cached article revalidations by result (not_modified, unchanged, changed, baseline, skipped, error)",
+    ["result"])
+
+# Per-host scheduling metrics
+HOST_FAILURES = registry.counter(
+    "hn_host_failures_total", "Article/screenshot fetch failures added to the negative cache by kind", ["kind"])
+HOST_SKIPS = registry.counter(
+    "hn_host_skips_total", "Fetches short-circuited by the negative cache by kind", ["kind"])
+
+# LLM metrics
+LLM_REQUESTS = registry.counter(
+    "hn_llm_requests_total", "Gemini calls by call type and outcome", ["call", "outcome"])
+LLM_TOKENS = registry.counter(
+    "hn_llm_tokens_total", "Gemini tokens by direction (prompt, completion)", ["kind"])
+
+# Startup metrics
+STARTUP_SECONDS = registry.gauge(
+    "hn_startup_seconds", "Startup phase durations (import, warm_up, time_to_ready)", ["phase"])
+WARM_UP_OK = registry.gauge(
+    "hn_warm_up_ok", "Whether a component warmed up successfully (1) or failed (0)", ["component"])
+
+class track_stage:
+    """Context manager timing a pipeline stage.
+
+    Exceptions escaping the block count as failures; stages that report
+    errors through return values can call `fail()` explicitly. The span is
+    also added to the current story trace, if there is one.
+
+    Example:
+        with track_stage("scrape_full_article") as stage:
+            result = await scrape_full_article(url)
+            if "error" in result:
+                stage.fail()
+    """
+
+    __slots__ = ("stage", "start", "failed")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.failed = False
+
+    def fail(self):
+        self.failed = True
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        failed = exc_type is not None or self.failed
+        STAGE_DURATION.labels(self.stage).observe(end - self.start)
+        if failed:
+            STAGE_FAILURES.labels(self.stage).inc()
+        trace = current_trace()
+        if trace is not None:
+            trace.add_span(self.stage, self.start, end, failed)
+        return False
@@ -0,0 +1,213 @@
+"""Overload detection and degraded service modes.
+
+This module provides:
+- A controller sampling stage-pool saturation (from the admission queues),
+  Gemini rate-limit headroom and event-loop lag
+- A ladder of service modes the pipeline steps down as load rises:
+  normal, no_screenshots, hook_only, cache_only (uncached stories get a
+  pending placeholder) and shed (/analyze answers 503 with Retry-After)
+
+The mode rises as soon as any signal calls for it and falls one step at a
+time once the signals have stayed lower for OVERLOAD_COOLDOWN seconds, so
+a brief lull does not bring the full load straight back.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from admission import admission
+from metrics import OVERLOAD_LEVEL, OVERLOAD_SIGNALS, OVERLOAD_TRANSITIONS
+from utils.gemini import llm_headroom
+
+logger = logging.getLogger(__name__)
+
+MODES = ("normal", "no_screenshots", "hook_only", "cache_only", "shed")
+NORMAL, NO_SCREENSHOTS, HOOK_ONLY, CACHE_ONLY, SHED = range(len(MODES))
+
+DEFAULT_SATURATION_STEPS = (1.5, 3.0, 5.0, 8.0)
+DEFAULT_LAG_STEPS = (0.1, 0.25, 0.5, 1.0)
+
+def parse_steps(spec: str, default: Tuple[float, ...]) -> Tuple[float, ...]:
+    """Parse the ascending thresholds for entering each mode above normal."""
+    try:
+        steps = tuple(float(step) for step in spec.split(","))
+    except ValueError:
+        steps = ()
+    if len(steps) != len(MODES) - 1 or list(steps) != sorted(steps):
+        logger.warning(f"Ignoring invalid overload thresholds '{spec}'")
+        return default
+    return steps
+
+# Set to 0 to always serve in normal mode
+OVERLOAD_CONTROL = os.getenv("OVERLOAD_CONTROL", "1") == "1"
+
+# Seconds between samples
+OVERLOAD_INTERVAL = float(os.getenv("OVERLOAD_INTERVAL", "0.5"))
+
+# Pool load ((in use + waiting) / capacity) entering each mode above normal
+OVERLOAD_SATURATION_STEPS = parse_steps(os.getenv("OVERLOAD_SATURATION_STEPS", "1.5,3,5,8"), DEFAULT_SATURATION_STEPS)
+
+# Smoothed event-loop lag in seconds entering each mode above normal
+OVERLOAD_LAG_STEPS = parse_steps(os.getenv("OVERLOAD_LAG_STEPS", "0.1,0.25,0.5,1"), DEFAULT_LAG_STEPS)
+
+# Below this share of the Gemini quota (or after a rate limit) only hooks are generated
+OVERLOAD_LLM_LOW_HEADROOM = float(os.getenv("OVERLOAD_LLM_LOW_HEADROOM", "0.2"))
+
+# Only the cache is served once the quota has stayed exhausted this long (repeated rate limits)
+OVERLOAD_LLM_EXHAUSTED_FOR = float(os.getenv("OVERLOAD_LLM_EXHAUSTED_FOR", "60"))
+
+# Signals must stay lower this long before the mode steps down one level
+OVERLOAD_COOLDOWN = float(os.getenv("OVERLOAD_COOLDOWN", "15"))
+
+# Weight of the newest event-loop lag sample
+LAG_SMOOTHING = 0.3
+
+# Highest mode a pool's saturation can call for: skipping screenshots relieves the screenshot pool
+POOL_MAX_LEVEL = {"screenshot": NO_SCREENSHOTS}
+
+def level_for(value: float, steps: Tuple[float, ...]) -> int:
+    """Return the mode level a signal value reaches on its thresholds."""
+    return sum(1 for step in steps if value >= step)
+
+class OverloadController:
+    """Tracks load signals and the current service mode."""
+
+    def __init__(self, enabled: bool = OVERLOAD_CONTROL, interval: float = OVERLOAD_INTERVAL, cooldown: float = OVERLOAD_COOLDOWN):
+        """Initialize the controller in normal mode.
+
+        Args:
+            enabled: Whether signals may move the mode
+            interval: Seconds between samples
+            cooldown: Seconds the signals must stay lower before stepping down
+        """
+        self.enabled = enabled
+        self.interval = interval
+        self.cooldown = cooldown
+        self.level = NORMAL
+        self.pinned: Optional[int] = None
+        self.signals: Dict[str, float] = {"saturation": 0.0, "loop_lag_s": 0.0, "llm_headroom": 1.0}
+        self.reasons: Dict[str, int] = {}
+        self._changed_at = time.monotonic()
+        # When the Gemini quota was first seen exhausted in the current stretch
+        self._exhausted_since: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        OVERLOAD_LEVEL.set(NORMAL)
+
+    @property
+    def mode(self) -> str:
+        return MODES[self.level]
+
+    def start(self):
+        """Start sampling in the background."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._monitor(), name="overload-monitor")
+
+    async def _monitor(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - before - self.interval)
+            self.signals["loop_lag_s"] = LAG_SMOOTHING * lag + (1 - LAG_SMOOTHING) * self.signals["loop_lag_s"]
+            try:
+                self.update()
+            except Exception as e:
+                logger.error(f"[OVERLOAD] Update failed: {e}")
+
+    def target_level(self) -> int:
+        """Sample the signals and return the mode level they call for."""
+        saturation, pool_level = 0.0, NORMAL
+        for name, queue in admission.pools.items():
+            load = (queue.in_use + queue.waiting) / queue.capacity
+            saturation = max(saturation, load)
+            pool_level = max(pool_level, min(level_for(load, OVERLOAD_SATURATION_STEPS), POOL_MAX_LEVEL.get(name, SHED)))
+        headroom = llm_headroom()
+        self.signals["saturation"] = saturation
+        self.signals["llm_headroom"] = headroom
+
+        now = time.monotonic()
+        if headroom > 0:
+            self._exhausted_since = None
+        elif self._exhausted_since is None:
+            self._exhausted_since = now
+        if self._exhausted_since is not None and now - self._exhausted_since >= OVERLOAD_LLM_EXHAUSTED_FOR:
+            # Rate limits kept coming even with hooks only
+            llm_level = CACHE_ONLY
+        elif headroom < OVERLOAD_LLM_LOW_HEADROOM:
+            llm_level = HOOK_ONLY
+        else:
+            llm_level = NORMAL
+        self.reasons = {
+            "saturation": pool_level,
+            "loop_lag": level_for(self.signals["loop_lag_s"], OVERLOAD_LAG_STEPS),
+            "llm_headroom": llm_level,
+        }
+        for signal, value in self.signals.items():
+            OVERLOAD_SIGNALS.labels(signal).set(value)
+        return max(self.reasons.values())
+
+    def update(self) -> int:
+        """Move the mode towards what the signals call for.
+
+        Returns:
+            The current mode level
+        """
+        target = self.target_level()
+        if self.pinned is not None:
+            target = self.pinned
+        elif not self.enabled:
+            target = NORMAL
+        now = time.monotonic()
+        if target > self.level:
+            self._set(target, now)
+        elif target == self.level:
+            self._changed_at = now
+        elif self.pinned is not None or now - self._changed_at >= self.cooldown:
+            self._set(target if self.pinned is not None else self.level - 1, now)
+        return self.level
+
+    def _set(self, level: int, now: float):
+        if level != self.level:
+            log = logger.warning if level > self.level else logger.info
+            log(f"[OVERLOAD] Mode {MODES[self.level]} -> {MODES[level]} (signals: {self.reasons})")
+            OVERLOAD_TRANSITIONS.labels(MODES[level]).inc()
+            OVERLOAD_LEVEL.set(level)
+        self.level = level
+        self._changed_at = now
+
+    def pin(self, mode: Optional[str]):
+        """Hold a mode regardless of the signals, or resume automatic control with None.
+
+        Raises:
+            ValueError: If mode is not one of MODES
+        """
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of: {', '.join(MODES)}")
+        self.pinned = MODES.index(mode) if mode is not None else None
+        if self.pinned is None:
+            # Resume from what the signals call for now, without the cooldown
+            self._set(self.target_level() if self.enabled else NORMAL, time.monotonic())
+        else:
+            self.update()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "level": self.level,
+            "pinned": self.pinned is not None,
+            "signals": {name: round(value, 3) for name, value in self.signals.items()},
+            "reasons": {name: MODES[level] for name, level in self.reasons.items()},
+        }
+
+    async def close(self):
+        """Stop sampling."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+# Create global overload controller
+overload = OverloadController()
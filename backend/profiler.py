@@ -0,0 +1,113 @@
+"""On-demand sampling profiler.
+
+This module provides a low-overhead wall-clock sampler that periodically
+captures the Python stacks of every thread and aggregates them in the
+folded ("collapsed") stack format understood by flamegraph.pl, speedscope
+and inferno. Time spent blocked in the event loop's selector shows up
+under `select`/`poll` frames, which separates I/O waits (Playwright,
+Gemini) from CPU work on the loop.
+
+Profiles are always whole-process: samples are not attributed to a
+request, so a profile taken during one /analyze stream also contains the
+work of every other request in flight.
+
+Only one profile runs at a time; finished profiles are retained in a small
+in-memory store so they can be fetched after a streamed request ends.
+"""
+
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Optional
+
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "120"))
+PROFILES_RETAINED = 20
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+class SamplingProfiler:
+    """Samples all thread stacks on a background thread."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at = 0.0
+        self.duration = 0.0
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        deadline = time.perf_counter() + self.max_seconds
+        while not self._stop.wait(self.interval):
+            if time.perf_counter() > deadline:
+                break
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                stack.reverse()
+                self.samples[";".join(stack)] += 1
+            self.sample_count += 1
+
+    def folded(self) -> str:
+        """Return samples in folded stack format, one `stack count` per line."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+_active_lock = threading.Lock()
+_profiles: "OrderedDict[str, str]" = OrderedDict()
+
+def start_profile() -> SamplingProfiler:
+    """Start the process-wide profiler.
+
+    Raises:
+        ProfilerBusy: If a profile is already running
+    """
+    if not _active_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    profiler = SamplingProfiler()
+    profiler.start()
+    return profiler
+
+def finish_profile(profiler: SamplingProfiler) -> str:
+    """Stop the profiler, store its folded output and return the profile id."""
+    try:
+        profiler.stop()
+    finally:
+        _active_lock.release()
+    profile_id = uuid.uuid4().hex[:12]
+    _profiles[profile_id] = profiler.folded()
+    while len(_profiles) > PROFILES_RETAINED:
+        _profiles.popitem(last=False)
+    return profile_id
+
+def get_profile(profile_id: str) -> Optional[str]:
+    """Return a stored profile in folded format, or None if unknown."""
+    return _profiles.get(profile_id)
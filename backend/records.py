@@ -0,0 +1,251 @@
+"""Typed records for stories, comments, article metadata and analyses.
+
+This module provides:
+- Slotted record classes for the data that travels through the pipeline,
+  the story cache and the SSE stream
+- One-pass validation when decoding cached or incoming data
+- A fast JSON codec: orjson when installed, the stdlib C encoder otherwise
+
+Records encode to exactly the dictionaries the API has always returned,
+so cached files and clients are unaffected.
+"""
+
+import json
+from typing import Any, Dict, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, see requirements.txt
+    orjson = None
+
+class RecordError(ValueError):
+    """Raised when data does not match a record's fields."""
+
+# Marks a field that must be present when decoding
+REQUIRED = object()
+_MISSING = object()
+
+class ListOf:
+    """Field type for a list of records."""
+
+    __slots__ = ("record",)
+
+    def __init__(self, record: type):
+        self.record = record
+
+class Record:
+    """Base for slotted records declared by a FIELDS table.
+
+    Each FIELDS entry is (name, type, default): type is a tuple of accepted
+    Python types, a Record subclass or ListOf(Record subclass); default is
+    REQUIRED, a value, or list/dict for a fresh empty container. A field
+    defaulting to None also accepts null.
+    """
+
+    __slots__ = ()
+    FIELDS: Tuple[Tuple[str, Any, Any], ...] = ()
+    # Leave None-valued fields out of the encoded form
+    OMIT_NONE = False
+
+    def __init__(self, **values):
+        for name, _, default in self.FIELDS:
+            if name in values:
+                value = values.pop(name)
+            elif default is REQUIRED:
+                raise TypeError(f"{type(self).__name__} missing field '{name}'")
+            else:
+                value = default() if default in (list, dict) else default
+            setattr(self, name, value)
+        if values:
+            raise TypeError(f"{type(self).__name__} got unexpected fields: {', '.join(values)}")
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]):
+        """Build a record from decoded JSON, validating every field once.
+
+        Unknown keys are ignored.
+
+        Raises:
+            RecordError: If a required field is missing or has the wrong type
+        """
+        if isinstance(data, cls):
+            return data
+        if not isinstance(data, dict):
+            raise RecordError(f"{cls.__name__} must be an object, got {type(data).__name__}")
+        record = cls.__new__(cls)
+        for name, kind, default in cls.FIELDS:
+            value = data.get(name, _MISSING)
+            if value is _MISSING:
+                if default is REQUIRED:
+                    raise RecordError(f"{cls.__name__}.{name} is missing")
+                value = default() if default in (list, dict) else default
+            elif value is None and default is None:
+                pass
+            elif type(kind) is not tuple or type(value) not in kind:
+                # Exact type matches (the common case) skip the full check
+                value = _convert(cls, name, kind, value)
+            setattr(record, name, value)
+        return record
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the JSON-ready dictionary form."""
+        out = {}
+        for name, kind, _ in self.FIELDS:
+            value = getattr(self, name)
+            if value is None:
+                if self.OMIT_NONE:
+                    continue
+            elif isinstance(kind, ListOf):
+                value = [item.to_dict() for item in value]
+            elif isinstance(value, Record):
+                value = value.to_dict()
+            out[name] = value
+        return out
+
+    def __eq__(self, other):
+        return type(other) is type(self) and all(
+            getattr(self, name) == getattr(other, name) for name, _, _ in self.FIELDS
+        )
+
+    def __repr__(self):
+        shown = ", ".join(f"{name}={getattr(self, name)!r:.40}" for name, _, _ in self.FIELDS[:3])
+        return f"{type(self).__name__}({shown}, ...)"
+
+def _convert(cls: type, name: str, kind: Any, value: Any) -> Any:
+    if isinstance(kind, ListOf):
+        if not isinstance(value, list):
+            raise RecordError(f"{cls.__name__}.{name} must be a list")
+        return [kind.record.from_dict(item) for item in value]
+    if isinstance(kind, type) and issubclass(kind, Record):
+        return kind.from_dict(value)
+    # bool is an int subclass; only accept it where bool is declared
+    if not isinstance(value, kind) or (isinstance(value, bool) and bool not in kind):
+        expected = "/".join("null" if t is type(None) else t.__name__ for t in kind)
+        raise RecordError(f"{cls.__name__}.{name} must be {expected}, got {type(value).__name__}")
+    return value
+
+STR = (str,)
+INT = (int,)
+OPT_STR = (str, type(None))
+OPT_INT = (int, type(None))
+
+class Comment(Record):
+    """A Hacker News comment. Thread position fields are only set by the comment tree."""
+
+    __slots__ = ("author", "text", "depth", "id", "time", "index", "parent")
+    FIELDS = (
+        ("author", STR, REQUIRED),
+        ("text", STR, REQUIRED),
+        ("depth", INT, 0),
+        ("id", OPT_INT, None),
+        ("time", OPT_INT, None),
+        ("index", OPT_INT, None),
+        ("parent", OPT_INT, None),
+    )
+    OMIT_NONE = True
+
+class ArticleMetadata(Record):
+    """Metadata extracted from an article page, or why it could not be fetched."""
+
+    __slots__ = ("title", "description", "og_image", "fetch_error", "skipped")
+    FIELDS = (
+        ("title", OPT_STR, None),
+        ("description", OPT_STR, None),
+        ("og_image", OPT_STR, None),
+        ("fetch_error", OPT_STR, None),
+        ("skipped", (dict, type(None)), None),
+    )
+    OMIT_NONE = True
+
+class Analysis(Record):
+    """LLM analysis text with its metadata (model, token accounting, errors)."""
+
+    __slots__ = ("analysis", "metadata")
+    FIELDS = (
+        ("analysis", STR, ""),
+        ("metadata", (dict,), dict),
+    )
+
+class Validators(Record):
+    """What the article looked like when last checked, for conditional re-fetches.
+
+    content_hash is a hash of the article's normalized text as served over
+    plain HTTP; checked_at is a Unix timestamp.
+    """
+
+    __slots__ = ("etag", "last_modified", "content_hash", "checked_at")
+    FIELDS = (
+        ("etag", OPT_STR, None),
+        ("last_modified", OPT_STR, None),
+        ("content_hash", OPT_STR, None),
+        ("checked_at", OPT_INT, None),
+    )
+    OMIT_NONE = True
+
+class Story(Record):
+    """A fully processed story as cached and streamed to clients."""
+
+    __slots__ = (
+        "hn_id", "title", "url", "article_url", "points", "author", "comments_count", "time",
+        "full_article_html", "article_metadata", "screenshot_path", "screenshot_error",
+        "hook", "top_comments", "analysis", "has_more", "validators", "degraded"
+    )
+    FIELDS = (
+        ("hn_id", STR, REQUIRED),
+        ("title", STR, REQUIRED),
+        ("url", STR, REQUIRED),
+        ("article_url", STR, REQUIRED),
+        ("points", INT, REQUIRED),
+        ("author", STR, REQUIRED),
+        ("comments_count", INT, REQUIRED),
+        ("time", INT, REQUIRED),
+        ("full_article_html", STR, REQUIRED),
+        ("article_metadata", ArticleMetadata, REQUIRED),
+        ("screenshot_path", OPT_STR, REQUIRED),
+        ("screenshot_error", OPT_STR, REQUIRED),
+        ("hook", STR, REQUIRED),
+        ("top_comments", ListOf(Comment), REQUIRED),
+        ("analysis", Analysis, REQUIRED),
+        ("has_more", (bool,), False),
+        ("validators", Validators, None),
+        # Service mode the story was produced in when not "normal"
+        ("degraded", OPT_STR, None),
+    )
+
+if orjson is not None:
+    def dumps(obj: Any) -> bytes:
+        """Encode a record or JSON-ready value to UTF-8 JSON bytes."""
+        return orjson.dumps(obj.to_dict() if isinstance(obj, Record) else obj)
+
+    def loads(data) -> Any:
+        """Decode JSON from bytes or str."""
+        return orjson.loads(data)
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), check_circular=False)
+
+    def dumps(obj: Any) -> bytes:
+        """Encode a record or JSON-ready value to UTF-8 JSON bytes."""
+        return _encoder.encode(obj.to_dict() if isinstance(obj, Record) else obj).encode("utf-8")
+
+    def loads(data) -> Any:
+        """Decode JSON from bytes or str."""
+        return json.loads(data)
+
+def encode_story(story: Story) -> bytes:
+    return dumps(story)
+
+def decode_story(data) -> Story:
+    """Decode and validate a story from JSON.
+
+    Raises:
+        RecordError: If the JSON is malformed or a field is missing or invalid
+    """
+    try:
+        decoded = loads(data)
+    except ValueError as e:
+        raise RecordError(f"Invalid JSON: {e}") from e
+    return Story.from_dict(decoded)
+
+def sse_data(obj: Any) -> str:
+    """Format a record or JSON-ready value as an SSE data event."""
+    return f"data: {dumps(obj).decode('utf-8')}\n\n"
@@ -0,0 +1,303 @@
+"""Change detection for cached articles.
+
+This module provides:
+- Fingerprints of an article's normalized text
+- Conditional re-fetches (If-None-Match / If-Modified-Since) of cached
+  articles over plain HTTP, without a browser
+- Re-running the story pipeline (extraction, screenshot reuse, LLM calls)
+  only when the fingerprint changes
+
+Cached stories older than REVALIDATE_AFTER are revalidated in the
+background when they are served, so clients never wait for it, unless
+the server is running in a degraded mode. The first
+check of a story records a baseline fingerprint: stories are rendered
+with Chromium but checked over plain HTTP, so the two are not compared.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from bs4 import BeautifulSoup
+
+from metrics import REVALIDATIONS
+from overload import overload, NORMAL
+from records import Story, Validators
+from storage import lease, read_story, write_story
+from utils.gemini import HOOK_FALLBACKS
+from utils.host_scheduler import host_scheduler
+from utils.html_sanitizer import DROPPED_TAGS
+from utils.scraper import find_article_element, has_bot_detection
+
+logger = logging.getLogger(__name__)
+
+# Revalidate cached stories last checked longer ago than this (0 disables)
+REVALIDATE_AFTER = float(os.getenv("REVALIDATE_AFTER", "21600"))
+
+# Revalidations running at once per worker, and how many may be queued
+REVALIDATE_CONCURRENCY = int(os.getenv("REVALIDATE_CONCURRENCY", "2"))
+REVALIDATE_MAX_PENDING = int(os.getenv("REVALIDATE_MAX_PENDING", "100"))
+
+REVALIDATE_TIMEOUT = float(os.getenv("REVALIDATE_TIMEOUT", "10"))
+REVALIDATE_MAX_BYTES = 5 * 1024 * 1024
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def normalized_text(html: str) -> str:
+    """Return the article's visible text, whitespace-collapsed and casefolded."""
+    soup = BeautifulSoup(html, "html.parser")
+    article = find_article_element(soup) or soup.body or soup
+    for tag in article.find_all(DROPPED_TAGS):
+        tag.decompose()
+    return _WHITESPACE_RE.sub(" ", article.get_text(" ")).strip().casefold()
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def reprocess_error(story: Optional[Story]) -> Optional[str]:
+    """Why a reprocessed story is worse than the cached one, if it is.
+
+    Returns:
+        The first failure found (article, hook or analysis), or None
+    """
+    if story is None:
+        return "Reprocessing produced no story"
+    if story.article_metadata.fetch_error:
+        return story.article_metadata.fetch_error
+    if story.hook in HOOK_FALLBACKS:
+        return "Hook could not be generated"
+    analysis_error = story.analysis.metadata.get("error")
+    if analysis_error:
+        return f"Analysis failed: {analysis_error}"
+    return None
+
+class Revalidator:
+    """Schedules and runs revalidations of cached stories."""
+
+    def __init__(self, interval: float = REVALIDATE_AFTER, concurrency: int = REVALIDATE_CONCURRENCY):
+        """Initialize the revalidator.
+
+        Args:
+            interval: Seconds after which a cached story is due for a check
+            concurrency: Revalidations run at once by this worker
+        """
+        self.interval = interval
+        self._slots = asyncio.Semaphore(concurrency)
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+
+    def due(self, story: Story) -> bool:
+        """Whether a cached story should be checked for changes."""
+        if self.interval <= 0:
+            return False
+        checked_at = story.validators.checked_at if story.validators else None
+        return checked_at is None or time.time() - checked_at >= self.interval
+
+    def schedule(self, story: Story) -> bool:
+        """Revalidate a story in the background if it is due.
+
+        Returns:
+            True if a revalidation was started
+        """
+        if not self.due(story) or story.hn_id in self._pending or len(self._pending) >= REVALIDATE_MAX_PENDING:
+            return False
+        if overload.level > NORMAL:
+            # Background work is the first to go under load
+            return False
+        task = asyncio.create_task(self.revalidate(story.hn_id))
+        self._pending[story.hn_id] = task
+        task.add_done_callback(lambda _: self._pending.pop(story.hn_id, None))
+        return True
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared keep-alive client, creating it on first use."""
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    self._client = httpx.AsyncClient(
+                        timeout=REVALIDATE_TIMEOUT,
+                        follow_redirects=True,
+                        headers={"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml"},
+                    )
+        return self._client
+
+    async def _fetch(self, url: str, validators: Optional[Validators]) -> Tuple[int, httpx.Headers, str]:
+        """Conditionally GET an article, reading at most REVALIDATE_MAX_BYTES.
+
+        Returns:
+            Tuple of (status code, response headers, body text)
+        """
+        headers = {}
+        if validators and validators.etag:
+            headers["If-None-Match"] = validators.etag
+        if validators and validators.last_modified:
+            headers["If-Modified-Since"] = validators.last_modified
+        client = await self._get_client()
+        async with client.stream("GET", url, headers=headers) as response:
+            body, size = [], 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > REVALIDATE_MAX_BYTES:
+                    break
+                body.append(chunk)
+            text = b"".join(body).decode(response.encoding or "utf-8", errors="replace")
+            return response.status_code, response.headers, text
+
+    async def revalidate(self, hn_id: str, force: bool = False) -> Dict[str, Any]:
+        """Check a cached story's article for changes and reprocess it if it changed.
+
+        Args:
+            hn_id: Hacker News story ID
+            force: Check even if the story was checked recently
+
+        Returns:
+            Dictionary with hn_id and result: not_modified, unchanged,
+            changed, baseline, skipped, fresh, missing or error (with
+            error set)
+        """
+        async with self._slots, lease(f"revalidate-{hn_id}"):
+            try:
+                story = read_story(hn_id)
+            except Exception as e:
+                story = None
+                logger.warning(f"[REVALIDATE] Cannot read cached story {hn_id}: {e}")
+            if story is None:
+                return {"hn_id": hn_id, "result": "missing"}
+            if not force and not self.due(story):
+                # Another worker checked it while we waited for the lease
+                return {"hn_id": hn_id, "result": "fresh"}
+
+            try:
+                result = await self._check(story)
+            except Exception as e:
+                logger.exception(f"[REVALIDATE] Check of {hn_id} failed")
+                result = {"hn_id": hn_id, "result": "error", "error": f"{type(e).__name__}: {e}"}
+        REVALIDATIONS.labels(result["result"]).inc()
+        logger.info(f"[REVALIDATE] {hn_id}: {result['result']}{' - ' + result['error'] if 'error' in result else ''}")
+        return result
+
+    async def _check(self, story: Story) -> Dict[str, Any]:
+        hn_id, url = story.hn_id, story.article_url
+        old = story.validators or Validators()
+        checked = Validators(
+            etag=old.etag,
+            last_modified=old.last_modified,
+            content_hash=old.content_hash,
+            checked_at=int(time.time()),
+        )
+
+        if not story.full_article_html or not url.startswith(("http://", "https://")):
+            # Nothing was extracted to compare against
+            await self._save(hn_id, checked)
+            return {"hn_id": hn_id, "result": "skipped"}
+        skip = host_scheduler.check(url)
+        if skip:
+            return {"hn_id": hn_id, "result": "skipped", "error": skip["reason"]}
+
+        try:
+            async with host_scheduler.slot(url):
+                status, headers, html = await self._fetch(url, story.validators)
+            text = await asyncio.to_thread(normalized_text, html) if status == 200 else ""
+        except Exception as e:
+            await self._save(hn_id, checked)
+            return {"hn_id": hn_id, "result": "error", "error": f"{type(e).__name__}: {e}"}
+
+        if status == 304:
+            await self._save(hn_id, checked)
+            return {"hn_id": hn_id, "result": "not_modified"}
+        if status != 200:
+            await self._save(hn_id, checked)
+            return {"hn_id": hn_id, "result": "error", "error": f"HTTP {status}"}
+
+        if has_bot_detection(text):
+            await self._save(hn_id, checked)
+            return {"hn_id": hn_id, "result": "error", "error": "Bot detection page"}
+
+        checked.etag = headers.get("etag")
+        checked.last_modified = headers.get("last-modified")
+        checked.content_hash = content_hash(text)
+        if old.content_hash is None or checked.content_hash == old.content_hash:
+            await self._save(hn_id, checked)
+            return {"hn_id": hn_id, "result": "baseline" if old.content_hash is None else "unchanged"}
+
+        return await self._reprocess(story, checked, old)
+
+    async def _reprocess(self, story: Story, checked: Validators, old: Validators) -> Dict[str, Any]:
+        """Run the story pipeline again; keep the old story if any stage of it failed.
+
+        The rebuilt story replaces the cached one only if the article,
+        hook and analysis were all produced. Otherwise the old story and
+        validators are kept (with the new checked_at) so the change is
+        detected again on the next check.
+        """
+        # stream imports this module
+        from stream import run_pipeline, cache_story
+
+        hn_id = story.hn_id
+        frontpage_story = {
+            name: getattr(story, name)
+            for name in ("hn_id", "title", "url", "article_url", "points", "author", "comments_count", "time")
+        }
+        async with lease(f"story-{hn_id}"):
+            updated = None
+            try:
+                async for item in run_pipeline(frontpage_story, hn_id, story.has_more, validators=checked, persist=False):
+                    if isinstance(item, Story):
+                        updated = item
+                error = reprocess_error(updated)
+            except Exception as e:
+                error = f"Reprocessing failed: {str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__}"
+            if error:
+                old.checked_at = checked.checked_at
+                self._save_validators(hn_id, old)
+                return {"hn_id": hn_id, "result": "error", "error": error}
+            cache_story(hn_id, updated)
+        return {"hn_id": hn_id, "result": "changed"}
+
+    async def _save(self, hn_id: str, validators: Validators):
+        """Record a check's validators under the story's lease."""
+        async with lease(f"story-{hn_id}"):
+            self._save_validators(hn_id, validators)
+
+    def _save_validators(self, hn_id: str, validators: Validators):
+        """Update only the validators of the cached story (caller holds the story lease).
+
+        The story is read again because it may have been reprocessed while
+        the article was being fetched; its content is left as it is now.
+        """
+        try:
+            story = read_story(hn_id)
+            if story is None:
+                return
+            current = story.validators
+            if current is not None and current.checked_at is not None and current.checked_at > validators.checked_at:
+                # Checked again meanwhile; that result is newer
+                return
+            story.validators = validators
+            write_story(hn_id, story)
+        except Exception as e:
+            logger.error(f"[CACHE WRITE ERROR] {hn_id}: {e}")
+
+    async def close(self):
+        """Cancel pending revalidations and close the HTTP client."""
+        for task in list(self._pending.values()):
+            task.cancel()
+        if self._pending:
+            await asyncio.gather(*self._pending.values(), return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# Create global revalidator instance
+revalidator = Revalidator()
@@ -1,23 +1,56 @@
 """Screenshot management for article content.
 
 This module provides functionality to:
-- Take screenshots of web articles using Playwright
+- Take screenshots of web articles using a long-lived Playwright browser
 - Handle bot detection and anti-automation measures
-- Manage screenshot storage and retrieval
+- Manage screenshot storage and retrieval, shared safely between workers
 """
 
-from playwright.async_api import async_playwright, TimeoutError
+from playwright.async_api import TimeoutError
 import asyncio
 import os
 from pathlib import Path
 from typing import Optional, Tuple
 import logging
 import random
+from metrics import BROWSER_PAGES_OPEN
+from tracing import trace_event
+from storage import lease
+from utils.host_scheduler import host_scheduler, skip_message
+from deadline import Deadline, LLM_RESERVE_SECONDS
+from utils.browser import BrowserSupervisor
+from utils.request_policy import apply_policy
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Directory screenshots are written to and served from
+SCREENSHOT_DIR = os.getenv("SCREENSHOT_DIR", os.path.join(os.path.dirname(__file__), "static/screenshots"))
+
+# Maximum screenshots rendered at once by this worker (each opens a context on the shared supervised browser)
+SCREENSHOT_MAX_CONCURRENCY = int(os.getenv("SCREENSHOT_MAX_CONCURRENCY", "2"))
+
+# Page load timeouts in seconds, and the longest a whole capture may take
+SCREENSHOT_GOTO_TIMEOUT = 60
+SCREENSHOT_IDLE_TIMEOUT = 30
+SCREENSHOT_MAX_SECONDS = 150
+
+# Skip the screenshot when the story deadline leaves less than this
+SCREENSHOT_MIN_SECONDS = float(os.getenv("SCREENSHOT_MIN_SECONDS", "10"))
+
+# Chromium switches for the screenshot browser, with anti-detection settings
+SCREENSHOT_LAUNCH_ARGS = (
+    "--disable-blink-features=AutomationControlled",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-software-rasterizer",
+    "--disable-extensions",
+    "--disable-web-security",
+    "--disable-features=IsolateOrigins,site-per-process",
+)
+
 # Path to fallback image for failed screenshots
 FALLBACK_IMAGE = os.path.join(os.path.dirname(__file__), "static/screenshots/fallback.png")
 
@@ -35,11 +68,14 @@ class ScreenshotManager:
         """Initialize the screenshot manager.
         
         Args:
-            screenshot_dir: Directory to store screenshots (defaults to static/screenshots)
+            screenshot_dir: Directory to store screenshots (defaults to SCREENSHOT_DIR)
         """
         if screenshot_dir is None:
-            screenshot_dir = os.path.join(os.path.dirname(__file__), "static/screenshots")
+            screenshot_dir = SCREENSHOT_DIR
         self.screenshot_dir = screenshot_dir
+        self._slots = asyncio.Semaphore(SCREENSHOT_MAX_CONCURRENCY)
+        # One long-lived, supervised browser per worker; each capture gets a fresh context
+        self._browsers = BrowserSupervisor("screenshot", SCREENSHOT_LAUNCH_ARGS)
         # Create screenshot directory if it doesn't exist
         Path(screenshot_dir).mkdir(parents=True, exist_ok=True)
         # Ensure fallback image exists
@@ -50,192 +86,257 @@ class ScreenshotManager:
             d.text((100, 350), "Screenshot unavailable", fill=(0, 0, 0))
             img.save(FALLBACK_IMAGE)
         
-    async def take_screenshot(self, url: str, article_id: str) -> Tuple[Optional[str], Optional[str]]:
+    def existing_path(self, article_id: str) -> Optional[str]:
+        """Return the served path of an article's screenshot if it has been taken."""
+        filename = f"{article_id}.png"
+        if os.path.exists(os.path.join(self.screenshot_dir, filename)):
+            return f"/static/screenshots/{filename}"
+        return None
+
+    async def take_screenshot(
+        self,
+        url: str,
+        article_id: str,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[Optional[str], Optional[str]]:
         """Take a screenshot of a web page.
         
+        Only one worker renders a given article at a time; the others wait
+        for its lease and reuse the file it wrote.
+        
+        With a deadline the screenshot, being the least important stage,
+        only gets the time left after LLM_RESERVE_SECONDS; it is skipped
+        when that is under SCREENSHOT_MIN_SECONDS and abandoned when it
+        runs out.
+        
         Args:
             url: URL of the page to screenshot
             article_id: Unique identifier for the article
+            deadline: Story deadline
             
         Returns:
             Tuple of (screenshot_path, error_message)
         """
         # Check for existing screenshot
-        filename = f"{article_id}.png"
-        filepath = os.path.join(self.screenshot_dir, filename)
-        if os.path.exists(filepath):
+        existing = self.existing_path(article_id)
+        if existing:
             logger.info(f"Screenshot already exists for article {article_id}, returning existing file")
-            return f"/static/screenshots/{filename}", None
+            return existing, None
+        filepath = os.path.join(self.screenshot_dir, f"{article_id}.png")
+
+        # Skip hosts that recently blocked us or timed out
+        skip = host_scheduler.check(url)
+        if skip:
+            trace_event("negative_cache", stage="take_screenshot", **skip)
+            return None, skip_message(skip)
+
+        if deadline is None:
+            return await self._render(url, article_id, filepath, SCREENSHOT_MAX_SECONDS)
+
+        budget = deadline.timeout(SCREENSHOT_MAX_SECONDS, reserve=LLM_RESERVE_SECONDS)
+        if budget < SCREENSHOT_MIN_SECONDS:
+            trace_event("deadline", stage="take_screenshot", action="skipped", budget=round(budget, 1))
+            return None, "Skipped: not enough time left in the story budget"
+        try:
+            return await asyncio.wait_for(self._render(url, article_id, filepath, budget), timeout=budget)
+        except asyncio.TimeoutError:
+            logger.warning(f"Screenshot of {url} abandoned after {budget:.0f}s story budget")
+            trace_event("deadline", stage="take_screenshot", action="abandoned", budget=round(budget, 1))
+            return None, "Screenshot abandoned: story deadline reached"
 
+    async def _render(self, url: str, article_id: str, filepath: str, budget: float) -> Tuple[Optional[str], Optional[str]]:
+        filename = os.path.basename(filepath)
+        async with lease(f"screenshot-{article_id}") as waited:
+            if waited and os.path.exists(filepath):
+                logger.info(f"Screenshot for article {article_id} was taken by another worker")
+                return f"/static/screenshots/{filename}", None
+            async with host_scheduler.slot(url), self._slots:
+                return await self._capture(url, filepath, Deadline(budget))
+
+    async def _capture(self, url: str, filepath: str, deadline: Deadline) -> Tuple[Optional[str], Optional[str]]:
+        """Render url and write the screenshot to filepath.
+
+        The image is written to a temporary file and renamed into place so
+        other workers never serve a partial PNG. Page load timeouts are
+        capped by the capture's deadline.
+        """
+        filename = os.path.basename(filepath)
+        tmp_path = os.path.join(self.screenshot_dir, f".tmp-{os.getpid()}-{filename}")
         browser = None
         context = None
         page = None
         try:
-            async with async_playwright() as p:
-                # Launch browser with anti-detection settings
-                browser = await p.chromium.launch(headless=True, args=[
-                    "--disable-blink-features=AutomationControlled",
-                    "--no-sandbox",
-                    "--disable-dev-shm-usage",
-                    "--disable-gpu",
-                    "--disable-software-rasterizer",
-                    "--disable-extensions",
-                    "--disable-web-security",
-                    "--disable-features=IsolateOrigins,site-per-process"
-                ])
-                
-                # Configure browser context with realistic settings
-                context = await browser.new_context(
-                    user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-                    locale="en-US",
-                    timezone_id="America/New_York",
-                    viewport={'width': 1280, 'height': 800},
-                    device_scale_factor=1,
-                    has_touch=False,
-                    is_mobile=False,
-                    color_scheme="light",
-                    accept_downloads=True,
-                    extra_http_headers={
-                        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-                        "Accept-Language": "en-US,en;q=0.9",
-                        "Accept-Encoding": "gzip, deflate, br",
-                        "DNT": "1",
-                        "Connection": "keep-alive",
-                        "Upgrade-Insecure-Requests": "1",
-                        "Sec-Fetch-Dest": "document",
-                        "Sec-Fetch-Mode": "navigate",
-                        "Sec-Fetch-Site": "none",
-                        "Sec-Fetch-User": "?1",
-                        "Cache-Control": "max-age=0",
-                        "Sec-Ch-Ua": '"Chromium";v="122", "Not(A:Brand";v="24", "Google Chrome";v="122"',
-                        "Sec-Ch-Ua-Mobile": "?0",
-                        "Sec-Ch-Ua-Platform": '"macOS"'
-                    }
-                )
-                
-                page = await context.new_page()
+            browser = await self._browsers.acquire()
+            
+            # Configure browser context with realistic settings
+            context = await browser.new_context(
+                user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
+                locale="en-US",
+                timezone_id="America/New_York",
+                viewport={'width': 1280, 'height': 800},
+                device_scale_factor=1,
+                has_touch=False,
+                is_mobile=False,
+                color_scheme="light",
+                accept_downloads=True,
+                extra_http_headers={
+                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+                    "Accept-Language": "en-US,en;q=0.9",
+                    "Accept-Encoding": "gzip, deflate, br",
+                    "DNT": "1",
+                    "Connection": "keep-alive",
+                    "Upgrade-Insecure-Requests": "1",
+                    "Sec-Fetch-Dest": "document",
+                    "Sec-Fetch-Mode": "navigate",
+                    "Sec-Fetch-Site": "none",
+                    "Sec-Fetch-User": "?1",
+                    "Cache-Control": "max-age=0",
+                    "Sec-Ch-Ua": '"Chromium";v="122", "Not(A:Brand";v="24", "Google Chrome";v="122"',
+                    "Sec-Ch-Ua-Mobile": "?0",
+                    "Sec-Ch-Ua-Platform": '"macOS"'
+                }
+            )
+            
+            # Skip ads, trackers and video; they only slow the render and the networkidle wait
+            await apply_policy(context, "screenshot")
+            page = await context.new_page()
+            BROWSER_PAGES_OPEN.labels("screenshot").inc()
 
-                # Add anti-detection scripts
-                await page.add_init_script("""
-                    Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
-                    Object.defineProperty(navigator, 'plugins', {get: () => [1, 2, 3, 4, 5]});
-                    Object.defineProperty(navigator, 'languages', {get: () => ['en-US', 'en']});
-                    Object.defineProperty(navigator, 'platform', {get: () => 'MacIntel'});
-                    Object.defineProperty(navigator, 'hardwareConcurrency', {get: () => 8});
-                    Object.defineProperty(navigator, 'deviceMemory', {get: () => 8});
-                    window.chrome = { runtime: {} };
-                """)
+            # Add anti-detection scripts
+            await page.add_init_script("""
+                Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
+                Object.defineProperty(navigator, 'plugins', {get: () => [1, 2, 3, 4, 5]});
+                Object.defineProperty(navigator, 'languages', {get: () => ['en-US', 'en']});
+                Object.defineProperty(navigator, 'platform', {get: () => 'MacIntel'});
+                Object.defineProperty(navigator, 'hardwareConcurrency', {get: () => 8});
+                Object.defineProperty(navigator, 'deviceMemory', {get: () => 8});
+                window.chrome = { runtime: {} };
+            """)
 
-                # Add random delay to mimic human behavior
-                await asyncio.sleep(random.uniform(1.0, 2.5))
+            # Add random delay to mimic human behavior
+            await asyncio.sleep(random.uniform(1.0, 2.5))
 
+            try:
+                # Load page with extended timeout
+                goto_timeout = deadline.timeout(SCREENSHOT_GOTO_TIMEOUT)
+                response = await page.goto(url, wait_until="domcontentloaded", timeout=goto_timeout * 1000)
+                if not response:
+                    return None, "Failed to load page: No response"
+                
+                # Wait for network to be idle
                 try:
-                    # Load page with extended timeout
-                    response = await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                    if not response:
-                        return None, "Failed to load page: No response"
-                    
-                    # Wait for network to be idle
-                    try:
-                        await page.wait_for_load_state("networkidle", timeout=30000)
-                    except TimeoutError:
-                        logger.warning("Network did not become idle, continuing anyway")
-                    
-                    # Simulate human-like scrolling
-                    await page.evaluate("""
-                        async () => {
-                            const delay = ms => new Promise(resolve => setTimeout(resolve, ms));
-                            const scrollHeight = document.body.scrollHeight;
-                            const viewportHeight = window.innerHeight;
-                            const scrollSteps = Math.floor(scrollHeight / viewportHeight);
-                            
-                            for (let i = 0; i < scrollSteps; i++) {
-                                window.scrollTo({
-                                    top: (i + 1) * viewportHeight,
-                                    behavior: 'smooth'
-                                });
-                                await delay(Math.random() * 500 + 500);
-                            }
-                            
+                    await page.wait_for_load_state("networkidle", timeout=max(1.0, deadline.timeout(SCREENSHOT_IDLE_TIMEOUT)) * 1000)
+                except TimeoutError:
+                    logger.warning("Network did not become idle, continuing anyway")
+                
+                # Simulate human-like scrolling
+                await page.evaluate("""
+                    async () => {
+                        const delay = ms => new Promise(resolve => setTimeout(resolve, ms));
+                        const scrollHeight = document.body.scrollHeight;
+                        const viewportHeight = window.innerHeight;
+                        const scrollSteps = Math.floor(scrollHeight / viewportHeight);
+                        
+                        for (let i = 0; i < scrollSteps; i++) {
                             window.scrollTo({
-                                top: 0,
+                                top: (i + 1) * viewportHeight,
                                 behavior: 'smooth'
                             });
+                            await delay(Math.random() * 500 + 500);
                         }
-                    """)
-                    
-                    # Wait for dynamic content
-                    await asyncio.sleep(random.uniform(2, 4))
-                    
-                    if page.is_closed():
-                        return None, "Page was closed unexpectedly"
+                        
+                        window.scrollTo({
+                            top: 0,
+                            behavior: 'smooth'
+                        });
+                    }
+                """)
+                
+                # Wait for dynamic content
+                await asyncio.sleep(random.uniform(2, 4))
+                
+                if page.is_closed():
+                    return None, "Page was closed unexpectedly"
 
-                    # Check for bot detection
-                    content = await page.content()
-                    block_phrases = [
-                        "blocked", "robot", "suspect", "unusual traffic", "verify you are a human",
-                        "security check", "captcha", "wordpress", "wp-content", "wp-includes"
-                    ]
-                    
-                    # Check for WordPress-specific elements
-                    is_wordpress = await page.evaluate("""
-                        () => {
-                            return document.querySelector('meta[name="generator"][content*="WordPress"]') !== null ||
-                                   document.querySelector('link[href*="wp-content"]') !== null ||
-                                   document.querySelector('script[src*="wp-includes"]') !== null;
-                        }
+                # Check for bot detection
+                content = await page.content()
+                block_phrases = [
+                    "blocked", "robot", "suspect", "unusual traffic", "verify you are a human",
+                    "security check", "captcha", "wordpress", "wp-content", "wp-includes"
+                ]
+                
+                # Check for WordPress-specific elements
+                is_wordpress = await page.evaluate("""
+                    () => {
+                        return document.querySelector('meta[name="generator"][content*="WordPress"]') !== null ||
+                               document.querySelector('link[href*="wp-content"]') !== null ||
+                               document.querySelector('script[src*="wp-includes"]') !== null;
+                    }
+                """)
+                
+                if is_wordpress:
+                    # Additional wait for WordPress content
+                    await asyncio.sleep(3)
+                    await page.evaluate("""
+                        window.scrollTo({
+                            top: document.body.scrollHeight / 2,
+                            behavior: 'smooth'
+                        });
                     """)
-                    
-                    if is_wordpress:
-                        # Additional wait for WordPress content
-                        await asyncio.sleep(3)
-                        await page.evaluate("""
-                            window.scrollTo({
-                                top: document.body.scrollHeight / 2,
-                                behavior: 'smooth'
-                            });
-                        """)
-                        await asyncio.sleep(2)
+                    await asyncio.sleep(2)
 
-                    if any(phrase in content.lower() for phrase in block_phrases):
-                        logger.warning(f"Blocked or bot detected at {url}, returning block message.")
-                        return None, "Screenshot blocked by site"
+                if any(phrase in content.lower() for phrase in block_phrases):
+                    logger.warning(f"Blocked or bot detected at {url}, returning block message.")
+                    # The phrase check is broad (it matches any WordPress site), so only the URL is marked
+                    host_scheduler.record_failure(url, "blocked", "screenshot blocked by site", host_wide=False)
+                    return None, "Screenshot blocked by site"
 
-                    # Try different viewport sizes for screenshot
-                    for viewport_height in [800, 1200, 1600]:
-                        try:
-                            if page.is_closed():
-                                return None, "Page was closed during screenshot attempt"
-                                
-                            await page.set_viewport_size({'width': 1280, 'height': viewport_height})
-                            await asyncio.sleep(1)  # Wait for resize
+                # Try different viewport sizes for screenshot
+                for viewport_height in [800, 1200, 1600]:
+                    try:
+                        if page.is_closed():
+                            return None, "Page was closed during screenshot attempt"
+                            
+                        await page.set_viewport_size({'width': 1280, 'height': viewport_height})
+                        await asyncio.sleep(1)  # Wait for resize
+                        
+                        if not page.is_closed():
+                            await page.screenshot(path=tmp_path, full_page=True)
+                            os.replace(tmp_path, filepath)
+                            break
+                        else:
+                            return None, "Page was closed during screenshot attempt"
                             
-                            if not page.is_closed():
-                                await page.screenshot(path=filepath, full_page=True)
-                                break
-                            else:
-                                return None, "Page was closed during screenshot attempt"
-                                
-                        except Exception as e:
-                            logger.warning(f"Failed to take screenshot with height {viewport_height}: {str(e)}")
-                            if viewport_height == 1600:  # Last attempt
-                                raise
-                            continue
+                    except Exception as e:
+                        logger.warning(f"Failed to take screenshot with height {viewport_height}: {str(e)}")
+                        if viewport_height == 1600:  # Last attempt
+                            raise
+                        trace_event("retry", stage="take_screenshot", viewport_height=viewport_height, error=str(e))
+                        continue
 
-                    return f"/static/screenshots/{filename}", None
+                host_scheduler.record_success(url)
+                return f"/static/screenshots/{filename}", None
 
-                except TimeoutError:
-                    logger.error(f"Timeout while loading {url}")
-                    return None, "Timeout while loading page"
-                except Exception as e:
-                    logger.error(f"Error during page interaction: {str(e)}")
-                    return None, f"Error during page interaction: {str(e)}"
+            except TimeoutError:
+                logger.error(f"Timeout while loading {url}")
+                host_scheduler.record_timeout(url, goto_timeout, SCREENSHOT_GOTO_TIMEOUT)
+                return None, "Timeout while loading page"
+            except Exception as e:
+                logger.error(f"Error during page interaction: {str(e)}")
+                return None, f"Error during page interaction: {str(e)}"
 
         except Exception as e:
             logger.error(f"Failed to take screenshot of {url}: {str(e)}")
             return None, f"Failed to take screenshot: {str(e)}"
         finally:
+            if os.path.exists(tmp_path):
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
             # Clean up browser resources
+            if page:
+                BROWSER_PAGES_OPEN.labels("screenshot").dec()
             if page and not page.is_closed():
                 try:
                     await page.close()
@@ -247,10 +348,15 @@ class ScreenshotManager:
                 except Exception as e:
                     logger.error(f"Error closing context: {str(e)}")
             if browser:
-                try:
-                    await browser.close()
-                except Exception as e:
-                    logger.error(f"Error closing browser: {str(e)}")
+                self._browsers.release(browser)
+
+    async def start(self):
+        """Launch the screenshot browser ahead of the first capture."""
+        await self._browsers.start()
+
+    async def close(self):
+        """Close the screenshot browser and Playwright."""
+        await self._browsers.close()
 
 # Create singleton instance
 screenshot_manager = ScreenshotManager() 
\ No newline at end of file
@@ -0,0 +1,326 @@
+"""Asynchronous screenshot jobs.
+
+This module provides:
+- A job queue in front of the screenshot manager: submitting returns a
+  job at once and a bounded pool of workers renders in the background
+- Merging of identical pending jobs, so an article is only queued once
+- Priorities: interactive jobs (a client or story is waiting) run before
+  prefetch jobs (captured for later)
+- Job status for polling, completion waits and change notifications for
+  server-sent events
+
+Jobs live in the memory of the worker process that accepted them. Job ids
+embed the article id, so any worker can still report a job as done once
+its screenshot is on disk.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from deadline import Deadline, LLM_RESERVE_SECONDS, stage_timeout
+from metrics import SCREENSHOT_JOBS, SCREENSHOT_QUEUE_DEPTH
+from screenshot import screenshot_manager, SCREENSHOT_MAX_CONCURRENCY, SCREENSHOT_MAX_SECONDS, SCREENSHOT_MIN_SECONDS
+from tracing import trace_event
+
+logger = logging.getLogger(__name__)
+
+# Workers rendering queued jobs in this process
+SCREENSHOT_JOB_WORKERS = int(os.getenv("SCREENSHOT_JOB_WORKERS", str(SCREENSHOT_MAX_CONCURRENCY)))
+
+# Jobs that may wait in the queue; further submissions are rejected
+SCREENSHOT_QUEUE_MAX = int(os.getenv("SCREENSHOT_QUEUE_MAX", "500"))
+
+# Finished jobs kept for status lookups
+SCREENSHOT_JOB_HISTORY = int(os.getenv("SCREENSHOT_JOB_HISTORY", "1000"))
+
+# Lower runs first
+PRIORITIES = {"interactive": 0, "prefetch": 10}
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+TERMINAL_STATUSES = (DONE, FAILED)
+
+class QueueFull(Exception):
+    """Raised when the screenshot queue cannot take another job."""
+
+class ScreenshotJob:
+    """One screenshot request and its progress."""
+
+    __slots__ = (
+        "id", "article_id", "url", "priority", "status", "screenshot_path", "error",
+        "submitted_at", "started_at", "finished_at", "merged", "_changed", "_done"
+    )
+
+    def __init__(self, article_id: str, url: str, priority: str):
+        self.id = f"{article_id}-{secrets.token_hex(4)}"
+        self.article_id = article_id
+        self.url = url
+        self.priority = priority
+        self.status = QUEUED
+        self.screenshot_path: Optional[str] = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Submissions merged into this job
+        self.merged = 0
+        self._changed = asyncio.Event()
+        self._done = asyncio.Event()
+
+    def _set(self, status: str):
+        self.status = status
+        if status == RUNNING:
+            self.started_at = time.time()
+        elif status in TERMINAL_STATUSES:
+            self.finished_at = time.time()
+            self._done.set()
+        # Wake everyone watching for a change and start a new generation
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the job finishes.
+
+        Returns:
+            True if it finished within timeout
+        """
+        try:
+            await asyncio.wait_for(self._done.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def changes(self, keepalive: Optional[float] = None) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Yield the job's state now and after every change until it finishes.
+
+        Args:
+            keepalive: Yield None after this many seconds without a change
+
+        Yields:
+            Job dictionaries (None for keepalives)
+        """
+        while True:
+            changed = self._changed
+            yield self.to_dict()
+            if self.status in TERMINAL_STATUSES:
+                return
+            while not changed.is_set():
+                try:
+                    await asyncio.wait_for(changed.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {
+            "job_id": self.id,
+            "article_id": self.article_id,
+            "url": self.url,
+            "priority": self.priority,
+            "status": self.status,
+            "merged": self.merged,
+            "submitted_at": round(self.submitted_at, 3),
+        }
+        if self.started_at:
+            result["queued_s"] = round(self.started_at - self.submitted_at, 3)
+        if self.finished_at:
+            result["duration_s"] = round(self.finished_at - (self.started_at or self.submitted_at), 3)
+        if self.screenshot_path:
+            result["screenshot_path"] = self.screenshot_path
+        if self.error:
+            result["error"] = self.error
+        return result
+
+class ScreenshotJobs:
+    """Priority queue of screenshot jobs served by a bounded worker pool."""
+
+    def __init__(self, workers: int = SCREENSHOT_JOB_WORKERS, max_queued: int = SCREENSHOT_QUEUE_MAX):
+        """Initialize the job queue (workers start with the first submission).
+
+        Args:
+            workers: Jobs rendered at once
+            max_queued: Jobs that may wait for a worker
+        """
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._workers: list = []
+        # Pending (queued or running) jobs by article id, and all jobs by id
+        self._pending: Dict[str, ScreenshotJob] = {}
+        self._jobs: "OrderedDict[str, ScreenshotJob]" = OrderedDict()
+        self._queued = 0
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._work(), name=f"screenshot-job-worker-{i}") for i in range(self.workers)]
+
+    def _enqueue(self, job: ScreenshotJob):
+        self._queue.put_nowait((PRIORITIES[job.priority], next(self._sequence), job))
+
+    def submit(self, url: str, article_id: str, priority: str = "interactive") -> ScreenshotJob:
+        """Queue a screenshot, or return the pending job for the same article.
+
+        An interactive submission for a queued prefetch job moves it ahead.
+        An article whose screenshot already exists gets a finished job.
+
+        Args:
+            url: URL of the page to screenshot
+            article_id: Unique identifier for the article
+            priority: "interactive" or "prefetch"
+
+        Returns:
+            The new or merged job
+
+        Raises:
+            ValueError: If priority is unknown
+            QueueFull: If SCREENSHOT_QUEUE_MAX jobs are already waiting
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}', expected one of: {', '.join(PRIORITIES)}")
+
+        pending = self._pending.get(article_id)
+        if pending is not None:
+            pending.merged += 1
+            SCREENSHOT_JOBS.labels("merged").inc()
+            if pending.status == QUEUED and PRIORITIES[priority] < PRIORITIES[pending.priority]:
+                # The stale entry is skipped by whichever worker pops it second
+                pending.priority = priority
+                self._enqueue(pending)
+                pending._set(QUEUED)
+            return pending
+
+        job = ScreenshotJob(article_id, url, priority)
+        existing = screenshot_manager.existing_path(article_id)
+        if existing:
+            job.screenshot_path = existing
+            job._set(DONE)
+            self._remember(job)
+            SCREENSHOT_JOBS.labels("existing").inc()
+            return job
+
+        if self._queued >= self.max_queued:
+            SCREENSHOT_JOBS.labels("rejected").inc()
+            raise QueueFull(f"Screenshot queue is full ({self.max_queued} jobs waiting)")
+
+        self._ensure_workers()
+        self._pending[article_id] = job
+        self._remember(job)
+        self._queued += 1
+        SCREENSHOT_QUEUE_DEPTH.set(self._queued)
+        self._enqueue(job)
+        SCREENSHOT_JOBS.labels("submitted").inc()
+        return job
+
+    def _remember(self, job: ScreenshotJob):
+        self._jobs[job.id] = job
+        while len(self._jobs) > SCREENSHOT_JOB_HISTORY:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status not in TERMINAL_STATUSES:
+                break
+            del self._jobs[oldest_id]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job's state.
+
+        Jobs accepted by another worker are reported as done once their
+        screenshot exists.
+
+        Returns:
+            Job dictionary, or None if the job is unknown
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        article_id = job_id.rpartition("-")[0]
+        existing = screenshot_manager.existing_path(article_id) if article_id else None
+        if existing:
+            return {"job_id": job_id, "article_id": article_id, "status": DONE, "screenshot_path": existing}
+        return None
+
+    def find(self, job_id: str) -> Optional[ScreenshotJob]:
+        return self._jobs.get(job_id)
+
+    async def _work(self):
+        while True:
+            _, _, job = await self._queue.get()
+            if job.status != QUEUED:
+                continue  # Already taken through a higher-priority entry
+            self._queued -= 1
+            SCREENSHOT_QUEUE_DEPTH.set(self._queued)
+            job._set(RUNNING)
+            try:
+                job.screenshot_path, job.error = await screenshot_manager.take_screenshot(job.url, job.article_id)
+            except asyncio.CancelledError:
+                job.error = "Cancelled: server shutting down"
+                job._set(FAILED)
+                raise
+            except Exception as e:
+                logger.error(f"Screenshot job {job.id} failed: {e}")
+                job.error = str(e)
+            finally:
+                self._pending.pop(job.article_id, None)
+            job._set(DONE if job.screenshot_path else FAILED)
+            SCREENSHOT_JOBS.labels("completed" if job.screenshot_path else "failed").inc()
+
+    async def capture(self, url: str, article_id: str, deadline: Optional[Deadline] = None) -> Tuple[Optional[str], Optional[str]]:
+        """Screenshot an article for the story pipeline.
+
+        The capture runs as an interactive job and is awaited for as long
+        as the deadline allows (after LLM_RESERVE_SECONDS). When less than
+        SCREENSHOT_MIN_SECONDS is left it is queued as a prefetch job
+        instead; either way a capture that outlives the story still lands
+        on disk and is picked up the next time the story is served.
+
+        Args:
+            url: URL of the page to screenshot
+            article_id: Unique identifier for the article
+            deadline: Story deadline
+
+        Returns:
+            Tuple of (screenshot_path, error_message)
+        """
+        existing = screenshot_manager.existing_path(article_id)
+        if existing:
+            return existing, None
+
+        budget = stage_timeout(deadline, SCREENSHOT_MAX_SECONDS, reserve=LLM_RESERVE_SECONDS)
+        try:
+            if deadline is not None and budget < SCREENSHOT_MIN_SECONDS:
+                self.submit(url, article_id, "prefetch")
+                trace_event("deadline", stage="take_screenshot", action="deferred", budget=round(budget, 1))
+                return None, "Skipped: not enough time left in the story budget; capturing in the background"
+            job = self.submit(url, article_id, "interactive")
+        except QueueFull as e:
+            return None, str(e)
+
+        if not await job.wait(budget):
+            logger.warning(f"Screenshot of {url} still rendering after {budget:.0f}s story budget")
+            trace_event("deadline", stage="take_screenshot", action="abandoned", budget=round(budget, 1))
+            return None, "Screenshot still rendering: story deadline reached"
+        return job.screenshot_path, job.error
+
+    async def close(self):
+        """Stop the workers; running and queued jobs are marked failed."""
+        for worker in self._workers:
+            worker.cancel()
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        for job in list(self._pending.values()):
+            if job.status not in TERMINAL_STATUSES:
+                job.error = "Cancelled: server shutting down"
+                job._set(FAILED)
+        self._pending.clear()
+        self._workers = []
+        self._queue = None
+        self._queued = 0
+        SCREENSHOT_QUEUE_DEPTH.set(0)
+
+# Create global screenshot job queue
+screenshot_jobs = ScreenshotJobs()
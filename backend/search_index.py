@@ -0,0 +1,497 @@
+"""Full-text search over processed stories.
+
+This module provides:
+- An inverted index over story titles, hooks, analyses, cleaned article
+  text and comments, ranked with BM25 (fields weighted by FIELD_WEIGHTS)
+- Incremental updates: every story the pipeline caches is added in the
+  background, replacing its previous version
+- Persistence under CACHE_DIR/index, shared by all worker processes
+
+On disk the index is a segment (a JSON header with the documents and terms
+plus a binary file with the posting arrays) and a change log of stories
+added since. CURRENT names the live segment generation. Writers append to
+the log under the "search-index" lease and, every SEARCH_COMPACT_AFTER
+entries, fold it into a new segment. Each worker loads the segment once
+and then only reads the log entries it has not seen yet, so startup never
+re-tokenizes the cache; the index is only built from the cache files when
+there is none yet (or with `python search_index.py --rebuild`).
+"""
+
+import asyncio
+import glob
+import heapq
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from metrics import SEARCH_DURATION, SEARCH_INDEX_DOCS, SEARCH_INDEX_UPDATES
+from records import Story, RecordError, dumps, loads
+from storage import CACHE_DIR, atomic_write, lease, read_story, story_cache_path
+from utils.gemini import html_to_text
+
+logger = logging.getLogger(__name__)
+
+# Set to 0 to disable indexing and /search
+SEARCH_INDEX = os.getenv("SEARCH_INDEX", "1") == "1"
+
+INDEX_DIR = os.path.join(CACHE_DIR, "index")
+
+# Change log entries folded into a new segment at once
+SEARCH_COMPACT_AFTER = int(os.getenv("SEARCH_COMPACT_AFTER", "500"))
+
+# Article text indexed per story (characters)
+SEARCH_MAX_ARTICLE_CHARS = int(os.getenv("SEARCH_MAX_ARTICLE_CHARS", "20000"))
+
+# Most results returned per page
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "100"))
+
+# Term frequencies are weighted by the field they occur in
+FIELD_WEIGHTS = {"title": 3.0, "hook": 2.0, "analysis": 1.5, "article": 1.0, "comments": 0.5}
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Characters of the hook kept as the result snippet
+SNIPPET_CHARS = 240
+
+MIN_TOKEN_LENGTH = 2
+MAX_TOKEN_LENGTH = 40
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i if in into is it its
+of on or our she so than that the their them then there these they this to was
+we were what when which who will with you your
+""".split())
+
+_TOKEN_RE = re.compile(r"\w+")
+
+SEGMENT_VERSION = 1
+
+# Documents are stored as (hn_id, title, time, points, hook snippet)
+DocInfo = Tuple[str, str, int, int, str]
+
+def tokenize(text: str) -> List[str]:
+    """Split text into casefolded index terms, dropping stopwords."""
+    return [
+        token for token in _TOKEN_RE.findall(text.casefold())
+        if MIN_TOKEN_LENGTH <= len(token) <= MAX_TOKEN_LENGTH and token not in STOPWORDS
+    ]
+
+def story_fields(story: Story) -> Dict[str, str]:
+    """Return the searchable text of a story by field."""
+    return {
+        "title": story.title,
+        "hook": story.hook,
+        "analysis": story.analysis.analysis if story.analysis.metadata.get("error") is None else "",
+        "article": html_to_text(story.full_article_html or "")[:SEARCH_MAX_ARTICLE_CHARS],
+        "comments": " ".join(comment.text for comment in story.top_comments),
+    }
+
+def story_entry(story: Story) -> Dict[str, Any]:
+    """Tokenize a story into a change log entry.
+
+    Returns:
+        Dictionary with the document info, its weighted length and the
+        weighted frequency of each term
+    """
+    terms: Counter = Counter()
+    for field, text in story_fields(story).items():
+        weight = FIELD_WEIGHTS[field]
+        for term, count in Counter(tokenize(text)).items():
+            terms[term] += weight * count
+    doc = (story.hn_id, story.title, story.time, story.points, story.hook[:SNIPPET_CHARS])
+    return {"doc": doc, "length": sum(terms.values()), "terms": {term: round(w, 2) for term, w in terms.items()}}
+
+class SearchIndex:
+    """Inverted index over cached stories, kept in sync with CACHE_DIR/index."""
+
+    def __init__(self, directory: str = INDEX_DIR, compact_after: int = SEARCH_COMPACT_AFTER):
+        """Initialize an empty index (the files are loaded on first use).
+
+        Args:
+            directory: Directory holding the segment, change log and CURRENT
+            compact_after: Change log entries folded into a new segment at once
+        """
+        self.directory = directory
+        self.compact_after = compact_after
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._reset(0)
+        self._tasks: set = set()
+        self._bootstrap: Optional[asyncio.Task] = None
+        # Set once the index is loaded and holds the cached stories
+        self._ready = False
+        self._building = False
+        self._ready_lock = asyncio.Lock()
+
+    def _reset(self, generation: int):
+        self.generation = generation
+        # Document number -> info (None once replaced), and hn_id -> live document number
+        self._docs: List[Optional[DocInfo]] = []
+        self._doc_ids: Dict[str, int] = {}
+        self._lengths = array("f")
+        self._total_length = 0.0
+        # Term -> (document numbers, weighted frequencies)
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._log_offset = 0
+        self._log_entries = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @property
+    def documents(self) -> int:
+        return len(self._doc_ids)
+
+    # Loading and refreshing
+
+    def _read_generation(self) -> int:
+        try:
+            with open(self._path("CURRENT")) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _load_segment(self, generation: int):
+        self._reset(generation)
+        if not generation:
+            return
+        with open(self._path(f"segment-{generation}.json"), "rb") as f:
+            header = loads(f.read())
+        if header.get("version") != SEGMENT_VERSION:
+            raise ValueError(f"Unsupported index segment version {header.get('version')}")
+        with open(self._path(f"segment-{generation}.bin"), "rb") as f:
+            data = f.read()
+
+        docs = [tuple(doc) for doc in header["docs"]]
+        total = header["postings"]
+        lengths, docnos, weights = array("f"), array("I"), array("f")
+        size_f, size_i = lengths.itemsize, docnos.itemsize
+        lengths.frombytes(data[:len(docs) * size_f])
+        position = len(docs) * size_f
+        docnos.frombytes(data[position:position + total * size_i])
+        position += total * size_i
+        weights.frombytes(data[position:position + total * size_f])
+        if header["byteorder"] != sys.byteorder:
+            for values in (lengths, docnos, weights):
+                values.byteswap()
+
+        self._docs = docs
+        self._doc_ids = {doc[0]: docno for docno, doc in enumerate(docs)}
+        self._lengths = lengths
+        self._total_length = sum(lengths)
+        start = 0
+        for term, count in header["terms"]:
+            end = start + count
+            self._postings[term] = (docnos[start:end], weights[start:end])
+            start = end
+
+    def _apply(self, entry: Dict[str, Any]):
+        doc = tuple(entry["doc"])
+        previous = self._doc_ids.get(doc[0])
+        if previous is not None:
+            self._docs[previous] = None
+            self._total_length -= self._lengths[previous]
+        docno = len(self._docs)
+        self._docs.append(doc)
+        self._doc_ids[doc[0]] = docno
+        self._lengths.append(entry["length"])
+        self._total_length += entry["length"]
+        for term, weight in entry["terms"].items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("f"))
+            postings[0].append(docno)
+            postings[1].append(weight)
+
+    def _refresh(self):
+        """Catch up with the files: reload on a new generation, else read new log entries."""
+        generation = self._read_generation()
+        if not self._loaded or generation != self.generation:
+            for attempt in range(3):
+                try:
+                    self._load_segment(generation)
+                    break
+                except FileNotFoundError:
+                    # Compacted away while loading; follow CURRENT again
+                    generation = self._read_generation()
+            else:
+                raise RuntimeError("Search index segment kept changing while loading")
+            self._loaded = True
+            SEARCH_INDEX_UPDATES.labels("loaded").inc()
+
+        try:
+            with open(self._path(f"changes-{self.generation}.log"), "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+        # A line without its newline is still being written; read it next time
+        complete = data.rfind(b"\n") + 1
+        for line in data[:complete].splitlines():
+            if line:
+                self._apply(loads(line))
+                self._log_entries += 1
+        self._log_offset += complete
+        SEARCH_INDEX_DOCS.set(self.documents)
+
+    def load(self):
+        """Load the index from disk, or catch up with changes made since the last load."""
+        with self._lock:
+            self._refresh()
+
+    # Writing
+
+    def _append(self, entries: Iterable[Dict[str, Any]]):
+        """Append entries to the change log and apply them (caller holds the lease)."""
+        with self._lock:
+            self._refresh()
+            data = b"".join(dumps(entry) + b"\n" for entry in entries)
+            if not data:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            fd = os.open(self._path(f"changes-{self.generation}.log"), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+            self._refresh()
+            if self._log_entries >= self.compact_after:
+                self._compact()
+
+    def _compact(self):
+        """Write the live documents as a new segment and drop the old files (caller holds the lease)."""
+        started = time.perf_counter()
+        live = [docno for docno, doc in enumerate(self._docs) if doc is not None]
+        renumber = {docno: new for new, docno in enumerate(live)}
+        lengths, docnos, weights = array("f", (self._lengths[docno] for docno in live)), array("I"), array("f")
+        terms = []
+        for term, (term_docnos, term_weights) in self._postings.items():
+            if len(live) == len(self._docs):
+                # Nothing was replaced, so the document numbers stay the same
+                docnos.extend(term_docnos)
+                weights.extend(term_weights)
+                count = len(term_docnos)
+            else:
+                count = 0
+                for docno, weight in zip(term_docnos, term_weights):
+                    new = renumber.get(docno)
+                    if new is not None:
+                        docnos.append(new)
+                        weights.append(weight)
+                        count += 1
+            if count:
+                terms.append((term, count))
+
+        old, generation = self.generation, self.generation + 1
+        header = {
+            "version": SEGMENT_VERSION,
+            "byteorder": sys.byteorder,
+            "postings": len(docnos),
+            "docs": [self._docs[docno] for docno in live],
+            "terms": terms,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write(self._path(f"segment-{generation}.bin"), lengths.tobytes() + docnos.tobytes() + weights.tobytes())
+        atomic_write(self._path(f"segment-{generation}.json"), dumps(header))
+        atomic_write(self._path("CURRENT"), str(generation).encode())
+        for name in (f"segment-{old}.json", f"segment-{old}.bin", f"changes-{old}.log"):
+            try:
+                os.unlink(self._path(name))
+            except FileNotFoundError:
+                pass
+        self._load_segment(generation)
+        SEARCH_INDEX_DOCS.set(self.documents)
+        SEARCH_INDEX_UPDATES.labels("compacted").inc()
+        logger.info(f"[SEARCH] Compacted index to generation {generation}: {len(live)} stories, "
+                    f"{len(terms)} terms in {time.perf_counter() - started:.2f}s")
+
+    async def _add(self, story: Story):
+        try:
+            await self._ensure_built()
+            entry = await asyncio.to_thread(story_entry, story)
+            async with lease("search-index"):
+                await asyncio.to_thread(self._append, [entry])
+            SEARCH_INDEX_UPDATES.labels("added").inc()
+        except Exception as e:
+            SEARCH_INDEX_UPDATES.labels("error").inc()
+            logger.error(f"[SEARCH] Failed to index story {story.hn_id}: {e}")
+
+    def add(self, story: Story):
+        """Index a story in the background, replacing its previous version."""
+        if not SEARCH_INDEX:
+            return
+        task = asyncio.create_task(self._add(story))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # Building from the cache
+
+    def _cached_entries(self, skip: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        skip = set(skip)
+        entries = []
+        for path in glob.glob(story_cache_path("*")):
+            hn_id = os.path.basename(path)[:-len(".json")]
+            if hn_id in skip:
+                continue
+            try:
+                story = read_story(hn_id)
+            except RecordError as e:
+                logger.warning(f"[SEARCH] Not indexing invalid cache file for {hn_id}: {e}")
+                continue
+            if story is not None:
+                entries.append(story_entry(story))
+        return entries
+
+    async def _build(self, rebuild: bool = False):
+        """Index the cached stories the index does not have yet (or all of them) as a new segment."""
+        started = time.perf_counter()
+        indexed = set() if rebuild else set(self._doc_ids)
+        entries = await asyncio.to_thread(self._cached_entries, indexed)
+        async with lease("search-index"):
+            def build():
+                with self._lock:
+                    self._refresh()
+                    if rebuild:
+                        self._reset(self.generation)
+                        self._loaded = True
+                    for entry in entries:
+                        # Stories indexed meanwhile by the pipeline are newer than the cache scan
+                        if rebuild or entry["doc"][0] not in self._doc_ids:
+                            self._apply(entry)
+                    self._compact()
+            await asyncio.to_thread(build)
+        logger.info(f"[SEARCH] Indexed {len(entries)} cached stories in {time.perf_counter() - started:.2f}s")
+
+    async def _ensure_built(self):
+        """Load the index on first use, building it from the story cache if there is none yet."""
+        if self._ready:
+            return
+        async with self._ready_lock:
+            if self._ready:
+                return
+            await asyncio.to_thread(self.load)
+            if self.generation == 0:
+                self._building = True
+                try:
+                    await self._build()
+                except Exception as e:
+                    SEARCH_INDEX_UPDATES.labels("error").inc()
+                    logger.error(f"[SEARCH] Failed to index the story cache: {e}")
+                    return
+                finally:
+                    self._building = False
+            self._ready = True
+
+    async def start(self):
+        """Load the index, building it from the story cache in the background if there is none yet.
+
+        Searches and updates build it on first use as well, so this only
+        moves the work to startup.
+        """
+        if not SEARCH_INDEX:
+            return
+        await asyncio.to_thread(self.load)
+        if self._bootstrap is None:
+            self._bootstrap = asyncio.create_task(self._ensure_built(), name="search-index-bootstrap")
+
+    async def rebuild(self):
+        """Re-index every cached story from scratch."""
+        await self._build(rebuild=True)
+
+    # Querying
+
+    def _search(self, query: str, offset: int, limit: int) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            terms = list(dict.fromkeys(tokenize(query)))
+            docs, lengths = self._docs, self._lengths
+            live = len(self._doc_ids)
+            average = self._total_length / live if live else 1.0
+            norm = BM25_K1 * (1 - BM25_B)
+            slope = BM25_K1 * BM25_B / (average or 1.0)
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                docnos, weights = postings
+                df = min(len(docnos), live)
+                idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+                get = scores.get
+                for docno, tf in zip(docnos, weights):
+                    if docs[docno] is not None:
+                        scores[docno] = get(docno, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm + slope * lengths[docno])
+
+            top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: item[1])[offset:]
+            results = []
+            for docno, score in top:
+                hn_id, title, story_time, points, hook = docs[docno]
+                results.append({
+                    "hn_id": hn_id, "title": title, "score": round(score, 3),
+                    "hook": hook, "time": story_time, "points": points,
+                })
+            return {"total": len(scores), "results": results}
+
+    async def search(self, query: str, offset: int = 0, limit: int = 10) -> Dict[str, Any]:
+        """Find stories matching any query term, best matches first.
+
+        Args:
+            query: Free text; terms are matched case-insensitively
+            offset: Number of results to skip
+            limit: Results per page (at most SEARCH_MAX_RESULTS)
+
+        Returns:
+            Dictionary with the total number of matches and one page of
+            results (hn_id, title, score, hook, time, points)
+        """
+        started = time.perf_counter()
+        limit = max(0, min(limit, SEARCH_MAX_RESULTS))
+        offset = max(0, offset)
+        await self._ensure_built()
+        result = await asyncio.to_thread(self._search, query, offset, limit)
+        took = time.perf_counter() - started
+        SEARCH_DURATION.observe(took)
+        return {"query": query, "offset": offset, "limit": limit, "took_ms": round(took * 1000, 2), **result}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "documents": self.documents,
+            "terms": len(self._postings),
+            "generation": self.generation,
+            "pending_log_entries": self._log_entries,
+            "building": self._building,
+        }
+
+    async def close(self):
+        """Finish pending index updates and stop a running bootstrap."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._bootstrap is not None and not self._bootstrap.done():
+            self._bootstrap.cancel()
+            await asyncio.gather(self._bootstrap, return_exceptions=True)
+
+# Create global search index
+search_index = SearchIndex()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or query the story search index")
+    parser.add_argument("--rebuild", action="store_true", help="re-index every cached story")
+    parser.add_argument("query", nargs="?", help="search the index")
+    args = parser.parse_args()
+    if args.rebuild:
+        asyncio.run(search_index.rebuild())
+        print(search_index.to_dict())
+    if args.query:
+        for result in asyncio.run(search_index.search(args.query))["results"]:
+            print(f"{result['score']:8.3f}  {result['hn_id']}  {result['title']}")
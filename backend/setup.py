@@ -14,6 +14,7 @@ setup(
         "fastapi",
         "uvicorn",
         "playwright",
+        "httpx",
         "beautifulsoup4",
         "google-generativeai",
         "python-dotenv",
@@ -0,0 +1,168 @@
+"""Application startup: configuration checks, warm-up and readiness.
+
+This module provides:
+- Configuration validation that reports problems instead of failing imports
+- Warm-up of the scraper and screenshot browsers and the HN and LLM
+  clients, run in the background from the FastAPI startup hook
+- The readiness state served by /ready, with import and warm-up timings
+
+It is imported first by main.py so the import timer covers the whole app;
+the application modules are only imported inside the warm-up functions,
+by which time main.py has already loaded them.
+"""
+
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from metrics import STARTUP_SECONDS, WARM_UP_OK
+
+logger = logging.getLogger(__name__)
+
+# Launch browsers and open clients at startup (set to 0 for quick local runs)
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+
+# Give up on warming a component after this many seconds
+WARM_UP_TIMEOUT = float(os.getenv("WARM_UP_TIMEOUT", "60"))
+
+_state: Dict[str, Any] = {
+    "ready": False,
+    "phase": "importing",
+    "degraded": False,
+    "config_errors": [],
+    "components": {},
+    "timings": {},
+}
+_warm_up_task: Optional[asyncio.Task] = None
+
+def mark_imported():
+    """Record how long importing the application took."""
+    seconds = time.perf_counter() - _import_started
+    _state["phase"] = "starting"
+    _state["timings"]["import_s"] = round(seconds, 3)
+    STARTUP_SECONDS.labels("import").set(seconds)
+    logger.info(f"Application imported in {seconds:.2f}s")
+
+def check_config() -> list:
+    """Validate configuration without touching the network.
+
+    Returns:
+        List of human-readable problems (empty when the app can serve)
+    """
+    from utils.gemini import check_config as check_gemini_config
+    from utils.hn_source import HN_SOURCE, SOURCES
+
+    problems = list(check_gemini_config())
+    if HN_SOURCE not in SOURCES:
+        problems.append(f"Unknown HN_SOURCE '{HN_SOURCE}', expected one of: {', '.join(SOURCES)}")
+    return problems
+
+async def _warm_scraper_browser():
+    from utils.browser import start_browser
+    await start_browser()
+
+async def _warm_screenshot_browser():
+    from screenshot import screenshot_manager
+    await screenshot_manager.start()
+
+async def _warm_hn_source():
+    from utils.hn_source import get_source
+    await get_source().warm_up()
+
+async def _warm_llm_client():
+    from utils.gemini import warm_up_client
+    # Importing the Gemini SDK is slow; keep it off the event loop
+    await asyncio.to_thread(warm_up_client)
+
+async def _warm_search_index():
+    from search_index import search_index
+    await search_index.start()
+
+WARM_UP_STEPS = {
+    "scraper_browser": _warm_scraper_browser,
+    "screenshot_browser": _warm_screenshot_browser,
+    "hn_source": _warm_hn_source,
+    "llm_client": _warm_llm_client,
+    "search_index": _warm_search_index,
+}
+
+async def _warm(name: str, step) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(step(), timeout=WARM_UP_TIMEOUT)
+        result = {"ok": True}
+    except Exception as e:
+        message = str(e).strip().splitlines()
+        result = {"ok": False, "error": message[0] if message else type(e).__name__}
+        logger.warning(f"Warm-up of {name} failed: {result['error']}")
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    WARM_UP_OK.labels(name).set(1 if result["ok"] else 0)
+    return result
+
+async def warm_up():
+    """Validate configuration, warm every component and mark the app ready.
+
+    Components are warmed concurrently. A component that fails to warm is
+    reported and the app is marked degraded but ready, since each one is
+    also started lazily on first use. Configuration errors keep the app
+    not ready.
+    """
+    started = time.perf_counter()
+    _state["phase"] = "warming"
+    _state["config_errors"] = check_config()
+    for problem in _state["config_errors"]:
+        logger.error(f"Configuration error: {problem}")
+
+    if STARTUP_WARMUP:
+        names = list(WARM_UP_STEPS)
+        results = await asyncio.gather(*(_warm(name, WARM_UP_STEPS[name]) for name in names))
+        _state["components"] = dict(zip(names, results))
+        _state["degraded"] = not all(result["ok"] for result in results)
+
+    warm_up_seconds = time.perf_counter() - started
+    time_to_ready = time.perf_counter() - _import_started
+    _state["timings"]["warm_up_s"] = round(warm_up_seconds, 3)
+    _state["timings"]["time_to_ready_s"] = round(time_to_ready, 3)
+    STARTUP_SECONDS.labels("warm_up").set(warm_up_seconds)
+    STARTUP_SECONDS.labels("time_to_ready").set(time_to_ready)
+
+    if _state["config_errors"]:
+        _state["phase"] = "misconfigured"
+    else:
+        _state["phase"] = "ready"
+        _state["ready"] = True
+    logger.info(
+        f"Startup {_state['phase']} in {time_to_ready:.2f}s "
+        f"(warm-up {warm_up_seconds:.2f}s{', degraded' if _state['degraded'] else ''})"
+    )
+
+def start_warm_up():
+    """Run warm_up() in the background so the server accepts /ready probes meanwhile."""
+    global _warm_up_task
+    if _warm_up_task is None:
+        _warm_up_task = asyncio.create_task(warm_up())
+
+async def stop_warm_up():
+    """Cancel a warm-up that is still running (on shutdown)."""
+    global _warm_up_task
+    if _warm_up_task is not None and not _warm_up_task.done():
+        _warm_up_task.cancel()
+        try:
+            await _warm_up_task
+        except asyncio.CancelledError:
+            pass
+    _warm_up_task = None
+
+def readiness() -> Dict[str, Any]:
+    """Return a snapshot of the readiness state."""
+    return {
+        **_state,
+        "config_errors": list(_state["config_errors"]),
+        "components": dict(_state["components"]),
+        "timings": dict(_state["timings"]),
+    }
@@ -0,0 +1,149 @@
+"""Process-safe story cache and cross-worker leases.
+
+This module provides:
+- Atomic reads and writes of the per-story JSON cache files
+- Leases (advisory file locks) that let exactly one worker process run the
+  pipeline for a story or take a screenshot, while others wait and then
+  reuse the result
+
+Leases are `flock` locks on files under CACHE_DIR/locks, so they are
+released automatically when the holding process exits or crashes. Within a
+process an asyncio lock per key avoids polling the file lock. The holder
+deletes the lock file before unlocking, so idle keys leave no files
+behind; a worker that locked a file which was deleted meanwhile retries on
+the current one.
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import weakref
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional
+from records import Story, decode_story, encode_story
+
+try:
+    import fcntl
+except ImportError:  # Windows: leases only coordinate within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Configure cache directory
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(__file__), "cache"))
+LOCK_DIR = os.path.join(CACHE_DIR, "locks")
+Path(LOCK_DIR).mkdir(parents=True, exist_ok=True)
+
+# How long to wait for another worker's lease before doing the work anyway
+LEASE_WAIT_TIMEOUT = float(os.getenv("LEASE_WAIT_TIMEOUT", "300"))
+LEASE_POLL_INTERVAL = 0.1
+
+_local_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def story_cache_path(hn_id: str) -> str:
+    """Return the cache file path for a story."""
+    return os.path.join(CACHE_DIR, f"{hn_id}.json")
+
+def read_story(hn_id: str) -> Optional[Story]:
+    """Read and validate a cached story.
+
+    Returns:
+        The cached story, or None if missing
+
+    Raises:
+        RecordError: If the cache file is not valid JSON or not a complete story
+    """
+    try:
+        with open(story_cache_path(hn_id), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    return decode_story(data)
+
+def atomic_write(path: str, data: bytes):
+    """Write a file so readers only ever see the old or the complete new content."""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def write_story(hn_id: str, story: Story):
+    """Atomically write a story to the cache."""
+    atomic_write(story_cache_path(hn_id), encode_story(story))
+
+def _try_flock(fd: int) -> bool:
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+def _is_current(fd: int, path: str) -> bool:
+    """Whether an open lock file is still the one at path (not deleted by its last holder)."""
+    try:
+        current = os.stat(path)
+    except FileNotFoundError:
+        return False
+    opened = os.fstat(fd)
+    return (opened.st_dev, opened.st_ino) == (current.st_dev, current.st_ino)
+
+@asynccontextmanager
+async def lease(key: str, timeout: float = LEASE_WAIT_TIMEOUT):
+    """Hold the cross-process lease for key.
+
+    Yields:
+        True if the lease had to be waited for (another worker or task held
+        it, so its result may now be available), False otherwise
+    """
+    local_lock = _local_locks.get(key)
+    if local_lock is None:
+        local_lock = asyncio.Lock()
+        _local_locks[key] = local_lock
+
+    waited = local_lock.locked()
+    async with local_lock:
+        if fcntl is None:
+            yield waited
+            return
+
+        path = os.path.join(LOCK_DIR, f"{key}.lock")
+        deadline = time.monotonic() + timeout
+        fd = None
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            if _try_flock(fd):
+                if _is_current(fd, path):
+                    break
+                # The previous holder deleted this file on release; lock the new one
+                os.close(fd)
+                fd = None
+                waited = True
+                continue
+            os.close(fd)
+            fd = None
+            waited = True
+            if time.monotonic() >= deadline:
+                logger.warning(f"Lease {key} still held after {timeout}s, proceeding without it")
+                break
+            await asyncio.sleep(LEASE_POLL_INTERVAL)
+        try:
+            yield waited
+        finally:
+            if fd is not None:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
@@ -10,206 +10,604 @@ import asyncio
 import json
 import logging
 import os
-from pathlib import Path
+import time
+from collections import Counter
+from typing import Dict, List, Optional
 from utils.scraper import scrape_hn_frontpage, scrape_full_article, scrape_hn_comments
-from utils.gemini import generate_hook_async, analyze_article_async
+from utils.gemini import generate_hook_async, analyze_article_async, HOOK_UNAVAILABLE, HOOK_ERROR, HOOK_FALLBACKS
+from utils.hn_source import get_source
 from screenshot import screenshot_manager
+from screenshot_jobs import screenshot_jobs, QueueFull
+from metrics import track_stage, CACHE_REQUESTS, STORIES_STREAMED, ACTIVE_STREAMS, DEGRADED_STORIES, BATCH_ITEMS
+from tracing import start_trace, end_trace, trace_event
+from storage import read_story, write_story, lease
+from search_index import search_index
+from deadline import Deadline, DeadlineExceeded, STORY_DEADLINE_SECONDS
+from revalidation import revalidator
+from admission import admission, wait_event
+from overload import overload, MODES, NORMAL, NO_SCREENSHOTS, HOOK_ONLY, CACHE_ONLY
+from records import Story, Comment, ArticleMetadata, Analysis, Validators, RecordError, sse_data, dumps
 
 logger = logging.getLogger(__name__)
 
-# Configure cache directory
-CACHE_DIR = os.path.join(os.path.dirname(__file__), "cache")
-Path(CACHE_DIR).mkdir(parents=True, exist_ok=True)
+# Number of thread comments offered to the prompt packer for ranking
+ANALYSIS_COMMENT_POOL = int(os.getenv("ANALYSIS_COMMENT_POOL", "50"))
 
-def is_valid_story_cache(data):
-    """Check if cached story data contains all required fields.
+# Comments shown with a story
+TOP_COMMENTS = 10
+
+# Longest the comment thread may take to load, and the time it leaves for the analysis
+COMMENTS_TIMEOUT = 15
+COMMENTS_RESERVE_SECONDS = 10
+
+# Uncached stories of one /analyze/batch request processed at once (at most)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+# Most story IDs accepted by one /analyze/batch request
+BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", "500"))
+
+def load_cached_story(hn_id: str) -> Optional[Story]:
+    """Load a story from the cache if it is present and complete.
     
     Args:
-        data: Dictionary containing cached story data
+        hn_id: Hacker News story ID
         
     Returns:
-        bool: True if all required fields are present
+        The cached story, or None if it must be (re)processed
+    """
+    try:
+        return read_story(hn_id)
+    except RecordError as e:
+        logger.warning(f"[CACHE CORRUPT/INCOMPLETE] {hn_id}: {e}, reprocessing...")
+    except Exception as e:
+        logger.warning(f"[CACHE ERROR] {hn_id}: {e}, reprocessing...")
+    CACHE_REQUESTS.labels("invalid").inc()
+    return None
+
+def load_cached_stories(hn_ids: List[str]) -> Dict[str, Optional[Story]]:
+    """Load many stories from the cache (blocking; run it in a thread).
+    
+    Returns:
+        Dictionary mapping each ID to its cached story, or None if it must be (re)processed
     """
-    required_fields = [
-        "hn_id", "title", "url", "article_url", "points", "author", "comments_count", "time",
-        "full_article_html", "article_metadata", "screenshot_path", "screenshot_error",
-        "hook", "top_comments", "analysis"
-    ]
-    return all(field in data for field in required_fields)
-
-async def stream_articles(offset: int = 0, limit: int = 10):
+    return {hn_id: load_cached_story(hn_id) for hn_id in hn_ids}
+
+def normalize_screenshot_path(story: Story) -> Story:
+    """Make sure the screenshot path points below /static/.
+    
+    A story cached before its screenshot job finished gets the screenshot
+    once it exists.
+    """
+    if story.screenshot_path and not story.screenshot_path.startswith("/static/"):
+        story.screenshot_path = "/static/screenshots/" + os.path.basename(story.screenshot_path)
+    elif not story.screenshot_path:
+        existing = screenshot_manager.existing_path(story.hn_id)
+        if existing:
+            story.screenshot_path = existing
+            story.screenshot_error = None
+            if story.degraded == MODES[NO_SCREENSHOTS]:
+                story.degraded = None
+    return story
+
+def queue_missing_screenshot(story: Story):
+    """Capture the screenshot skipped under load in the background."""
+    if story.article_url and not screenshot_manager.existing_path(story.hn_id):
+        try:
+            screenshot_jobs.submit(story.article_url, story.hn_id, "prefetch")
+        except QueueFull:
+            pass
+
+def pending_story(story, hn_id: str, has_more: bool, level: int) -> Story:
+    """Build the placeholder sent for an uncached story while only the cache is served."""
+    message = "Analysis pending: the server is under heavy load. Check back in a minute."
+    return Story(
+        hn_id=hn_id,
+        title=story.get("title", ""),
+        url=story.get("url", ""),
+        article_url=story.get("article_url", ""),
+        points=story.get("points", 0),
+        author=story.get("author", "unknown"),
+        comments_count=story.get("comments_count", 0),
+        time=story.get("time", 0),
+        full_article_html="",
+        article_metadata=ArticleMetadata.from_dict({"fetch_error": "Pending: the server is under heavy load"}),
+        screenshot_path=screenshot_manager.existing_path(hn_id),
+        screenshot_error=None,
+        hook=message,
+        top_comments=[],
+        analysis=Analysis.from_dict({
+            "analysis": message,
+            "metadata": {
+                "error": "Pending",
+                "model": "gemini-1.5-flash"
+            }
+        }),
+        has_more=has_more,
+        degraded=MODES[level]
+    )
+
+async def run_pipeline(
+    story,
+    hn_id: str,
+    has_more: bool,
+    deadline: Optional[Deadline] = None,
+    validators: Optional[Validators] = None,
+    client: Optional[str] = None,
+    level: int = NORMAL,
+    persist: bool = True
+):
+    """Run the full pipeline for one story and cache the result.
+    
+    Every stage sizes its timeouts from the deadline and degrades (skipped
+    screenshot, skipped long-document pass, shorter analysis prompt)
+    rather than overrunning it. Browser, screenshot and LLM stages wait
+    for the client's fair turn in the admission queues; long waits are
+    reported as `log` events. Under load (see overload.py) the screenshot,
+    then the analysis, are skipped and the story is marked degraded.
+    
+    Args:
+        story: Story dictionary from the frontpage
+        hn_id: Hacker News story ID
+        has_more: Whether the frontpage has more stories
+        deadline: Story deadline (a fresh STORY_DEADLINE_SECONDS one by default)
+        validators: Revalidation state to store with the story
+        client: Client key the work is accounted to (background work when None)
+        level: Service mode level to process the story in
+        persist: Whether to cache the result; callers passing False decide
+            themselves whether to keep it (see cache_story)
+        
+    Yields:
+        Server-sent `log` events followed by the processed Story
+    """
+    if deadline is None:
+        deadline = Deadline(STORY_DEADLINE_SECONDS)
+    yield f"event: log\ndata: Fetching {story['title']}...\n\n"
+    
+    # Get article content and comments
+    try:
+        async with admission.slot("browser", client, deadline) as waited:
+            event = wait_event("browser", waited)
+            if event:
+                yield event
+            with track_stage("scrape_full_article") as stage:
+                article_data = await scrape_full_article(story["article_url"], deadline=deadline)
+                if "error" in article_data:
+                    stage.fail()
+    except DeadlineExceeded as e:
+        # Not cached: the wait was caused by load, not by the article
+        article_data = {"error": f"Skipped: {e}", "skipped": {"scope": "queue", "reason": "admission"}}
+    if "error" in article_data:
+        error_msg = article_data['error']
+        logger.warning(f"Could not fetch content for '{story['title']}': {error_msg}")
+        story["full_article_html"] = ""
+        story["article_metadata"] = {"fetch_error": error_msg}
+        if article_data.get("skipped"):
+            story["article_metadata"]["skipped"] = article_data["skipped"]
+    else:
+        story["full_article_html"] = article_data["html"]
+        story["article_metadata"] = article_data["metadata"]
+    
+    # Take screenshot
+    story["screenshot_path"] = None
+    story["screenshot_error"] = None
+    try:
+        if level >= NO_SCREENSHOTS:
+            screenshot_path, error = screenshot_manager.existing_path(story["hn_id"]), None
+            if not screenshot_path:
+                trace_event("overload", stage="take_screenshot", action="skipped", mode=MODES[level])
+                error = "Skipped: the server is under heavy load"
+        else:
+            async with admission.slot("screenshot", client, deadline) as waited:
+                event = wait_event("screenshot", waited)
+                if event:
+                    yield event
+                with track_stage("take_screenshot") as stage:
+                    screenshot_path, error = await screenshot_jobs.capture(
+                        story["article_url"],
+                        story["hn_id"],
+                        deadline=deadline
+                    )
+                    if not screenshot_path:
+                        stage.fail()
+        if screenshot_path:
+            if not screenshot_path.startswith("/static/screenshots/"):
+                screenshot_path = f"/static/screenshots/{os.path.basename(screenshot_path)}"
+            story["screenshot_path"] = screenshot_path
+        else:
+            story["screenshot_error"] = error
+    except Exception as e:
+        logger.error(f"Error taking screenshot: {str(e)}")
+        story["screenshot_error"] = str(e)
+    
+    # Generate hook
+    try:
+        if story["full_article_html"]:
+            async with admission.slot("llm", client, deadline) as waited:
+                event = wait_event("llm", waited)
+                if event:
+                    yield event
+                with track_stage("generate_hook") as stage:
+                    hook = await generate_hook_async(story["full_article_html"], deadline=deadline)
+                    if hook in HOOK_FALLBACKS:
+                        stage.fail()
+            story["hook"] = hook
+        else:
+            story["hook"] = "Unable to fetch article content. Please click the link to read more."
+    except DeadlineExceeded:
+        story["hook"] = HOOK_UNAVAILABLE
+    except Exception as e:
+        logger.error(f"Error generating hook: {str(e)}")
+        story["hook"] = HOOK_ERROR
+    
+    # Get comments: one window serves both the shown comments and the analysis pool
+    analysis_comments = []
+    try:
+        async with admission.slot("browser", client, deadline) as waited:
+            event = wait_event("browser", waited)
+            if event:
+                yield event
+            with track_stage("scrape_hn_comments") as stage:
+                comments_timeout = deadline.timeout(COMMENTS_TIMEOUT, reserve=COMMENTS_RESERVE_SECONDS)
+                comments_data = await asyncio.wait_for(
+                    scrape_hn_comments(story["hn_id"], limit=max(TOP_COMMENTS, ANALYSIS_COMMENT_POOL)),
+                    timeout=comments_timeout
+                )
+                if comments_data.get("error"):
+                    stage.fail()
+        analysis_comments = comments_data["comments"]
+        story["top_comments"] = analysis_comments[:TOP_COMMENTS]
+    except asyncio.TimeoutError:
+        logger.warning(f"Comments for {hn_id} not loaded within the story deadline")
+        trace_event("deadline", stage="scrape_hn_comments", action="abandoned")
+        story["top_comments"] = []
+    except Exception as e:
+        logger.error(f"Error fetching comments: {str(e)}")
+        story["top_comments"] = []
+    
+    # Analyze with Gemini
+    yield f"event: log\ndata: Analyzing {story['title']}...\n\n"
+    try:
+        if story["full_article_html"] and level >= HOOK_ONLY:
+            trace_event("overload", stage="analyze_article", action="skipped", mode=MODES[level])
+            story["analysis"] = {
+                "analysis": "Full analysis skipped: the server is under heavy load. It is generated on a later visit.",
+                "metadata": {
+                    "error": "Skipped under load",
+                    "model": "gemini-1.5-flash"
+                }
+            }
+        elif story["full_article_html"]:
+            async with admission.slot("llm", client, deadline) as waited:
+                event = wait_event("llm", waited)
+                if event:
+                    yield event
+                with track_stage("analyze_article") as stage:
+                    analysis_result = await analyze_article_async(story["full_article_html"], analysis_comments, deadline=deadline)
+                    if analysis_result.get("metadata", {}).get("error"):
+                        stage.fail()
+            story["analysis"] = analysis_result
+        else:
+            story["analysis"] = {
+                "analysis": "Content could not be fetched for analysis.",
+                "metadata": {
+                    "error": "No content available",
+                    "model": "gemini-1.5-flash"
+                }
+            }
+    except DeadlineExceeded as e:
+        story["analysis"] = {
+            "analysis": "Analysis skipped: the story took too long to process.",
+            "metadata": {
+                "error": str(e),
+                "model": "gemini-1.5-flash"
+            }
+        }
+    except Exception as e:
+        error_msg = f"Error analyzing article: {str(e)}"
+        logger.error(error_msg)
+        story["analysis"] = {
+            "analysis": error_msg,
+            "metadata": {
+                "error": str(e),
+                "model": "gemini-1.5-flash"
+            }
+        }
+    
+    trace_event("deadline", stage="story", **deadline.to_dict())
+    
+    # Prepare story data
+    story_data = Story(
+        hn_id=hn_id,
+        title=story.get("title", ""),
+        url=story.get("url", ""),
+        article_url=story.get("article_url", ""),
+        points=story.get("points", 0),
+        author=story.get("author", "unknown"),
+        comments_count=story.get("comments_count", 0),
+        time=story.get("time", 0),
+        full_article_html=story.get("full_article_html", ""),
+        article_metadata=ArticleMetadata.from_dict(story.get("article_metadata", {})),
+        screenshot_path=story.get("screenshot_path"),
+        screenshot_error=story.get("screenshot_error"),
+        hook=story.get("hook", ""),
+        top_comments=[Comment.from_dict(c) for c in story.get("top_comments", [])],
+        analysis=Analysis.from_dict(story.get("analysis", {})),
+        has_more=has_more,
+        validators=validators,
+        degraded=MODES[level] if level > NORMAL else None
+    )
+    if level > NORMAL:
+        DEGRADED_STORIES.labels(MODES[level]).inc()
+    
+    # Save to cache (atomically, so other workers never read a partial file).
+    # Stories skipped by the host negative cache are not cached, so they are
+    # fetched again once the back-off expires.
+    if persist and not article_data.get("skipped"):
+        cache_story(hn_id, story_data)
+        
+    yield normalize_screenshot_path(story_data)
+
+def cache_story(hn_id: str, story_data: Story):
+    """Write a processed story to the cache and the search index."""
+    try:
+        write_story(hn_id, story_data)
+        search_index.add(story_data)
+    except Exception as e:
+        logger.error(f"[CACHE WRITE ERROR] {hn_id}: {e}")
+
+async def process_story(
+    story,
+    hn_id: str,
+    has_more: bool,
+    deadline: Optional[Deadline] = None,
+    validators: Optional[Validators] = None,
+    client: Optional[str] = None,
+    level: int = NORMAL
+):
+    """Run the full pipeline for one story (see run_pipeline) and send it as an event.
+    
+    Yields:
+        Server-sent `log` events followed by the story data event
+    """
+    async for item in run_pipeline(story, hn_id, has_more, deadline, validators, client, level):
+        if isinstance(item, Story):
+            STORIES_STREAMED.labels("pipeline").inc()
+            item = sse_data(item)
+        yield item
+
+async def stream_articles(offset: int = 0, limit: int = 10, trace: bool = False, client: Optional[str] = None):
     """Stream articles with analysis results as server-sent events.
     
+    Every story gets a span timeline that is written to the structured
+    log; with trace enabled it is also sent as a `trace` event after the
+    story.
+    
+    A story missing from the cache is processed under its lease, so when
+    several workers stream the same story only one runs the pipeline and
+    the others serve the result it cached. Each processed story gets a
+    STORY_DEADLINE_SECONDS deadline shared by all of its stages.
+    
+    The service mode is read for every story: under load stories are
+    processed degraded, or a pending placeholder is sent for uncached
+    ones. The `complete` event reports the mode and the number of
+    degraded stories sent.
+    
     Args:
         offset: Number of stories to skip
         limit: Maximum number of stories to process
+        trace: Emit per-story `trace` events
+        client: Client key for admission control
         
     Yields:
         Server-sent events with article data and analysis
     """
+    ACTIVE_STREAMS.inc()
     try:
         logger.info(f"Starting to stream articles with offset={offset}, limit={limit}")
         
         # Get stories from HN frontpage
-        frontpage_data = await scrape_hn_frontpage(limit=limit, offset=offset)
+        with track_stage("scrape_hn_frontpage"):
+            frontpage_data = await scrape_hn_frontpage(limit=limit, offset=offset)
         stories = frontpage_data["stories"]
+        degraded_stories = 0
         
         for story in stories:
+            story_trace = None
             try:
                 hn_id = str(story.get("id", story.get("hn_id", "")))
                 if not hn_id:
                     logger.error(f"Story missing ID: {story}")
                     continue
-                    
-                cache_path = os.path.join(CACHE_DIR, f"{hn_id}.json")
-                cache_hit = False
-                story_data = None
+                story_trace = start_trace(hn_id)
                 
-                # Check cache for existing story data
-                if os.path.exists(cache_path):
-                    try:
-                        with open(cache_path, "r", encoding="utf-8") as f:
-                            cached = json.load(f)
-                        if is_valid_story_cache(cached):
-                            cache_hit = True
-                            story_data = cached
-                        else:
-                            logger.warning(f"[CACHE CORRUPT/INCOMPLETE] {hn_id}, reprocessing...")
-                    except Exception as e:
-                        logger.warning(f"[CACHE ERROR] {hn_id}: {e}, reprocessing...")
+                # Check cache for existing story data; a story produced
+                # under load is completed once there is capacity again
+                level = overload.level
+                story_data = load_cached_story(hn_id)
+                decision = "hit" if story_data is not None else "miss"
+                if story_data is not None and story_data.degraded and level < MODES.index(story_data.degraded):
+                    if story_data.degraded == MODES[NO_SCREENSHOTS]:
+                        queue_missing_screenshot(story_data)
+                    else:
+                        decision, story_data = "degraded", None
+                cache_hit = story_data is not None
+                CACHE_REQUESTS.labels(decision).inc()
+                story_trace.event("cache", decision=decision)
                 
-                if not cache_hit:
+                if not cache_hit and level >= CACHE_ONLY:
+                    story_trace.event("overload", action="placeholder", mode=MODES[level])
+                    STORIES_STREAMED.labels("placeholder").inc()
+                    DEGRADED_STORIES.labels(MODES[level]).inc()
+                    degraded_stories += 1
+                    yield sse_data(pending_story(story, hn_id, frontpage_data["has_more"], level))
+                elif not cache_hit:
                     try:
-                        yield f"event: log\ndata: Fetching {story['title']}...\n\n"
-                        
-                        # Get article content and comments
-                        article_data = await scrape_full_article(story["article_url"])
-                        if "error" in article_data:
-                            error_msg = article_data['error']
-                            logger.warning(f"Could not fetch content for '{story['title']}': {error_msg}")
-                            story["full_article_html"] = ""
-                            story["article_metadata"] = {}
-                        else:
-                            story["full_article_html"] = article_data["html"]
-                            story["article_metadata"] = article_data["metadata"]
-                        
-                        # Take screenshot
-                        story["screenshot_path"] = None
-                        story["screenshot_error"] = None
-                        try:
-                            screenshot_path, error = await screenshot_manager.take_screenshot(
-                                story["article_url"],
-                                story["hn_id"]
-                            )
-                            if screenshot_path:
-                                if not screenshot_path.startswith("/static/screenshots/"):
-                                    screenshot_path = f"/static/screenshots/{os.path.basename(screenshot_path)}"
-                                story["screenshot_path"] = screenshot_path
-                            else:
-                                story["screenshot_error"] = error
-                        except Exception as e:
-                            logger.error(f"Error taking screenshot: {str(e)}")
-                            story["screenshot_error"] = str(e)
-                        
-                        # Generate hook
-                        try:
-                            if story["full_article_html"]:
-                                hook = await generate_hook_async(story["full_article_html"])
-                                story["hook"] = hook
-                            else:
-                                story["hook"] = "Unable to fetch article content. Please click the link to read more."
-                        except Exception as e:
-                            logger.error(f"Error generating hook: {str(e)}")
-                            story["hook"] = "There was an error processing this article. Please click the link to read more."
-                        
-                        # Get comments
-                        try:
-                            comments_data = await scrape_hn_comments(story["hn_id"])
-                            story["top_comments"] = comments_data["comments"]
-                        except Exception as e:
-                            logger.error(f"Error fetching comments: {str(e)}")
-                            story["top_comments"] = []
-                        
-                        # Analyze with Gemini
-                        yield f"event: log\ndata: Analyzing {story['title']}...\n\n"
-                        try:
-                            if story["full_article_html"]:
-                                analysis_result = await analyze_article_async(story["full_article_html"], story["top_comments"])
-                                story["analysis"] = analysis_result
-                            else:
-                                story["analysis"] = {
-                                    "analysis": "Content could not be fetched for analysis.",
-                                    "metadata": {
-                                        "error": "No content available",
-                                        "model": "gemini-1.5-flash"
-                                    }
-                                }
-                        except Exception as e:
-                            error_msg = f"Error analyzing article: {str(e)}"
-                            logger.error(error_msg)
-                            story["analysis"] = {
-                                "analysis": error_msg,
-                                "metadata": {
-                                    "error": str(e),
-                                    "model": "gemini-1.5-flash"
-                                }
-                            }
-                        
-                        # Prepare story data
-                        story["has_more"] = frontpage_data["has_more"]
-                        story_data = {
-                            "hn_id": hn_id,
-                            "title": story.get("title", ""),
-                            "url": story.get("url", ""),
-                            "article_url": story.get("article_url", ""),
-                            "points": story.get("points", 0),
-                            "author": story.get("author", "unknown"),
-                            "comments_count": story.get("comments_count", 0),
-                            "time": story.get("time", 0),
-                            "full_article_html": story.get("full_article_html", ""),
-                            "article_metadata": story.get("article_metadata", {}),
-                            "screenshot_path": story.get("screenshot_path"),
-                            "screenshot_error": story.get("screenshot_error"),
-                            "hook": story.get("hook", ""),
-                            "top_comments": story.get("top_comments", []),
-                            "analysis": story.get("analysis", {}),
-                            "has_more": story.get("has_more", False)
-                        }
-                        
-                        # Save to cache
-                        try:
-                            with open(cache_path, "w", encoding="utf-8") as f:
-                                json.dump(story_data, f, ensure_ascii=False)
-                        except Exception as e:
-                            logger.error(f"[CACHE WRITE ERROR] {hn_id}: {e}")
-                            
-                        # Ensure screenshot path is correct
-                        if story_data.get("screenshot_path") and not story_data["screenshot_path"].startswith("/static/"):
-                            story_data["screenshot_path"] = "/static/screenshots/" + os.path.basename(story_data["screenshot_path"])
-                            
-                        yield f"data: {json.dumps(story_data)}\n\n"
-                        await asyncio.sleep(0.1)  # Prevent overwhelming client
-                        
+                        async with lease(f"story-{hn_id}") as waited:
+                            if waited:
+                                # Another worker held the lease; use its result if it cached one
+                                story_data = load_cached_story(hn_id)
+                                trace_event("lease", key=f"story-{hn_id}", shared=story_data is not None)
+                            if story_data is None:
+                                deadline = Deadline(STORY_DEADLINE_SECONDS)
+                                async for event in process_story(story, hn_id, frontpage_data["has_more"], deadline, client=client, level=level):
+                                    yield event
+                                if level > NORMAL:
+                                    degraded_stories += 1
+                                await asyncio.sleep(0.1)  # Prevent overwhelming client
                     except Exception as e:
                         error_msg = f"Error processing story {story.get('title', 'unknown')}: {str(e)}"
                         logger.error(error_msg)
                         yield f"event: error\ndata: {json.dumps({'error': error_msg, 'title': story.get('title', 'unknown')})}\n\n"
-                        continue
-                else:
-                    # Handle cached story
-                    if story_data.get("screenshot_path") and not story_data["screenshot_path"].startswith("/static/"):
-                        story_data["screenshot_path"] = "/static/screenshots/" + os.path.basename(story_data["screenshot_path"])
-                    yield f"data: {json.dumps(story_data)}\n\n"
+                
+                if story_data is not None:
+                    # Handle cached story; if it is due, check the article for changes in the background
+                    if cache_hit and revalidator.schedule(story_data):
+                        story_trace.event("revalidate", action="scheduled")
+                    STORIES_STREAMED.labels("cache").inc()
+                    story_data = normalize_screenshot_path(story_data)
+                    if story_data.degraded:
+                        degraded_stories += 1
+                    yield sse_data(story_data)
                     
             except Exception as e:
                 error_msg = f"Error processing story: {str(e)}"
                 logger.error(error_msg)
                 yield f"event: error\ndata: {json.dumps({'error': error_msg})}\n\n"
+            finally:
+                if story_trace is not None:
+                    end_trace()
+                    story_trace.log()
+            if trace and story_trace is not None:
+                yield f"event: trace\ndata: {json.dumps(story_trace.to_dict())}\n\n"
                 
         # Send completion event
-        yield f"event: complete\ndata: {json.dumps({'has_more': frontpage_data['has_more']})}\n\n"
+        complete = {"has_more": frontpage_data["has_more"], "mode": overload.mode, "degraded_stories": degraded_stories}
+        yield f"event: complete\ndata: {json.dumps(complete)}\n\n"
                 
     except Exception as e:
         error_msg = f"Stream error: {str(e)}"
         logger.error(error_msg)
-        yield f"event: error\ndata: {json.dumps({'error': error_msg})}\n\n"
\ No newline at end of file
+        yield f"event: error\ndata: {json.dumps({'error': error_msg})}\n\n"
+    finally:
+        ACTIVE_STREAMS.dec()
+
+def batch_line(obj) -> bytes:
+    """Format one NDJSON line of a batch response."""
+    return dumps(obj) + b"\n"
+
+async def _batch_story(hn_id: str, story: Optional[dict], slots: asyncio.Semaphore, client: Optional[str], level: int) -> dict:
+    """Process one uncached story of a batch and return its result line."""
+    if story is None:
+        return {"hn_id": hn_id, "status": "not_found"}
+    async with slots:
+        story_trace = start_trace(hn_id)
+        try:
+            story_data = None
+            async with lease(f"story-{hn_id}") as waited:
+                if waited:
+                    story_data = load_cached_story(hn_id)
+                    trace_event("lease", key=f"story-{hn_id}", shared=story_data is not None)
+                if story_data is not None:
+                    STORIES_STREAMED.labels("cache").inc()
+                    return {"hn_id": hn_id, "status": "cached", "story": normalize_screenshot_path(story_data).to_dict()}
+                async for item in run_pipeline(story, hn_id, False, Deadline(STORY_DEADLINE_SECONDS), client=client, level=level):
+                    if isinstance(item, Story):
+                        story_data = item
+            STORIES_STREAMED.labels("pipeline").inc()
+            return {"hn_id": hn_id, "status": "processed", "story": story_data.to_dict()}
+        except Exception as e:
+            logger.error(f"Error processing story {hn_id} in batch: {e}")
+            return {"hn_id": hn_id, "status": "error", "error": str(e) or type(e).__name__}
+        finally:
+            end_trace()
+            story_trace.log()
+
+async def analyze_batch(hn_ids: List[int], concurrency: int = BATCH_CONCURRENCY, client: Optional[str] = None):
+    """Return processed stories for a list of HN IDs as NDJSON lines.
+    
+    Cached stories are read in one pass and sent first. The rest are run
+    through the pipeline, at most `concurrency` at a time, and sent in the
+    order they finish. Each line has the story's `hn_id` and a `status`:
+    cached, processed, pending (only the cache is served under load),
+    not_found or error. Stories come with the same fields as /analyze
+    events; unlike /analyze, cached stories are not revalidated. A last
+    line with status `complete` has per-status counts and the service
+    mode.
+    
+    Args:
+        hn_ids: Hacker News story IDs (duplicates are sent once)
+        concurrency: Uncached stories processed at once
+        client: Client key for admission control
+        
+    Yields:
+        NDJSON lines (bytes)
+    """
+    started = time.perf_counter()
+    counts: Counter = Counter()
+    tasks: List[asyncio.Task] = []
+    ACTIVE_STREAMS.inc()
+    try:
+        ids = [str(hn_id) for hn_id in dict.fromkeys(hn_ids)]
+        level = overload.level
+        cached = await asyncio.to_thread(load_cached_stories, ids)
+        misses = []
+        for hn_id in ids:
+            story_data = cached[hn_id]
+            decision = "hit" if story_data is not None else "miss"
+            if story_data is not None and story_data.degraded and level < MODES.index(story_data.degraded):
+                if story_data.degraded == MODES[NO_SCREENSHOTS]:
+                    queue_missing_screenshot(story_data)
+                else:
+                    decision, story_data = "degraded", None
+            CACHE_REQUESTS.labels(decision).inc()
+            if story_data is None:
+                misses.append(hn_id)
+                continue
+            # Bulk reads don't schedule revalidation: one batch could start hundreds of article fetches
+            STORIES_STREAMED.labels("cache").inc()
+            counts["cached"] += 1
+            yield batch_line({"hn_id": hn_id, "status": "cached", "story": normalize_screenshot_path(story_data).to_dict()})
+        
+        if misses and level >= CACHE_ONLY:
+            DEGRADED_STORIES.labels(MODES[level]).inc(len(misses))
+            for hn_id in misses:
+                counts["pending"] += 1
+                yield batch_line({"hn_id": hn_id, "status": "pending", "error": "The server is under heavy load; retry later"})
+        elif misses:
+            try:
+                with track_stage("fetch_hn_stories"):
+                    stories = await get_source().stories([int(hn_id) for hn_id in misses])
+            except Exception as e:
+                logger.error(f"Error fetching HN stories for batch: {e}")
+                for hn_id in misses:
+                    counts["error"] += 1
+                    yield batch_line({"hn_id": hn_id, "status": "error", "error": f"Could not fetch story: {e}"})
+                misses, stories = [], {}
+            slots = asyncio.Semaphore(max(1, concurrency))
+            tasks = [
+                asyncio.create_task(_batch_story(hn_id, stories.get(int(hn_id)), slots, client, level))
+                for hn_id in misses
+            ]
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                counts[result["status"]] += 1
+                yield batch_line(result)
+        
+        for status, count in counts.items():
+            BATCH_ITEMS.labels(status).inc(count)
+        yield batch_line({
+            "status": "complete",
+            "counts": dict(counts),
+            "mode": overload.mode,
+            "took_s": round(time.perf_counter() - started, 3),
+        })
+    except Exception as e:
+        logger.error(f"Batch error: {e}")
+        yield batch_line({"status": "error", "error": f"Batch error: {e}"})
+    finally:
+        # The client went away or the batch failed: stop the stories still queued or running
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        ACTIVE_STREAMS.dec()
@@ -0,0 +1,30 @@
+"""Local stand-in servers for tests and benchmarks.
+
+This package provides small HTTP servers that replay recorded fixtures so
+the backend can be exercised without reaching external services:
+- hn_api: the Hacker News JSON item API
+- hn_site: news.ycombinator.com frontpage and item pages
+- articles: article sites built from the saved pages in backend/cache
+- gemini: the Gemini generateContent REST endpoint
+- images: an image origin for the image proxy
+"""
+
+import threading
+from http.server import ThreadingHTTPServer
+from typing import Tuple
+
+def serve_in_thread(handler, port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Serve handler on localhost from a daemon thread.
+
+    Args:
+        handler: BaseHTTPRequestHandler subclass
+        port: Port to bind (0 picks a free port)
+
+    Returns:
+        Tuple of (server, base_url)
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
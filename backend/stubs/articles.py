@@ -0,0 +1,143 @@
+"""Stub article sites built from the saved pages in backend/cache.
+
+Serves /a/<hn_id> as a full HTML document around the cached
+`full_article_html` of that story. Absolute resource URLs are rewritten to
+/asset so a render never leaves the machine; /asset answers with a tiny
+image. Stories cached without content get a generated long-form article.
+Pages carry an ETag and answer a matching If-None-Match with 304; replace
+an entry of the handler's `pages` to simulate an article changing.
+Run standalone with:
+
+    python -m stubs.articles --port 8013
+"""
+
+import argparse
+import base64
+import hashlib
+import html
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from stubs import serve_in_thread
+
+CACHE_FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache")
+
+# 1x1 transparent GIF
+PIXEL_GIF = base64.b64decode("R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7")
+
+_ABSOLUTE_URL_RE = re.compile(r'(\b(?:src|srcset|poster|data-src)=")https?://[^"]*(")')
+
+FILLER_PARAGRAPH = (
+    "This stand-in article exists so the pipeline has something substantial to "
+    "extract, screenshot and analyze. It repeats a few sentences about systems "
+    "engineering, latency budgets and the trade-offs of caching so that content "
+    "validation and summarization see realistic text lengths."
+)
+
+def build_page(story: dict) -> str:
+    """Wrap a cached story's article HTML in a complete document."""
+    metadata = story.get("article_metadata") or {}
+    title = html.escape(metadata.get("title") or story.get("title", ""))
+    description = html.escape(metadata.get("description", ""))
+    body = story.get("full_article_html") or ""
+    if not body:
+        paragraphs = "".join(f"<p>{FILLER_PARAGRAPH}</p>" for _ in range(40))
+        body = f"<article><h1>{html.escape(story.get('title', ''))}</h1>{paragraphs}</article>"
+    body = _ABSOLUTE_URL_RE.sub(r"\1/asset\2", body)
+    return (
+        "<!DOCTYPE html><html><head>"
+        f"<title>{title}</title>"
+        f'<meta name="description" content="{description}">'
+        "</head><body>"
+        f"{body}"
+        "</body></html>"
+    )
+
+def load_pages(cache_dir: str = CACHE_FIXTURES_DIR) -> Dict[str, bytes]:
+    """Render every cached story into a page keyed by hn_id."""
+    pages = {}
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(cache_dir, name), encoding="utf-8") as f:
+                story = json.load(f)
+        except (OSError, ValueError):
+            continue
+        pages[str(story.get("hn_id", name[:-5]))] = build_page(story).encode("utf-8")
+    return pages
+
+class ArticleHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    pages: Dict[str, bytes] = {}
+    latency: float = 0.0
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith("/asset"):
+            self._send(200, PIXEL_GIF, "image/gif")
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        page = self.pages.get(path[len("/a/"):]) if path.startswith("/a/") else None
+        if page is None:
+            self._send(404, b"<html><body>Not here.</body></html>", "text/html; charset=utf-8")
+            return
+        etag = f'"{hashlib.sha1(page).hexdigest()[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+        else:
+            self._send(200, page, "text/html; charset=utf-8", etag)
+
+    def _send(self, status: int, body: bytes, content_type: str, etag: Optional[str] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(port: int = 0, latency: float = 0.0, cache_dir: str = CACHE_FIXTURES_DIR):
+    """Start the article stub in a background thread.
+
+    Args:
+        port: Port to bind on localhost (0 picks a free port)
+        latency: Artificial delay in seconds before each article response
+        cache_dir: Directory of cached story JSON files
+
+    Returns:
+        Tuple of (server, base_url)
+    """
+    handler = type("StubArticleHandler", (ArticleHandler,), {
+        "pages": load_pages(cache_dir),
+        "latency": latency,
+    })
+    return serve_in_thread(handler, port)
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Serve cached articles as stand-in sites")
+    parser.add_argument("--port", type=int, default=8013)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    server, base_url = start_server(args.port, args.latency)
+    print(f"Article stub serving at {base_url}/a/<hn_id>")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
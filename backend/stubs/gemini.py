@@ -0,0 +1,117 @@
+"""Stub of the Gemini generateContent REST endpoint.
+
+Answers POST /v1beta/models/<model>:generateContent with canned text after
+a configurable latency, including usageMetadata token counts. Point the
+backend at it with GEMINI_API_BASE. Run standalone with:
+
+    python -m stubs.gemini --port 8014 --latency 0.8
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from typing import Optional
+
+from stubs import serve_in_thread
+
+CANNED_HOOK = (
+    "A stand-in model read this article and found it worth your time. "
+    "It raises a concrete technical question and answers it with data."
+)
+
+CANNED_ANALYSIS = """1. Summary (2-3 sentences):
+The article describes a technical result and the reasoning behind it.
+
+2. Key Points:
+- The central claim is supported by measurements.
+- Trade-offs are discussed openly.
+
+3. Discussion Highlights:
+Commenters debate the methodology and share related experience."""
+
+class GeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency: float = 0.5
+    jitter: float = 0.2
+    error_rate: float = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        prompt = "".join(
+            part.get("text", "")
+            for content in payload.get("contents", [])
+            for part in content.get("parts", [])
+        )
+
+        delay = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        if delay:
+            time.sleep(delay)
+
+        if self.error_rate and random.random() < self.error_rate:
+            self._send(429, {"error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}})
+            return
+
+        text = CANNED_ANALYSIS if "Analyze this technical article" in prompt else CANNED_HOOK
+        self._send(200, {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": text}]},
+                "finishReason": "STOP"
+            }],
+            "usageMetadata": {
+                "promptTokenCount": len(prompt) // 4,
+                "candidatesTokenCount": len(text) // 4,
+                "totalTokenCount": (len(prompt) + len(text)) // 4
+            }
+        })
+
+    def _send(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(port: int = 0, latency: float = 0.5, jitter: float = 0.2, error_rate: float = 0.0):
+    """Start the Gemini stub in a background thread.
+
+    Args:
+        port: Port to bind on localhost (0 picks a free port)
+        latency: Mean response latency in seconds
+        jitter: Uniform +/- jitter around the latency in seconds
+        error_rate: Fraction of calls answered with HTTP 429
+
+    Returns:
+        Tuple of (server, base_url) where base_url is suitable for GEMINI_API_BASE
+    """
+    handler = type("StubGeminiHandler", (GeminiHandler,), {
+        "latency": latency,
+        "jitter": jitter,
+        "error_rate": error_rate,
+    })
+    return serve_in_thread(handler, port)
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Serve a stand-in Gemini endpoint")
+    parser.add_argument("--port", type=int, default=8014)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    server, base_url = start_server(args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Gemini stub serving at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
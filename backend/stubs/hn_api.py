@@ -0,0 +1,102 @@
+"""Stub of the Hacker News JSON item API.
+
+Serves recorded items from stubs/fixtures/hn_api with the same URL layout as
+https://hacker-news.firebaseio.com/v0, so APISource can be pointed at it via
+HN_API_BASE. Run standalone with:
+
+    python -m stubs.hn_api --port 8011
+"""
+
+import argparse
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+from stubs import serve_in_thread
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "hn_api")
+
+def load_fixtures(fixtures_dir: str = FIXTURES_DIR) -> dict:
+    """Load every recorded response, keyed by request path.
+
+    Args:
+        fixtures_dir: Directory containing topstories.json and <id>.json items
+
+    Returns:
+        Dictionary mapping API paths to encoded JSON bodies
+    """
+    responses = {}
+    for name in os.listdir(fixtures_dir):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(fixtures_dir, name), "rb") as f:
+            body = f.read()
+        if name == "topstories.json":
+            responses["/v0/topstories.json"] = body
+        else:
+            responses[f"/v0/item/{name}"] = body
+    return responses
+
+class HNAPIHandler(BaseHTTPRequestHandler):
+    """Replays fixtures; unknown items return `null` like the real API."""
+
+    protocol_version = "HTTP/1.1"
+    responses: dict = {}
+    latency: float = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.path.split("?", 1)[0]
+        body = self.responses.get(path)
+        if body is None:
+            body = b"null"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(
+    port: int = 0,
+    fixtures_dir: str = FIXTURES_DIR,
+    latency: float = 0.0
+) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the stub in a background thread.
+
+    Args:
+        port: Port to bind on localhost (0 picks a free port)
+        fixtures_dir: Directory of recorded responses
+        latency: Artificial delay in seconds added to every response
+
+    Returns:
+        Tuple of (server, base_url) where base_url is suitable for HN_API_BASE
+    """
+    handler = type("StubHNAPIHandler", (HNAPIHandler,), {
+        "responses": load_fixtures(fixtures_dir),
+        "latency": latency,
+    })
+    server, base_url = serve_in_thread(handler, port)
+    return server, f"{base_url}/v0"
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Serve recorded HN API fixtures")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of delay per response")
+    args = parser.parse_args(argv)
+
+    server, base_url = start_server(args.port, args.fixtures, args.latency)
+    print(f"HN API stub serving {args.fixtures} at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Stub of the news.ycombinator.com HTML site.
+
+Renders frontpage (/ and /news?p=N) and item (/item?id=N) pages from the
+recorded item fixtures in stubs/fixtures/hn_api, using the markup the
+Playwright scraper expects. Point the HTML source at it via HN_BASE_URL.
+Run standalone with:
+
+    python -m stubs.hn_site --port 8012 --articles http://127.0.0.1:8013
+"""
+
+import argparse
+import html
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from stubs import serve_in_thread
+from stubs.hn_api import FIXTURES_DIR
+
+STORIES_PER_PAGE = 30
+
+# Synthetic story ids for replicated fixtures start here
+SYNTHETIC_ID_BASE = 45000000
+
+def load_items(fixtures_dir: str = FIXTURES_DIR) -> Dict[int, dict]:
+    """Load all recorded items keyed by id."""
+    items = {}
+    for name in os.listdir(fixtures_dir):
+        if name.endswith(".json") and name != "topstories.json":
+            with open(os.path.join(fixtures_dir, name), encoding="utf-8") as f:
+                item = json.load(f)
+            items[item["id"]] = item
+    return items
+
+def load_top_ids(fixtures_dir: str = FIXTURES_DIR) -> List[int]:
+    with open(os.path.join(fixtures_dir, "topstories.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+def build_frontpage(
+    story_count: Optional[int] = None,
+    articles_base: Optional[str] = None,
+    fixtures_dir: str = FIXTURES_DIR
+) -> List[dict]:
+    """Build the list of frontpage stories, replicating fixtures if needed.
+
+    Args:
+        story_count: Number of stories to list (defaults to the recorded ones)
+        articles_base: Base URL of stubs.articles; story links point there
+            instead of the original sites when given
+        fixtures_dir: Directory of recorded items
+
+    Returns:
+        Story dictionaries with id, fixture_id, title, url, by, score, descendants
+    """
+    items = load_items(fixtures_dir)
+    top_ids = load_top_ids(fixtures_dir)
+    if story_count is None:
+        story_count = len(top_ids)
+
+    stories = []
+    for i in range(story_count):
+        fixture_id = top_ids[i % len(top_ids)]
+        fixture = items[fixture_id]
+        story_id = fixture_id if i < len(top_ids) else SYNTHETIC_ID_BASE + i
+        url = fixture.get("url", "")
+        if articles_base:
+            url = f"{articles_base}/a/{fixture_id}?story={story_id}"
+        stories.append({
+            "id": story_id,
+            "fixture_id": fixture_id,
+            "title": fixture.get("title", ""),
+            "url": url,
+            "by": fixture.get("by", "unknown"),
+            "score": fixture.get("score", 0),
+            "descendants": fixture.get("descendants", 0),
+        })
+    return stories
+
+def render_frontpage(stories: List[dict], page: int) -> str:
+    start = (page - 1) * STORIES_PER_PAGE
+    rows = []
+    for story in stories[start:start + STORIES_PER_PAGE]:
+        rows.append(
+            f'<tr class="athing" id="{story["id"]}"><td class="title">'
+            f'<span class="titleline"><a href="{html.escape(story["url"])}">{html.escape(story["title"])}</a></span>'
+            f'</td></tr>'
+            f'<tr><td class="subtext"><span class="subline">'
+            f'<span class="score" id="score_{story["id"]}">{story["score"]} points</span> by '
+            f'<a href="user?id={story["by"]}" class="hnuser">{story["by"]}</a> | '
+            f'<a href="item?id={story["id"]}">{story["descendants"]} comments</a>'
+            f'</span></td></tr>'
+        )
+    more = ""
+    if start + STORIES_PER_PAGE < len(stories):
+        more = f'<tr><td class="title"><a href="news?p={page + 1}" class="morelink" rel="next">More</a></td></tr>'
+    return f"<html><head><title>Hacker News</title></head><body><table>{''.join(rows)}{more}</table></body></html>"
+
+def render_item(items: Dict[int, dict], fixture_id: int) -> str:
+    rows = []
+    story = items.get(fixture_id, {})
+    stack = [(kid, 0) for kid in reversed(story.get("kids", []))]
+    while stack:
+        item_id, depth = stack.pop()
+        item = items.get(item_id)
+        if item is None:
+            continue
+        rows.append(
+            f'<tr class="athing comtr" id="{item_id}"><td><table><tr>'
+            f'<td class="ind" indent="{depth}"><img src="s.gif" height="1" width="{depth * 40}"></td>'
+            f'<td class="default"><div class="comhead"><a href="user?id={item.get("by", "")}" class="hnuser">{item.get("by", "")}</a></div>'
+            f'<div class="comment"><div class="commtext c00">{item.get("text", "")}</div></div></td>'
+            f'</tr></table></td></tr>'
+        )
+        for kid in reversed(item.get("kids", [])):
+            stack.append((kid, depth + 1))
+    title = html.escape(story.get("title", ""))
+    return f"<html><head><title>{title} | Hacker News</title></head><body><table class=\"comment-tree\">{''.join(rows)}</table></body></html>"
+
+class HNSiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    items: Dict[int, dict] = {}
+    stories: List[dict] = []
+    latency: float = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        if parsed.path in ("/", "/news"):
+            page = int(query.get("p", ["1"])[0])
+            self._send(200, render_frontpage(self.stories, page))
+        elif parsed.path == "/item":
+            story_id = int(query.get("id", ["0"])[0])
+            fixture_id = next((s["fixture_id"] for s in self.stories if s["id"] == story_id), story_id)
+            self._send(200, render_item(self.items, fixture_id))
+        else:
+            self._send(404, "<html><body>Unknown.</body></html>")
+
+    def _send(self, status: int, body: str):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(
+    port: int = 0,
+    story_count: Optional[int] = None,
+    articles_base: Optional[str] = None,
+    latency: float = 0.0,
+    fixtures_dir: str = FIXTURES_DIR
+):
+    """Start the stub site in a background thread.
+
+    Args:
+        port: Port to bind on localhost (0 picks a free port)
+        story_count: Number of frontpage stories (fixtures are replicated)
+        articles_base: Base URL of stubs.articles for story links
+        latency: Artificial delay in seconds added to every response
+        fixtures_dir: Directory of recorded items
+
+    Returns:
+        Tuple of (server, base_url) where base_url is suitable for HN_BASE_URL
+    """
+    handler = type("StubHNSiteHandler", (HNSiteHandler,), {
+        "items": load_items(fixtures_dir),
+        "stories": build_frontpage(story_count, articles_base, fixtures_dir),
+        "latency": latency,
+    })
+    return serve_in_thread(handler, port)
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Serve a recorded news.ycombinator.com")
+    parser.add_argument("--port", type=int, default=8012)
+    parser.add_argument("--stories", type=int, default=None, help="number of frontpage stories")
+    parser.add_argument("--articles", default=None, help="base URL of the article stub")
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    server, base_url = start_server(args.port, args.stories, args.articles, args.latency)
+    print(f"HN site stub serving at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
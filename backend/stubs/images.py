@@ -0,0 +1,141 @@
+"""Stub image origin for the image proxy.
+
+Serves generated images so the proxy can be exercised without reaching
+third-party sites:
+- /img/<width>x<height>.png: an opaque gradient PNG of that size
+- /img/<width>x<height>-alpha.png: the same with an alpha channel
+- /img/pixel.gif: a 1x1 GIF
+- /img/missing: 404
+- /img/not-an-image: an HTML page
+- /img/huge: a response declaring more bytes than the proxy accepts
+- /img/redirect?to=<path>: a 302 to another path
+
+Every request is counted in `hits` (by path) so callers can check that an
+image was fetched only once. Run standalone with:
+
+    python -m stubs.images --port 8015
+"""
+
+import argparse
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from stubs import serve_in_thread
+from stubs.articles import PIXEL_GIF
+
+MAX_DIMENSION = 4000
+
+_PNG_PATH_RE = re.compile(r"^/img/(\d+)x(\d+)(-alpha)?\.png$")
+
+def make_png(width: int, height: int, alpha: bool = False) -> bytes:
+    """Encode a gradient PNG without third-party libraries."""
+    rows = []
+    for y in range(height):
+        row = bytearray([0])  # filter type: none
+        shade = y * 255 // max(1, height - 1)
+        for x in range(width):
+            pixel = (x * 255 // max(1, width - 1), shade, 128)
+            row.extend(pixel + ((255 if (x // 16 + y // 16) % 2 else 96),) if alpha else pixel)
+        rows.append(bytes(row))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6 if alpha else 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(b"".join(rows), 6))
+        + chunk(b"IEND", b"")
+    )
+
+class ImageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency: float = 0.0
+    hits: Counter = Counter()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        with self.lock:
+            self.hits[path] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        match = _PNG_PATH_RE.match(path)
+        if match:
+            width, height = int(match.group(1)), int(match.group(2))
+            if 0 < width <= MAX_DIMENSION and 0 < height <= MAX_DIMENSION:
+                self._send(200, make_png(width, height, bool(match.group(3))), "image/png")
+                return
+        elif path == "/img/pixel.gif":
+            self._send(200, PIXEL_GIF, "image/gif")
+            return
+        elif path == "/img/not-an-image":
+            self._send(200, b"<html><body>Hot-linking is not allowed.</body></html>", "text/html; charset=utf-8")
+            return
+        elif path == "/img/redirect":
+            self.send_response(302)
+            self.send_header("Location", parse_qs(parsed.query).get("to", ["/img/missing"])[0])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        elif path == "/img/huge":
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(1 << 30))
+            self.end_headers()
+            return
+        self._send(404, b"Not found", "text/plain")
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(port: int = 0, latency: float = 0.0):
+    """Start the image stub in a background thread.
+
+    Args:
+        port: Port to bind on localhost (0 picks a free port)
+        latency: Artificial delay in seconds before each response
+
+    Returns:
+        Tuple of (server, base_url); the handler's request counts are in
+        server.RequestHandlerClass.hits
+    """
+    handler = type("StubImageHandler", (ImageHandler,), {
+        "latency": latency,
+        "hits": Counter(),
+        "lock": threading.Lock(),
+    })
+    return serve_in_thread(handler, port)
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Serve generated images as a stand-in origin")
+    parser.add_argument("--port", type=int, default=8015)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    server, base_url = start_server(args.port, args.latency)
+    print(f"Image stub serving at {base_url}/img/<width>x<height>.png")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
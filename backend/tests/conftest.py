@@ -0,0 +1,19 @@
+"""Shared test setup.
+
+The backend modules import each other by top-level name (`from storage
+import ...`), so this directory's parent goes on sys.path. Caches, leases
+and screenshots are kept in a temporary directory, set before any backend
+module reads CACHE_DIR.
+"""
+
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_test_dir = tempfile.mkdtemp(prefix="hn-tests-")
+os.environ.setdefault("CACHE_DIR", os.path.join(_test_dir, "cache"))
+os.environ.setdefault("SCREENSHOT_DIR", os.path.join(_test_dir, "screenshots"))
+os.environ.setdefault("STARTUP_WARMUP", "0")
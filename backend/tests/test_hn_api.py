@@ -0,0 +1,98 @@
+"""APISource against the recorded HN item API stub (stubs/hn_api.py)."""
+
+import asyncio
+
+import pytest
+
+from stubs import hn_api
+from utils.hn_source import APISource
+
+@pytest.fixture(scope="module")
+def api_base():
+    server, base_url = hn_api.start_server()
+    yield base_url
+    server.shutdown()
+
+def run(source: APISource, coro):
+    """Run a coroutine on a fresh loop, closing the source's client afterwards."""
+    async def main():
+        try:
+            return await coro
+        finally:
+            await source.close()
+    return asyncio.run(main())
+
+def test_frontpage(api_base):
+    source = APISource(base_url=api_base)
+    page = run(source, source.frontpage(limit=3, offset=1))
+    assert [story["hn_id"] for story in page["stories"]] == [44266828, 44268782, 44270709]
+    assert page["has_more"] is True
+    story = page["stories"][0]
+    assert story["title"].startswith("If the moon were only 1 pixel")
+    assert story["url"].endswith("/item?id=44266828")
+    assert story["comments_count"] == 211
+
+def test_frontpage_last_page(api_base):
+    source = APISource(base_url=api_base)
+    page = run(source, source.frontpage(limit=10, offset=3))
+    assert len(page["stories"]) == 2
+    assert page["has_more"] is False
+
+def test_stories_by_id(api_base):
+    source = APISource(base_url=api_base)
+    # A story, a comment and an item the stub does not have
+    stories = run(source, source.stories([44243059, 44300000, 1]))
+    assert stories[44243059]["title"] == "Student discovers fungus predicted by Albert Hoffman"
+    assert stories[44300000] is None
+    assert stories[1] is None
+
+def test_fetch_thread_order_and_depth(api_base):
+    source = APISource(base_url=api_base)
+    comments = run(source, source.fetch_thread(44243059))
+    assert len(comments) == 10
+    assert [(c["id"], c["depth"]) for c in comments[:6]] == [
+        (44300000, 0), (44300001, 1), (44300002, 1), (44300003, 2), (44300004, 1), (44300005, 0),
+    ]
+    assert comments[0]["author"] == "doormatt"
+    assert "<p>" not in "".join(c["text"] for c in comments)
+
+def test_fetch_thread_with_one_connection(api_base):
+    # Item fetches queue for the single connection instead of timing out in the pool
+    source = APISource(base_url=api_base, max_connections=1)
+    comments = run(source, source.fetch_thread(44271284))
+    assert len(comments) == 10
+
+def test_concurrent_requests_share_one_fetch(api_base):
+    source = APISource(base_url=api_base)
+    paths = []
+    fetch_json = source._fetch_json
+
+    async def counting_fetch(path):
+        paths.append(path)
+        return await fetch_json(path)
+
+    source._fetch_json = counting_fetch
+    items = run(source, source.get_items([44243059] * 5))
+    assert paths == ["/item/44243059.json"]
+    assert all(item["id"] == 44243059 for item in items)
+    # Served from the item cache now
+    run(source, source.get_item(44243059))
+    assert len(paths) == 1
+
+def test_cancelled_fetch_releases_waiters(api_base):
+    source = APISource(base_url=api_base)
+
+    async def slow_fetch(path):
+        await asyncio.sleep(30)
+
+    source._fetch_json = slow_fetch
+
+    async def main():
+        fetching = asyncio.create_task(source.get_item(44243059))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.create_task(source.get_items([44243059]))
+        await asyncio.sleep(0.01)
+        fetching.cancel()
+        return await asyncio.wait_for(waiting, timeout=2)
+
+    assert run(source, main()) == [None]
@@ -0,0 +1,177 @@
+"""Image proxy against the stub image origin (stubs/images.py)."""
+
+import asyncio
+import os
+import socket
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import image_proxy
+from image_proxy import ImageProxy, ImageProxyError, etag_matches
+from stubs import images
+
+@pytest.fixture
+def origin():
+    server, base_url = images.start_server()
+    yield server, base_url
+    server.shutdown()
+
+@pytest.fixture
+def allow_private(monkeypatch):
+    # The stub listens on loopback, which the proxy refuses by default
+    monkeypatch.setattr(image_proxy, "IMAGE_PROXY_ALLOW_PRIVATE", True)
+
+def run(proxy: ImageProxy, coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await proxy.close()
+    return asyncio.run(main())
+
+def hits(server) -> dict:
+    return dict(server.RequestHandlerClass.hits)
+
+def test_resizes_to_variant_width(origin, allow_private, tmp_path):
+    server, base_url = origin
+    proxy = ImageProxy(cache_dir=str(tmp_path))
+    path, content_type = run(proxy, proxy.get(f"{base_url}/img/1600x800.png", 500))
+    assert content_type in ("image/webp", "image/jpeg")
+    with Image.open(path) as image:
+        assert image.size == (800, 400)
+
+def test_original_fetched_once_for_all_widths(origin, allow_private, tmp_path):
+    server, base_url = origin
+    proxy = ImageProxy(cache_dir=str(tmp_path))
+    url = f"{base_url}/img/1600x800-alpha.png"
+
+    async def main():
+        for width in (400, 800, 400, 1600):
+            await proxy.get(url, width)
+
+    run(proxy, main())
+    assert hits(server) == {"/img/1600x800-alpha.png": 1}
+
+def test_narrow_image_served_as_is(origin, allow_private, tmp_path):
+    server, base_url = origin
+    proxy = ImageProxy(cache_dir=str(tmp_path))
+    path, content_type = run(proxy, proxy.get(f"{base_url}/img/200x100.png", 800))
+    assert content_type == "image/png"
+    with Image.open(path) as image:
+        assert image.size == (200, 100)
+
+def test_follows_redirects(origin, allow_private, tmp_path):
+    server, base_url = origin
+    proxy = ImageProxy(cache_dir=str(tmp_path))
+    path, content_type = run(proxy, proxy.get(f"{base_url}/img/redirect?to=/img/pixel.gif", 400))
+    assert content_type == "image/gif"
+
+@pytest.mark.parametrize("path, status", [
+    ("/img/missing", 502),
+    ("/img/not-an-image", 415),
+    ("/img/huge", 413),
+])
+def test_rejects_bad_origin_responses(origin, allow_private, tmp_path, path, status):
+    server, base_url = origin
+    proxy = ImageProxy(cache_dir=str(tmp_path))
+    with pytest.raises(ImageProxyError) as error:
+        run(proxy, proxy.get(f"{base_url}{path}", 400))
+    assert error.value.status == status
+
+def test_failed_origin_not_refetched(origin, allow_private, tmp_path):
+    server, base_url = origin
+    proxy = ImageProxy(cache_dir=str(tmp_path))
+
+    async def main():
+        for _ in range(3):
+            with pytest.raises(ImageProxyError):
+                await proxy.get(f"{base_url}/img/missing", 400)
+
+    run(proxy, main())
+    assert hits(server) == {"/img/missing": 1}
+
+def test_rejects_private_addresses(origin, tmp_path):
+    server, base_url = origin
+    proxy = ImageProxy(cache_dir=str(tmp_path))
+    with pytest.raises(ImageProxyError) as error:
+        run(proxy, proxy.get(f"{base_url}/img/400x200.png", 400))
+    assert error.value.status == 403
+    # Host names resolving to loopback are refused as well
+    with pytest.raises(ImageProxyError) as error:
+        run(proxy, proxy.get("http://localhost/img/400x200.png", 400))
+    assert error.value.status == 403
+    assert hits(server) == {}
+
+def test_connects_to_the_checked_address(origin, monkeypatch, tmp_path):
+    server, base_url = origin
+    port = server.server_address[1]
+    # Pretend the stub is public; only the proxy's own lookup knows this host name,
+    # so the fetch succeeds only if it connects to the address that was checked
+    monkeypatch.setattr(image_proxy, "_is_public_address", lambda address: True)
+    proxy = ImageProxy(cache_dir=str(tmp_path))
+
+    async def main():
+        loop = asyncio.get_running_loop()
+
+        async def resolve(host, *args, **kwargs):
+            assert host == "images.test.invalid"
+            return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", ("127.0.0.1", port))]
+
+        loop.getaddrinfo = resolve
+        return await proxy.get(f"http://images.test.invalid:{port}/img/400x200.png", 400)
+
+    path, content_type = run(proxy, main())
+    assert content_type == "image/png"
+    assert hits(server) == {"/img/400x200.png": 1}
+
+def test_evicts_least_recently_used(origin, allow_private, tmp_path):
+    server, base_url = origin
+    proxy = ImageProxy(cache_dir=str(tmp_path))
+    old_path, _ = run(proxy, proxy.get(f"{base_url}/img/300x300.png", 400))
+    cached = [os.path.join(d, name) for d, _, names in os.walk(tmp_path) for name in names]
+    for path in cached:
+        os.utime(path, (1, 1))
+
+    # Room for about one image: the older one goes when the next is stored
+    proxy.max_bytes = sum(os.path.getsize(path) for path in cached) + 1
+    proxy._cache_bytes = None
+    new_path, _ = run(proxy, proxy.get(f"{base_url}/img/310x310.png", 400))
+    assert os.path.exists(new_path)
+    assert not os.path.exists(old_path)
+
+def test_etag_matching():
+    etag = '"abc-1f"'
+    assert etag_matches(etag, etag)
+    assert etag_matches('W/"abc-1f"', etag)
+    assert etag_matches('"other", "abc-1f"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"abc-1f0"', etag)
+    assert not etag_matches('"xabc-1f"', etag)
+    assert not etag_matches(" , ", etag)
+
+def test_endpoint_caching_headers(origin, monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+
+    server, base_url = origin
+    monkeypatch.setattr(image_proxy, "IMAGE_PROXY_ALLOW_PRIVATE", True)
+    with TestClient(main.app) as client:
+        response = client.get("/image", params={"url": f"{base_url}/img/1200x600.png", "w": 400})
+        assert response.status_code == 200
+        assert "immutable" in response.headers["cache-control"]
+        assert response.headers["x-content-type-options"] == "nosniff"
+        etag = response.headers["etag"]
+        with Image.open(BytesIO(response.content)) as image:
+            assert image.width == 400
+
+        again = client.get("/image", params={"url": f"{base_url}/img/1200x600.png", "w": 400},
+                           headers={"If-None-Match": f'"stale", W/{etag}'})
+        assert again.status_code == 304
+        assert again.headers["etag"] == etag
+
+        partial = client.get("/image", params={"url": f"{base_url}/img/1200x600.png", "w": 400},
+                             headers={"If-None-Match": etag[:-2] + '"'})
+        assert partial.status_code == 200
+    assert hits(server) == {"/img/1200x600.png": 1}
@@ -0,0 +1,61 @@
+"""Token-budget packing of analysis prompts (utils/prompt_packer.py)."""
+
+from utils.prompt_packer import (
+    estimate_tokens,
+    pack_analysis_input,
+    rank_comments,
+    truncate_to_tokens,
+)
+
+def comment(text: str, author: str = "user", depth: int = 0) -> dict:
+    return {"author": author, "text": text, "depth": depth}
+
+def test_truncate_prefers_word_boundary():
+    text = "alpha beta gamma delta epsilon zeta eta theta"
+    cut = truncate_to_tokens(text, 5)
+    assert cut.endswith("...")
+    assert len(cut) <= 20
+    assert cut[:-3] in text and not cut[:-3].endswith(" ")
+    assert truncate_to_tokens(text, 100) == text
+    assert truncate_to_tokens(text, 0) == ""
+
+def test_rank_prefers_top_level_substance():
+    short_reply = comment("ok", depth=3)
+    long_top = comment("A detailed argument about the tradeoffs involved. " * 10)
+    assert rank_comments([short_reply, long_top]) == [long_top, short_reply]
+
+def test_rank_moves_near_duplicates_last():
+    first = comment("the compiler optimizes tail calls in release builds only", depth=0)
+    repeat = comment("the compiler optimizes tail calls in release builds only!", depth=1)
+    other = comment("memory safety matters more than raw speed here", depth=1)
+    assert rank_comments([first, repeat, other]) == [first, other, repeat]
+
+def test_rank_handles_comments_without_words():
+    # CJK and emoji text has no [a-z0-9'] words to compare,
+    # and ranks first here, ahead of comments that do have words
+    comments = [comment("这篇文章很有意思，作者的观点很清楚，我学到了很多关于编译器的知识。" * 3), comment("🔥" * 40), comment("great write up")]
+    ranked = rank_comments(comments)
+    assert sorted(c["text"] for c in ranked) == sorted(c["text"] for c in comments)
+
+def test_pack_fits_budget():
+    article = "word " * 5000
+    comments = [comment(f"comment number {i} with some distinct content {i * 7}") for i in range(40)]
+    packed = pack_analysis_input(article, comments, token_budget=500, article_share=0.6)
+    assert packed["total_tokens"] <= 500
+    assert packed["article_truncated"]
+    assert packed["comments"]
+    assert packed["comments_dropped"] == 40 - len(packed["comments"])
+    assert packed["comments_text"].startswith("Comment 1 by user:")
+
+def test_pack_gives_unused_comment_allowance_to_article():
+    article = "word " * 5000
+    packed = pack_analysis_input(article, [comment("short")], token_budget=500, article_share=0.6)
+    assert packed["article_tokens"] > 300
+    assert packed["total_tokens"] <= 500
+
+def test_pack_short_inputs_untouched():
+    packed = pack_analysis_input("A short article.", [comment("Nice.")], token_budget=500)
+    assert packed["article"] == "A short article."
+    assert not packed["article_truncated"]
+    assert packed["comments_dropped"] == 0
+    assert packed["total_tokens"] == estimate_tokens("A short article.") + estimate_tokens("Comment 1 by user: Nice.") + 1
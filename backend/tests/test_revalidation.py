@@ -0,0 +1,99 @@
+"""Reprocessing of changed articles: a failed refetch keeps the cached story."""
+
+import asyncio
+
+import pytest
+
+import stream
+from records import Analysis, ArticleMetadata, Story, Validators
+from revalidation import Revalidator
+from screenshot_jobs import screenshot_jobs
+from storage import read_story, write_story
+
+HN_ID = "44243059"
+
+def cached_story() -> Story:
+    return Story(
+        hn_id=HN_ID,
+        title="Student discovers fungus predicted by Albert Hoffman",
+        url=f"https://news.ycombinator.com/item?id={HN_ID}",
+        article_url="https://example.com/fungus",
+        points=120,
+        author="doormatt",
+        comments_count=10,
+        time=1749600000,
+        full_article_html="<article><p>The old article.</p></article>",
+        article_metadata=ArticleMetadata(title="Fungus"),
+        screenshot_path=None,
+        screenshot_error=None,
+        hook="The old hook.",
+        top_comments=[],
+        analysis=Analysis(analysis="The old analysis.", metadata={"model": "gemini-1.5-flash"}),
+        validators=Validators(etag='"v1"', content_hash="old", checked_at=1),
+    )
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Stub the pipeline's network stages; tests override the ones they break."""
+    async def scrape_full_article(url, deadline=None):
+        return {"html": "<article><p>The new article.</p></article>", "metadata": {"title": "Fungus"}}
+
+    async def capture(url, article_id, deadline=None):
+        return None, "No browser in tests"
+
+    async def scrape_hn_comments(hn_id, offset=0, limit=10):
+        return {"comments": [], "has_more": False}
+
+    async def generate_hook_async(html, deadline=None):
+        return "The new hook."
+
+    async def analyze_article_async(html, comments, deadline=None):
+        return {"analysis": "The new analysis.", "metadata": {"model": "gemini-1.5-flash"}}
+
+    monkeypatch.setattr(stream, "scrape_full_article", scrape_full_article)
+    monkeypatch.setattr(screenshot_jobs, "capture", capture)
+    monkeypatch.setattr(stream, "scrape_hn_comments", scrape_hn_comments)
+    monkeypatch.setattr(stream, "generate_hook_async", generate_hook_async)
+    monkeypatch.setattr(stream, "analyze_article_async", analyze_article_async)
+    return monkeypatch
+
+def reprocess() -> dict:
+    story = cached_story()
+    write_story(HN_ID, story)
+    checked = Validators(etag='"v2"', content_hash="new", checked_at=2)
+    return asyncio.run(Revalidator()._reprocess(story, checked, story.validators))
+
+def test_changed_article_replaces_cached_story(pipeline):
+    result = reprocess()
+    assert result["result"] == "changed"
+    story = read_story(HN_ID)
+    assert story.hook == "The new hook."
+    assert story.analysis.analysis == "The new analysis."
+    assert story.validators.content_hash == "new"
+
+def test_failed_refetch_keeps_cached_story(pipeline):
+    async def scrape_full_article(url, deadline=None):
+        return {"error": "Bot detection page"}
+
+    pipeline.setattr(stream, "scrape_full_article", scrape_full_article)
+    result = reprocess()
+    assert result == {"hn_id": HN_ID, "result": "error", "error": "Bot detection page"}
+    story = read_story(HN_ID)
+    assert story.full_article_html == "<article><p>The old article.</p></article>"
+    assert story.hook == "The old hook."
+    assert story.analysis.analysis == "The old analysis."
+    # The old fingerprint stays so the change is detected again next time
+    assert story.validators.content_hash == "old"
+    assert story.validators.checked_at == 2
+
+def test_failed_analysis_keeps_cached_story(pipeline):
+    async def analyze_article_async(html, comments, deadline=None):
+        return {"analysis": "Error analyzing article", "metadata": {"error": "quota exceeded"}}
+
+    pipeline.setattr(stream, "analyze_article_async", analyze_article_async)
+    result = reprocess()
+    assert result["result"] == "error"
+    assert "quota exceeded" in result["error"]
+    story = read_story(HN_ID)
+    assert story.hook == "The old hook."
+    assert story.analysis.analysis == "The old analysis."
@@ -0,0 +1,95 @@
+"""Per-story trace timelines.
+
+This module provides:
+- StoryTrace, a timeline of stage spans and point events for one story
+- A context variable holding the trace of the story being processed, so
+  code deep in the pipeline can record events without extra parameters
+
+Traces are emitted as SSE `trace` events and as structured log lines.
+"""
+
+import json
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("trace")
+
+_current_trace: ContextVar[Optional["StoryTrace"]] = ContextVar("current_trace", default=None)
+
+class StoryTrace:
+    """Timeline of spans and events for one story, relative to its start."""
+
+    __slots__ = ("story_id", "started_at", "_origin", "spans", "events")
+
+    def __init__(self, story_id: str):
+        self.story_id = story_id
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.events: List[Dict[str, Any]] = []
+
+    def _ms(self, perf_time: float) -> float:
+        return round((perf_time - self._origin) * 1000, 2)
+
+    def add_span(self, name: str, start: float, end: float, failed: bool = False, **attrs):
+        """Record a finished span.
+
+        Args:
+            name: Stage name
+            start: Start time from time.perf_counter()
+            end: End time from time.perf_counter()
+            failed: Whether the stage failed
+            **attrs: Extra attributes to attach
+        """
+        span = {
+            "name": name,
+            "start_ms": self._ms(start),
+            "end_ms": self._ms(end),
+            "duration_ms": round((end - start) * 1000, 2),
+            "status": "error" if failed else "ok",
+        }
+        if attrs:
+            span.update(attrs)
+        self.spans.append(span)
+
+    def event(self, name: str, **attrs):
+        """Record a point event such as a cache decision or a retry."""
+        event = {"name": name, "at_ms": self._ms(time.perf_counter())}
+        if attrs:
+            event.update(attrs)
+        self.events.append(event)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "hn_id": self.story_id,
+            "started_at": self.started_at,
+            "total_ms": self._ms(time.perf_counter()),
+            "spans": self.spans,
+            "events": self.events,
+        }
+
+    def log(self):
+        """Write the trace as one structured log line."""
+        logger.info(json.dumps({"trace": self.to_dict()}))
+
+def start_trace(story_id: str) -> StoryTrace:
+    """Create a trace and make it current for the running task."""
+    trace = StoryTrace(story_id)
+    _current_trace.set(trace)
+    return trace
+
+def current_trace() -> Optional[StoryTrace]:
+    """Return the trace of the story being processed, if any."""
+    return _current_trace.get()
+
+def end_trace():
+    """Clear the current trace."""
+    _current_trace.set(None)
+
+def trace_event(name: str, **attrs):
+    """Record an event on the current trace; a no-op outside a story."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.event(name, **attrs)
@@ -0,0 +1,370 @@
+"""Shared Playwright browser management.
+
+This module provides:
+- A browser supervisor launching Chromium on demand, recycling it once it
+  has served BROWSER_RECYCLE_PAGES pages or its processes use more than
+  BROWSER_RECYCLE_RSS_MB, and relaunching it when it crashes
+- A lazily launched, process-wide scraper browser on such a supervisor
+- A context manager handing out pages on that browser, capped per worker,
+  with requests routed through a blocking profile
+- Cleanup of browser and Playwright resources on shutdown
+
+A recycled browser is drained rather than killed: new pages go to a fresh
+browser while the old one stays open until its last page is released (or
+BROWSER_DRAIN_TIMEOUT passes), so in-flight scrapes are not failed.
+"""
+
+from playwright.async_api import async_playwright, Browser
+import asyncio
+import logging
+import os
+import secrets
+import time
+from typing import Any, Dict, List, Optional, Sequence
+from contextlib import asynccontextmanager
+from metrics import BROWSERS_RUNNING, BROWSER_PAGES_OPEN, BROWSER_RECYCLES, BROWSER_RSS_BYTES
+from utils.request_policy import apply_policy
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Maximum pages open at once on this worker's browser; every uvicorn
+# worker runs its own browser, so this bounds memory per process
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "4"))
+
+# Recycle a browser after it has served this many pages (0 disables)
+BROWSER_RECYCLE_PAGES = int(os.getenv("BROWSER_RECYCLE_PAGES", "500"))
+
+# Recycle a browser once its processes use this much memory (MiB, 0 disables)
+BROWSER_RECYCLE_RSS_MB = int(os.getenv("BROWSER_RECYCLE_RSS_MB", "1024"))
+
+# Seconds between memory samples
+BROWSER_CHECK_INTERVAL = float(os.getenv("BROWSER_CHECK_INTERVAL", "30"))
+
+# Longest a recycled browser is kept open for its remaining pages
+BROWSER_DRAIN_TIMEOUT = float(os.getenv("BROWSER_DRAIN_TIMEOUT", "300"))
+
+SCRAPER_LAUNCH_ARGS = (
+    "--disable-blink-features=AutomationControlled",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+)
+
+# Chromium ignores unknown switches; this one finds a browser's main process in /proc
+_TAG_SWITCH = "--hn-supervisor-tag="
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def _proc_table() -> Optional[Dict[int, tuple]]:
+    """Return {pid: (ppid, cmdline)} for all processes, or None without /proc."""
+    if not os.path.isdir("/proc"):
+        return None
+    table = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read()
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces; fields resume after its closing parenthesis
+        ppid = int(stat[stat.rfind(b")") + 2:].split()[1])
+        table[int(entry)] = (ppid, cmdline)
+    return table
+
+def _tree_rss(table: Dict[int, tuple], root: int) -> int:
+    """Return the resident memory in bytes of a process and all its descendants."""
+    children: Dict[int, List[int]] = {}
+    for pid, (ppid, _) in table.items():
+        children.setdefault(ppid, []).append(pid)
+    total, stack = 0, [root]
+    while stack:
+        pid = stack.pop()
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * _PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            pass
+        stack.extend(children.get(pid, ()))
+    return total
+
+class _ManagedBrowser:
+    """A launched browser and its usage."""
+
+    __slots__ = ("browser", "tag", "pid", "pages_served", "in_use", "rss", "started_at", "retired", "closing", "drained")
+
+    def __init__(self, browser: Browser, tag: str):
+        self.browser = browser
+        self.tag = tag
+        self.pid: Optional[int] = None
+        self.pages_served = 0
+        self.in_use = 0
+        self.rss: Optional[int] = None
+        self.started_at = time.monotonic()
+        # Retired browsers take no new pages; closing is set once we close it ourselves
+        self.retired = False
+        self.closing = False
+        self.drained = asyncio.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pid": self.pid,
+            "pages_served": self.pages_served,
+            "in_use": self.in_use,
+            "rss_mb": round(self.rss / 2**20, 1) if self.rss is not None else None,
+            "uptime_s": round(time.monotonic() - self.started_at, 1),
+            "retired": self.retired,
+        }
+
+class BrowserSupervisor:
+    """Launches, recycles and restarts the Chromium browser of one pool."""
+
+    def __init__(
+        self,
+        pool: str,
+        launch_args: Sequence[str],
+        recycle_pages: int = BROWSER_RECYCLE_PAGES,
+        recycle_rss_mb: int = BROWSER_RECYCLE_RSS_MB,
+        check_interval: float = BROWSER_CHECK_INTERVAL,
+        drain_timeout: float = BROWSER_DRAIN_TIMEOUT
+    ):
+        """Initialize the supervisor (the browser is launched on first use).
+
+        Args:
+            pool: Pool name used in metrics and logs
+            launch_args: Chromium command-line switches
+            recycle_pages: Pages served before the browser is recycled (0 disables)
+            recycle_rss_mb: Memory of the browser's processes before it is recycled (0 disables)
+            check_interval: Seconds between memory samples
+            drain_timeout: Longest a recycled browser is kept open for its remaining pages
+        """
+        self.pool = pool
+        self.launch_args = list(launch_args)
+        self.recycle_pages = recycle_pages
+        self.recycle_rss = recycle_rss_mb * 2**20
+        self.check_interval = check_interval
+        self.drain_timeout = drain_timeout
+        self._playwright = None
+        self._current: Optional[_ManagedBrowser] = None
+        self._browsers: Dict[Browser, _ManagedBrowser] = {}
+        self._lock = asyncio.Lock()
+        self._tasks: set = set()
+        self._monitor: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def _spawn(self, coro, name: str):
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _launch(self) -> _ManagedBrowser:
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        tag = f"{self.pool}-{os.getpid()}-{secrets.token_hex(4)}"
+        browser = await self._playwright.chromium.launch(headless=True, args=self.launch_args + [_TAG_SWITCH + tag])
+        return _ManagedBrowser(browser, tag)
+
+    async def _ensure(self) -> _ManagedBrowser:
+        """Return the browser taking new pages, launching one if needed."""
+        async with self._lock:
+            current = self._current
+            if current is None or current.retired or not current.browser.is_connected():
+                self._closed = False
+                current = await self._launch()
+                current.browser.on("disconnected", lambda _, managed=current: self._disconnected(managed))
+                self._browsers[current.browser] = current
+                self._current = current
+                BROWSERS_RUNNING.labels(self.pool).set(len(self._browsers))
+                logger.info(f"[BROWSER] Launched {self.pool} browser ({len(self._browsers)} running)")
+                if self._monitor is None and self.check_interval > 0:
+                    self._monitor = asyncio.create_task(self._watch_memory(), name=f"browser-monitor-{self.pool}")
+            return current
+
+    async def start(self):
+        """Launch the browser ahead of the first page."""
+        await self._ensure()
+
+    async def acquire(self) -> Browser:
+        """Return a browser to open one page or context on; pair with release()."""
+        managed = await self._ensure()
+        managed.in_use += 1
+        managed.pages_served += 1
+        managed.drained.clear()
+        if self.recycle_pages and managed.pages_served >= self.recycle_pages:
+            # This page still runs here; the next one gets a fresh browser
+            self._retire(managed, "pages")
+        return managed.browser
+
+    def release(self, browser: Browser):
+        """Return a browser handed out by acquire() once its page is closed."""
+        managed = self._browsers.get(browser)
+        if managed is None:
+            return
+        managed.in_use -= 1
+        if managed.in_use <= 0:
+            managed.drained.set()
+
+    @asynccontextmanager
+    async def browser(self):
+        """Hold a browser for the duration of the block.
+
+        Yields:
+            The Playwright browser to open a page or context on
+        """
+        browser = await self.acquire()
+        try:
+            yield browser
+        finally:
+            self.release(browser)
+
+    def _retire(self, managed: _ManagedBrowser, reason: str):
+        """Stop giving pages to a browser and close it once they are released."""
+        if managed.retired:
+            return
+        managed.retired = True
+        if self._current is managed:
+            self._current = None
+        BROWSER_RECYCLES.labels(self.pool, reason).inc()
+        logger.info(
+            f"[BROWSER] Recycling {self.pool} browser ({reason}): {managed.pages_served} pages served, "
+            f"{managed.in_use} in use, {(managed.rss or 0) / 2**20:.0f} MiB"
+        )
+        self._spawn(self._drain(managed), f"browser-drain-{self.pool}")
+        if reason == "crash" and not self._closed:
+            # Relaunch right away so the next page does not wait for it
+            self._spawn(self._relaunch(), f"browser-restart-{self.pool}")
+
+    async def _drain(self, managed: _ManagedBrowser):
+        if managed.in_use > 0:
+            try:
+                await asyncio.wait_for(managed.drained.wait(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"[BROWSER] Closing {self.pool} browser with {managed.in_use} pages still open after {self.drain_timeout:.0f}s")
+        await self._close_browser(managed)
+
+    async def _relaunch(self):
+        try:
+            await self._ensure()
+        except Exception as e:
+            logger.error(f"[BROWSER] Failed to restart {self.pool} browser: {e}")
+
+    async def _close_browser(self, managed: _ManagedBrowser):
+        managed.closing = True
+        try:
+            if managed.browser.is_connected():
+                await managed.browser.close()
+        except Exception as e:
+            logger.error(f"Error closing browser: {e}")
+        finally:
+            self._browsers.pop(managed.browser, None)
+            BROWSERS_RUNNING.labels(self.pool).set(len(self._browsers))
+
+    def _disconnected(self, managed: _ManagedBrowser):
+        if managed.closing:
+            return
+        logger.error(f"[BROWSER] {self.pool} browser disconnected unexpectedly with {managed.in_use} pages in use")
+        self._retire(managed, "crash")
+
+    def _measure(self):
+        """Sample the memory of each browser's process tree (blocking: walks /proc)."""
+        table = _proc_table()
+        if table is None:
+            return
+        for managed in list(self._browsers.values()):
+            if managed.pid is None or managed.pid not in table:
+                marker = (_TAG_SWITCH + managed.tag).encode()
+                managed.pid = next((pid for pid, (_, cmdline) in table.items() if marker in cmdline), None)
+            managed.rss = _tree_rss(table, managed.pid) if managed.pid is not None else None
+
+    async def check_memory(self):
+        """Measure the browsers' memory and recycle the current one if it is over the limit."""
+        await asyncio.to_thread(self._measure)
+        current = self._current
+        if current is not None:
+            BROWSER_RSS_BYTES.labels(self.pool).set(current.rss or 0)
+            if self.recycle_rss and current.rss and current.rss >= self.recycle_rss:
+                self._retire(current, "memory")
+
+    async def _watch_memory(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.check_memory()
+            except Exception as e:
+                logger.error(f"[BROWSER] Memory check of {self.pool} browser failed: {e}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pool": self.pool,
+            "browsers": [
+                {**managed.to_dict(), "current": managed is self._current}
+                for managed in self._browsers.values()
+            ],
+        }
+
+    async def close(self):
+        """Close every browser and stop Playwright."""
+        self._closed = True
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+            self._monitor = None
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        async with self._lock:
+            for managed in list(self._browsers.values()):
+                await self._close_browser(managed)
+            self._current = None
+            BROWSERS_RUNNING.labels(self.pool).set(0)
+            BROWSER_RSS_BYTES.labels(self.pool).set(0)
+            if self._playwright is not None:
+                try:
+                    await self._playwright.stop()
+                except Exception as e:
+                    logger.error(f"Error stopping playwright: {e}")
+                finally:
+                    self._playwright = None
+
+# Create global scraper browser supervisor
+scraper_browsers = BrowserSupervisor("scraper", SCRAPER_LAUNCH_ARGS)
+_page_slots = asyncio.Semaphore(BROWSER_MAX_PAGES)
+
+async def start_browser():
+    """Launch the shared browser ahead of the first request."""
+    await scraper_browsers.start()
+
+@asynccontextmanager
+async def get_browser_context(profile: str = "extract"):
+    """Get or create a browser context with proper cleanup.
+
+    Waits for a free page slot when BROWSER_MAX_PAGES pages are open.
+
+    Args:
+        profile: Request routing profile for the page (see utils.request_policy)
+
+    Yields:
+        Tuple of (browser, page) for use in a context manager
+    """
+    page = None
+
+    async with _page_slots, scraper_browsers.browser() as browser:
+        try:
+            page = await browser.new_page()
+            BROWSER_PAGES_OPEN.labels("scraper").inc()
+            await apply_policy(page, profile)
+            yield browser, page
+        finally:
+            if page:
+                BROWSER_PAGES_OPEN.labels("scraper").dec()
+                if not page.is_closed():
+                    await page.close()
+
+async def close_browser():
+    """Close the global browser instance and playwright if they exist."""
+    await scraper_browsers.close()
@@ -0,0 +1,220 @@
+"""Compact, array-backed comment trees.
+
+This module provides:
+- CommentTree, which stores a whole thread in parallel typed arrays
+- CommentTreeCache, an LRU/TTL cache that loads each thread once
+
+Comments are stored in thread (pre-order) order, so the subtree rooted at
+any comment is the contiguous slice ending at its `subtree_end` index.
+Offset windows and subtree queries are answered directly from the arrays.
+"""
+
+import asyncio
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+class CommentTree:
+    """A comment thread stored as parallel arrays.
+
+    Per comment the tree keeps the parent index (-1 for top-level), depth,
+    an index into the interned author table, the HN item id, the post time
+    and the offset of its text in one shared text buffer.
+    """
+
+    __slots__ = (
+        "story_id", "parent", "depth", "author_id", "item_id", "time",
+        "text_offset", "subtree_end", "authors", "_author_index",
+        "_text_parts", "_text", "_stack",
+    )
+
+    def __init__(self, story_id=0):
+        self.story_id = story_id
+        self.parent = array("i")
+        self.depth = array("H")
+        self.author_id = array("I")
+        self.item_id = array("q")
+        self.time = array("q")
+        self.text_offset = array("Q", [0])
+        self.subtree_end = array("i")
+        self.authors: List[str] = []
+        self._author_index: Dict[str, int] = {}
+        self._text_parts: Optional[List[str]] = []
+        self._text = ""
+        # Indices of the open ancestors, one per depth, while appending
+        self._stack: List[int] = []
+
+    def __len__(self):
+        return len(self.parent)
+
+    def append(self, author: str, text: str, depth: int, item_id: int = 0, posted: int = 0) -> int:
+        """Append the next comment in thread order.
+
+        The parent is inferred from depth, so comments must arrive in the
+        order HN renders them. Depths that skip levels are clamped.
+
+        Args:
+            author: Comment author
+            text: Plain-text comment body
+            depth: Nesting level (0 for top-level)
+            item_id: HN item id, if known
+            posted: Unix timestamp of the comment, if known
+
+        Returns:
+            Index of the new comment
+        """
+        if self._text_parts is None:
+            raise RuntimeError("CommentTree is frozen")
+
+        depth = max(0, min(depth, len(self._stack)))
+        index = len(self.parent)
+
+        # Close subtrees of the siblings and cousins we just walked past
+        while len(self._stack) > depth:
+            self.subtree_end[self._stack.pop()] = index
+
+        author_id = self._author_index.get(author)
+        if author_id is None:
+            author_id = len(self.authors)
+            self.authors.append(author)
+            self._author_index[author] = author_id
+
+        self.parent.append(self._stack[-1] if self._stack else -1)
+        self.depth.append(depth)
+        self.author_id.append(author_id)
+        self.item_id.append(int(item_id or 0))
+        self.time.append(int(posted or 0))
+        self._text_parts.append(text)
+        self.text_offset.append(self.text_offset[-1] + len(text))
+        self.subtree_end.append(index + 1)
+        self._stack.append(index)
+        return index
+
+    def freeze(self) -> "CommentTree":
+        """Finish loading: close open subtrees and join the text buffer."""
+        if self._text_parts is not None:
+            end = len(self.parent)
+            for index in self._stack:
+                self.subtree_end[index] = end
+            self._stack = []
+            self._text = "".join(self._text_parts)
+            self._text_parts = None
+            self._author_index = {}
+        return self
+
+    def text(self, index: int) -> str:
+        """Return the text of the comment at index."""
+        start, end = self.text_offset[index], self.text_offset[index + 1]
+        if self._text_parts is not None:
+            return self._text_parts[index]
+        return self._text[start:end]
+
+    def comment(self, index: int) -> Dict[str, Any]:
+        """Materialize one comment as the dictionary the API returns."""
+        return {
+            "id": self.item_id[index],
+            "author": self.authors[self.author_id[index]],
+            "text": self.text(index),
+            "depth": self.depth[index],
+            "time": self.time[index],
+            "index": index,
+            "parent": self.parent[index],
+        }
+
+    def window(self, offset: int = 0, limit: int = 10) -> List[Dict[str, Any]]:
+        """Return comments [offset, offset + limit) in thread order."""
+        end = min(len(self), offset + limit)
+        return [self.comment(i) for i in range(max(0, offset), end)]
+
+    def subtree(self, index: int, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the comment at index followed by all of its replies.
+
+        Args:
+            index: Root comment index
+            limit: Maximum number of comments to return
+
+        Raises:
+            IndexError: If index is out of range
+        """
+        if not 0 <= index < len(self):
+            raise IndexError(f"Comment index {index} out of range")
+        end = self.subtree_end[index]
+        if limit is not None:
+            end = min(end, index + limit)
+        return [self.comment(i) for i in range(index, end)]
+
+    def children(self, index: int) -> List[int]:
+        """Return indices of the direct replies to the comment at index (-1 for top-level)."""
+        if index == -1:
+            start, end = 0, len(self)
+        else:
+            start, end = index + 1, self.subtree_end[index]
+        result = []
+        i = start
+        while i < end:
+            result.append(i)
+            i = self.subtree_end[i]
+        return result
+
+    @classmethod
+    def from_comments(cls, story_id, comments: Iterable[Dict[str, Any]]) -> "CommentTree":
+        """Build a frozen tree from comment dicts with author/text/depth keys."""
+        tree = cls(story_id)
+        for c in comments:
+            tree.append(
+                c.get("author", "anonymous"),
+                c.get("text", ""),
+                c.get("depth", 0),
+                item_id=c.get("id", 0),
+                posted=c.get("time", 0),
+            )
+        return tree.freeze()
+
+class CommentTreeCache:
+    """LRU cache of comment trees with a freshness TTL.
+
+    Concurrent misses for the same story share a single load.
+    """
+
+    def __init__(self, max_trees: int = 200, ttl: float = 300):
+        self.max_trees = max_trees
+        self.ttl = ttl
+        self._trees: "OrderedDict[str, tuple]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+
+    async def get(self, story_id, loader: Callable[[Any], Awaitable[CommentTree]]) -> CommentTree:
+        """Return the cached tree for story_id, loading it if stale or missing.
+
+        Args:
+            story_id: Hacker News story ID
+            loader: Coroutine function that fetches the full tree
+        """
+        key = str(story_id)
+        entry = self._trees.get(key)
+        if entry is not None:
+            loaded_at, tree = entry
+            if time.monotonic() - loaded_at <= self.ttl:
+                self._trees.move_to_end(key)
+                return tree
+            del self._trees[key]
+
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.ensure_future(loader(story_id))
+            self._loading[key] = task
+            task.add_done_callback(lambda t, key=key: self._store(key, t))
+        return await asyncio.shield(task)
+
+    def _store(self, key: str, task: asyncio.Task):
+        self._loading.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._trees[key] = (time.monotonic(), task.result())
+        self._trees.move_to_end(key)
+        while len(self._trees) > self.max_trees:
+            self._trees.popitem(last=False)
+
+    def invalidate(self, story_id):
+        """Drop the cached tree for story_id."""
+        self._trees.pop(str(story_id), None)
@@ -6,26 +6,34 @@ This module provides functions to interact with Google's Gemini API for:
 - Content validation and processing
 """
 
-import google.generativeai as genai
+import hashlib
 import logging
+import math
 import os
 from typing import Dict, Any, Optional
 from dotenv import load_dotenv
 import asyncio
+import httpx
 from functools import partial
+from types import SimpleNamespace
 import re
+import time
+from collections import deque
 from bs4 import BeautifulSoup
+from utils.prompt_packer import pack_analysis_input, estimate_tokens, ANALYSIS_TOKEN_BUDGET
+from metrics import LLM_REQUESTS, LLM_TOKENS
+from tracing import trace_event
+from deadline import Deadline, DeadlineExceeded, MIN_STAGE_SECONDS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load environment variables and configure Gemini API
+# Load environment variables; the Gemini SDK is imported and configured on
+# first use (it is the slowest import in the app), see get_genai()
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
 api_key = os.getenv('GEMINI_API_KEY')
-if not api_key:
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
-genai.configure(api_key=api_key)
+_genai = None
 
 # Content validation thresholds
 MIN_CONTENT_LENGTH = 50
@@ -34,6 +42,104 @@ MIN_COMMENT_LENGTH = 5
 MAX_COMMENT_LENGTH = 2000
 MAX_COMMENTS = 10
 
+# Long-document (map-reduce) summarization
+LONG_DOC_THRESHOLD = int(os.getenv('LONG_DOC_THRESHOLD', '12000'))
+LONG_DOC_CHUNK_SIZE = int(os.getenv('LONG_DOC_CHUNK_SIZE', '6000'))
+LONG_DOC_MAX_CHUNKS = int(os.getenv('LONG_DOC_MAX_CHUNKS', '8'))
+LONG_DOC_CACHE_SIZE = 64
+
+# Per-call timeout, and deadline thresholds: map-reduce needs two rounds of
+# calls, and below ANALYSIS_FULL_SECONDS the analysis prompt is shortened
+LLM_TIMEOUT = 30
+LONG_DOC_MIN_SECONDS = float(os.getenv('LONG_DOC_MIN_SECONDS', '30'))
+ANALYSIS_FULL_SECONDS = float(os.getenv('ANALYSIS_FULL_SECONDS', '20'))
+HOOK_MIN_SECONDS = 5
+# Time kept for the analysis while the hook is generated
+ANALYSIS_RESERVE_SECONDS = 10
+
+# Hooks returned when none could be generated (generate_hook does not raise)
+HOOK_UNAVAILABLE = "Unable to generate a hook for this article. Please click the link to read more."
+HOOK_ERROR = "There was an error processing this article. Please click the link to read more."
+HOOK_FALLBACKS = frozenset({HOOK_UNAVAILABLE, HOOK_ERROR})
+
+# Maximum number of Gemini calls in flight per process
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '4'))
+_llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+# Requests per minute allowed by the Gemini quota (0 if unknown); a rate
+# limit response counts as no headroom for LLM_RATE_LIMIT_COOLDOWN seconds
+LLM_RATE_LIMIT_RPM = int(os.getenv('LLM_RATE_LIMIT_RPM', '0'))
+LLM_RATE_LIMIT_COOLDOWN = float(os.getenv('LLM_RATE_LIMIT_COOLDOWN', '30'))
+_recent_calls = deque(maxlen=10000)
+_rate_limited_at = 0.0
+
+# Optional REST endpoint override (a proxy, or the local stub in stubs.gemini)
+GEMINI_API_BASE = os.getenv('GEMINI_API_BASE')
+GEMINI_MODEL = 'gemini-1.5-flash'
+_rest_client = None
+
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.8,
+    "top_k": 40
+}
+
+def check_config() -> list:
+    """Return a list of configuration problems (empty when usable)."""
+    problems = []
+    if not api_key:
+        problems.append("GEMINI_API_KEY not found in environment variables")
+    return problems
+
+def get_genai():
+    """Import and configure the Gemini SDK on first use.
+    
+    Raises:
+        ValueError: If GEMINI_API_KEY is not set
+    """
+    global _genai
+    if _genai is None:
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        _genai = genai
+    return _genai
+
+def _get_rest_client() -> httpx.Client:
+    global _rest_client
+    if _rest_client is None:
+        _rest_client = httpx.Client(base_url=GEMINI_API_BASE.rstrip('/'), timeout=30)
+    return _rest_client
+
+def warm_up_client():
+    """Create the LLM client ahead of the first request.
+    
+    Imports and configures the SDK, or opens the pooled REST client when
+    GEMINI_API_BASE is set. No generation request is sent.
+    """
+    if GEMINI_API_BASE:
+        _get_rest_client()
+    else:
+        get_genai().GenerativeModel(GEMINI_MODEL)
+
+def html_to_text(html_content: str) -> str:
+    """Extract and clean text content from HTML.
+    
+    Args:
+        html_content: Article content in HTML or plain text format
+        
+    Returns:
+        Whitespace-normalized text (plain text input is returned unchanged)
+    """
+    if isinstance(html_content, str) and html_content.strip().startswith('<'):
+        soup = BeautifulSoup(html_content, 'html.parser')
+        for script in soup(["script", "style"]):
+            script.decompose()
+        content = soup.get_text(separator=' ', strip=True)
+        return ' '.join(content.split())
+    return html_content
+
 def validate_content(content: str, min_length: int = MIN_CONTENT_LENGTH, max_length: int = MAX_CONTENT_LENGTH) -> tuple[bool, str]:
     """Validate and clean content before sending to Gemini.
     
@@ -71,11 +177,12 @@ def validate_content(content: str, min_length: int = MIN_CONTENT_LENGTH, max_len
     
     return True, content
 
-def validate_comments(comments: list) -> tuple[bool, list]:
+def validate_comments(comments: list, max_comments: Optional[int] = MAX_COMMENTS) -> tuple[bool, list]:
     """Validate and clean comments before sending to Gemini.
     
     Args:
         comments: List of comment dictionaries
+        max_comments: Maximum number of comments to keep (None for all)
         
     Returns:
         Tuple of (has_valid_comments, cleaned_comments)
@@ -108,7 +215,7 @@ def validate_comments(comments: list) -> tuple[bool, list]:
     if not valid_comments:
         return False, []
     
-    return True, valid_comments[:MAX_COMMENTS]
+    return True, valid_comments[:max_comments]
 
 async def run_with_timeout(func, *args, timeout=30, **kwargs):
     """Run a function with a timeout in an async context.
@@ -133,6 +240,102 @@ async def run_with_timeout(func, *args, timeout=30, **kwargs):
         logger.error(f"Error in {func.__name__}: {str(e)}")
         raise
 
+class RESTResponse:
+    """Minimal stand-in for the SDK response built from a REST payload."""
+    
+    def __init__(self, payload: Dict[str, Any]):
+        candidates = payload.get("candidates") or []
+        parts = candidates[0].get("content", {}).get("parts", []) if candidates else []
+        self.text = "".join(part.get("text", "") for part in parts)
+        usage = payload.get("usageMetadata", {})
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=usage.get("promptTokenCount"),
+            candidates_token_count=usage.get("candidatesTokenCount")
+        )
+
+def _generate_content_rest(prompt: str) -> RESTResponse:
+    """Call generateContent on GEMINI_API_BASE over a pooled HTTP client."""
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not found in environment variables")
+    response = _get_rest_client().post(
+        f"/v1beta/models/{GEMINI_MODEL}:generateContent",
+        params={"key": api_key},
+        json={
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "temperature": GENERATION_CONFIG["temperature"],
+                "topP": GENERATION_CONFIG["top_p"],
+                "topK": GENERATION_CONFIG["top_k"]
+            }
+        }
+    )
+    response.raise_for_status()
+    return RESTResponse(response.json())
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether a Gemini call failed because of the quota (HTTP 429 / RESOURCE_EXHAUSTED)."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429
+    return type(error).__name__ == "ResourceExhausted" or "RESOURCE_EXHAUSTED" in str(error)
+
+def llm_headroom() -> float:
+    """Estimate the share of the Gemini quota still available.
+    
+    Returns:
+        0.0 right after a rate limit response, otherwise the unused share
+        of LLM_RATE_LIMIT_RPM over the last minute (1.0 when unknown)
+    """
+    now = time.monotonic()
+    if now - _rate_limited_at < LLM_RATE_LIMIT_COOLDOWN:
+        return 0.0
+    if LLM_RATE_LIMIT_RPM <= 0:
+        return 1.0
+    while _recent_calls and now - _recent_calls[0] > 60:
+        _recent_calls.popleft()
+    return max(0.0, 1.0 - len(_recent_calls) / LLM_RATE_LIMIT_RPM)
+
+def generate_content(prompt: str, call: str):
+    """Send a prompt to Gemini and record request and token metrics.
+    
+    Args:
+        prompt: Full prompt text
+        call: Call type used as the metrics label (hook, analysis, ...)
+        
+    Returns:
+        Gemini response object
+    """
+    global _rate_limited_at
+    _recent_calls.append(time.monotonic())
+    try:
+        if GEMINI_API_BASE:
+            response = _generate_content_rest(prompt)
+        else:
+            model = get_genai().GenerativeModel(GEMINI_MODEL)
+            response = model.generate_content(prompt, generation_config=GENERATION_CONFIG)
+    except Exception as e:
+        if is_rate_limit_error(e):
+            _rate_limited_at = time.monotonic()
+            LLM_REQUESTS.labels(call, "rate_limited").inc()
+        else:
+            LLM_REQUESTS.labels(call, "error").inc()
+        raise
+    LLM_REQUESTS.labels(call, "ok").inc()
+    
+    # Prefer the API's token accounting, fall back to the local estimate
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    completion_tokens = getattr(usage, "candidates_token_count", None)
+    if not prompt_tokens:
+        prompt_tokens = estimate_tokens(prompt)
+    if not completion_tokens:
+        try:
+            completion_tokens = estimate_tokens(response.text)
+        except Exception:
+            completion_tokens = 0
+    LLM_TOKENS.labels("prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels("completion").inc(completion_tokens)
+    return response
+
 def generate_hook(html_content: str) -> str:
     """Generate a compelling 2-3 sentence hook for an article.
     
@@ -143,22 +346,12 @@ def generate_hook(html_content: str) -> str:
         Generated hook text or error message
     """
     try:
-        # Extract and clean text content from HTML
-        if isinstance(html_content, str) and html_content.strip().startswith('<'):
-            soup = BeautifulSoup(html_content, 'html.parser')
-            for script in soup(["script", "style"]):
-                script.decompose()
-            content = soup.get_text(separator=' ', strip=True)
-            content = ' '.join(content.split())
-        else:
-            content = html_content
+        content = html_to_text(html_content)
 
         is_valid, result = validate_content(content)
         if not is_valid:
             logger.warning(f"Invalid content for hook generation: {result}")
-            return "Unable to generate a hook for this article. Please click the link to read more."
-        
-        model = genai.GenerativeModel('gemini-1.5-flash')
+            return HOOK_UNAVAILABLE
         
         prompt = f"""Write a compelling 2-3 sentence hook for this technical article. Focus on the most interesting or unique aspects that would make readers want to learn more.
 
@@ -167,19 +360,12 @@ Article content:
 
 Hook:"""
         
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "temperature": 0.7,
-                "top_p": 0.8,
-                "top_k": 40
-            }
-        )
+        response = generate_content(prompt, call="hook")
         
         hook = response.text.strip()
         if not hook:
             logger.warning("Empty hook generated")
-            return "Unable to generate a hook for this article. Please click the link to read more."
+            return HOOK_UNAVAILABLE
             
         if len(hook) > 500:
             hook = hook[:497] + "..."
@@ -188,28 +374,22 @@ Hook:"""
         
     except Exception as e:
         logger.error(f"Error generating hook: {str(e)}")
-        return "There was an error processing this article. Please click the link to read more."
+        return HOOK_ERROR
 
-def analyze_article(html_content: str, comments: list) -> Dict[str, Any]:
+def analyze_article(html_content: str, comments: list, token_budget: Optional[int] = None) -> Dict[str, Any]:
     """Analyze article content and comments to generate a structured summary.
     
     Args:
         html_content: Article content in HTML or plain text format
         comments: List of comment dictionaries
+        token_budget: Input token budget for article plus comments
+            (defaults to ANALYSIS_TOKEN_BUDGET)
         
     Returns:
         Dictionary containing analysis results and metadata
     """
     try:
-        # Extract and clean text content from HTML
-        if isinstance(html_content, str) and html_content.strip().startswith('<'):
-            soup = BeautifulSoup(html_content, 'html.parser')
-            for script in soup(["script", "style"]):
-                script.decompose()
-            content = soup.get_text(separator=' ', strip=True)
-            content = ' '.join(content.split())
-        else:
-            content = html_content
+        content = html_to_text(html_content)
 
         is_valid, result = validate_content(content)
         if not is_valid:
@@ -222,18 +402,11 @@ def analyze_article(html_content: str, comments: list) -> Dict[str, Any]:
                 }
             }
         
-        has_valid_comments, valid_comments = validate_comments(comments)
+        has_valid_comments, valid_comments = validate_comments(comments, max_comments=None)
         if not has_valid_comments:
             logger.warning("No valid comments found for analysis")
         
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        comments_text = ""
-        if valid_comments:
-            comments_text = "\n".join([
-                f"Comment {i+1} by {c['author']}: {c['text'][:300]}"
-                for i, c in enumerate(valid_comments)
-            ])
+        packed = pack_analysis_input(result, valid_comments, token_budget=token_budget)
         
         prompt = f"""Analyze this technical article and its comments. Structure your response in three clear sections:
 
@@ -242,28 +415,25 @@ def analyze_article(html_content: str, comments: list) -> Dict[str, Any]:
 3. Discussion Highlights:
 
 Article content:
-{result[:3000]}
+{packed['article']}
 
 Comments:
-{comments_text}
+{packed['comments_text']}
 
 Analysis:"""
         
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "temperature": 0.7,
-                "top_p": 0.8,
-                "top_k": 40
-            }
-        )
+        response = generate_content(prompt, call="analysis")
         
         return {
             "analysis": response.text.strip(),
             "metadata": {
                 "model": "gemini-1.5-flash",
                 "content_length": len(result),
-                "comments_analyzed": len(valid_comments)
+                "comments_analyzed": len(packed["comments"]),
+                "prompt_tokens_estimated": estimate_tokens(prompt),
+                "article_tokens": packed["article_tokens"],
+                "comment_tokens": packed["comment_tokens"],
+                "token_budget": packed["token_budget"]
             }
         }
     except Exception as e:
@@ -276,10 +446,224 @@ Analysis:"""
             }
         }
 
-async def generate_hook_async(html_content: str) -> str:
-    """Async wrapper for generate_hook with timeout."""
-    return await run_with_timeout(generate_hook, html_content)
+async def run_llm(func, *args, timeout=LLM_TIMEOUT, deadline: Optional[Deadline] = None, reserve: float = 0.0, **kwargs):
+    """Run a blocking Gemini call under the process-wide concurrency limit.
+    
+    Args:
+        func: Function making the Gemini call
+        timeout: Maximum execution time in seconds (excluding queueing)
+        deadline: Story deadline; the timeout is capped by the time left
+            once the call gets a concurrency slot
+        reserve: Seconds of the deadline to keep for later stages
+        *args, **kwargs: Arguments to pass to the function
+        
+    Returns:
+        Function result
+        
+    Raises:
+        DeadlineExceeded: If less than MIN_STAGE_SECONDS are left
+    """
+    async with _llm_semaphore:
+        if deadline is not None:
+            timeout = deadline.timeout(timeout, reserve)
+            if timeout < MIN_STAGE_SECONDS:
+                raise DeadlineExceeded(f"Story deadline reached before {func.__name__}")
+        return await run_with_timeout(func, *args, timeout=timeout, **kwargs)
+
+def split_into_chunks(text: str, chunk_size: int = LONG_DOC_CHUNK_SIZE, max_chunks: int = LONG_DOC_MAX_CHUNKS) -> list:
+    """Split text into roughly equal chunks at sentence boundaries.
+    
+    Every character of the text lands in a chunk: when the text is longer
+    than max_chunks chunks of chunk_size, the chunks are made larger.
+    
+    Args:
+        text: Cleaned article text
+        chunk_size: Minimum target chunk length in characters
+        max_chunks: Maximum number of chunks
+        
+    Returns:
+        List of text chunks
+    """
+    max_chunks = max(1, max_chunks)
+    chunk_size = max(chunk_size, math.ceil(len(text) / max_chunks))
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if len(chunks) == max_chunks - 1:
+            # Sentence boundaries shortened earlier chunks; the last one takes the rest
+            end = len(text)
+        elif end < len(text):
+            # Prefer ending on a sentence in the last quarter of the chunk
+            boundary = text.rfind('. ', start + chunk_size * 3 // 4, end)
+            if boundary != -1:
+                end = boundary + 1
+        chunks.append(text[start:end].strip())
+        start = end
+    return [chunk for chunk in chunks if chunk]
+
+def summarize_chunk(chunk: str, index: int, total: int) -> str:
+    """Summarize one section of a long article (map step).
+    
+    Args:
+        chunk: Section text
+        index: Zero-based section number
+        total: Total number of sections
+        
+    Returns:
+        Section summary
+    """
+    prompt = f"""Summarize part {index + 1} of {total} of a technical article in 3-5 sentences. Keep concrete facts, numbers, names and claims; skip navigation or boilerplate text.
+
+Article part:
+{chunk}
+
+Summary:"""
+    response = generate_content(prompt, call="chunk_summary")
+    return response.text.strip()
+
+def reduce_summaries(summaries: list) -> str:
+    """Merge section summaries into one condensed article (reduce step).
+    
+    Args:
+        summaries: Section summaries in article order
+        
+    Returns:
+        Condensed article text
+    """
+    sections = "\n\n".join(f"Part {i + 1}: {summary}" for i, summary in enumerate(summaries))
+    prompt = f"""The following are summaries of consecutive parts of one technical article. Combine them into a single coherent condensed version of the whole article of at most 400 words, preserving the key facts and the overall argument.
+
+{sections}
+
+Condensed article:"""
+    response = generate_content(prompt, call="reduce")
+    return response.text.strip()
+
+_digest_cache: Dict[str, Dict[str, Any]] = {}
+
+async def condense_long_document(text: str, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+    """Condense a long article with parallel map-reduce summarization.
+    
+    Chunks are summarized concurrently under the LLM concurrency limit and
+    merged in one final call, so latency tracks the slowest chunk rather
+    than the article length. Digests are memoized so the hook and the
+    analysis of the same article share one map-reduce pass.
+    
+    Args:
+        text: Cleaned article text
+        deadline: Story deadline; condensing is skipped (the callers then
+            truncate the article) when less than LONG_DOC_MIN_SECONDS is left
+        
+    Returns:
+        Dictionary with the condensed text and chunk counts, or None if
+        the text is below LONG_DOC_THRESHOLD, there is no time for it, or
+        every chunk failed
+    """
+    if len(text) <= LONG_DOC_THRESHOLD:
+        return None
+
+    key = hashlib.sha256(text.encode()).hexdigest()
+    if key in _digest_cache:
+        return _digest_cache[key]
+
+    if deadline is not None and deadline.remaining() < LONG_DOC_MIN_SECONDS:
+        trace_event("deadline", stage="condense_long_document", action="skipped")
+        return None
+
+    # Each round may use half of what is left after the analysis reserve
+    round_timeout = LLM_TIMEOUT
+    if deadline is not None:
+        round_timeout = deadline.timeout(LLM_TIMEOUT, reserve=ANALYSIS_RESERVE_SECONDS) / 2
+
+    chunks = split_into_chunks(text)
+    results = await asyncio.gather(
+        *(run_llm(summarize_chunk, chunk, i, len(chunks), timeout=round_timeout, deadline=deadline)
+          for i, chunk in enumerate(chunks)),
+        return_exceptions=True
+    )
+    summaries = [r for r in results if isinstance(r, str) and r]
+    failed = len(results) - len(summaries)
+    if failed:
+        logger.warning(f"{failed} of {len(chunks)} chunk summaries failed")
+        trace_event("chunk_summaries_failed", failed=failed, chunks=len(chunks))
+    if not summaries:
+        return None
+
+    try:
+        condensed = await run_llm(reduce_summaries, summaries, timeout=round_timeout, deadline=deadline)
+    except Exception as e:
+        logger.warning(f"Reduce step failed, joining chunk summaries: {e}")
+        condensed = " ".join(summaries)
+
+    digest = {
+        "text": condensed,
+        "source_length": len(text),
+        "chunks": len(chunks),
+        "chunks_failed": failed
+    }
+    if len(_digest_cache) >= LONG_DOC_CACHE_SIZE:
+        _digest_cache.pop(next(iter(_digest_cache)))
+    _digest_cache[key] = digest
+    return digest
+
+async def generate_hook_async(html_content: str, deadline: Optional[Deadline] = None) -> str:
+    """Async wrapper for generate_hook with timeout.
+    
+    Articles longer than LONG_DOC_THRESHOLD are condensed first so the hook
+    reflects the whole piece rather than its introduction. With a deadline
+    the hook keeps ANALYSIS_RESERVE_SECONDS for the analysis and is skipped
+    when less than HOOK_MIN_SECONDS would be left for it.
+    """
+    if deadline is not None and deadline.timeout(LLM_TIMEOUT, reserve=ANALYSIS_RESERVE_SECONDS) < HOOK_MIN_SECONDS:
+        trace_event("deadline", stage="generate_hook", action="skipped")
+        return HOOK_UNAVAILABLE
+    digest = await condense_long_document(html_to_text(html_content), deadline=deadline)
+    if digest:
+        html_content = digest["text"]
+    return await run_llm(generate_hook, html_content, deadline=deadline, reserve=ANALYSIS_RESERVE_SECONDS)
+
+async def analyze_article_async(
+    html_content: str,
+    comments: list,
+    token_budget: Optional[int] = None,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
+    """Async wrapper for analyze_article with timeout.
+    
+    Articles longer than LONG_DOC_THRESHOLD are condensed first; the
+    analysis metadata then records the long-document pass. With less than
+    ANALYSIS_FULL_SECONDS left in the deadline the token budget is scaled
+    down (to no less than a quarter) so the prompt is shorter and faster.
+    """
+    if deadline is not None and deadline.remaining() < MIN_STAGE_SECONDS:
+        trace_event("deadline", stage="analyze_article", action="skipped")
+        return {
+            "analysis": "Analysis skipped: the story took too long to process.",
+            "metadata": {
+                "error": "Story deadline reached",
+                "model": "gemini-1.5-flash"
+            }
+        }
+
+    digest = await condense_long_document(html_to_text(html_content), deadline=deadline)
+    if digest:
+        html_content = digest["text"]
+
+    shortened = False
+    if deadline is not None and deadline.remaining() < ANALYSIS_FULL_SECONDS:
+        scale = max(0.25, deadline.remaining() / ANALYSIS_FULL_SECONDS)
+        token_budget = int((token_budget or ANALYSIS_TOKEN_BUDGET) * scale)
+        shortened = True
+        trace_event("deadline", stage="analyze_article", action="shortened", token_budget=token_budget)
 
-async def analyze_article_async(html_content: str, comments: list) -> Dict[str, Any]:
-    """Async wrapper for analyze_article with timeout."""
-    return await run_with_timeout(analyze_article, html_content, comments)
+    result = await run_llm(analyze_article, html_content, comments, token_budget=token_budget, deadline=deadline)
+    if digest:
+        result.setdefault("metadata", {})["long_document"] = {
+            "source_length": digest["source_length"],
+            "chunks": digest["chunks"],
+            "chunks_failed": digest["chunks_failed"]
+        }
+    if shortened:
+        result.setdefault("metadata", {})["prompt_shortened"] = True
+    return result
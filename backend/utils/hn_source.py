@@ -0,0 +1,591 @@
+"""Pluggable Hacker News data sources.
+
+This module provides:
+- The HNSource interface used by the frontpage and comment scrapers
+- HTMLSource, which renders news.ycombinator.com pages with Playwright
+- APISource, which bulk-fetches items from the HN JSON item API over a
+  pooled keep-alive HTTP client with an in-memory item cache
+
+The active backend is chosen with the HN_SOURCE environment variable
+("html" or "api").
+"""
+
+import asyncio
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from urllib.parse import urljoin
+
+import httpx
+from bs4 import BeautifulSoup
+
+from utils.browser import get_browser_context
+from utils.comment_tree import CommentTree, CommentTreeCache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Source selection and endpoints
+HN_SOURCE = os.getenv("HN_SOURCE", "html")
+HN_BASE_URL = os.getenv("HN_BASE_URL", "https://news.ycombinator.com").rstrip("/")
+HN_API_BASE = os.getenv("HN_API_BASE", "https://hacker-news.firebaseio.com/v0").rstrip("/")
+
+# API client tuning
+HN_API_MAX_CONNECTIONS = int(os.getenv("HN_API_MAX_CONNECTIONS", "20"))
+HN_API_TIMEOUT = float(os.getenv("HN_API_TIMEOUT", "10"))
+HN_ITEM_CACHE_SIZE = int(os.getenv("HN_ITEM_CACHE_SIZE", "20000"))
+HN_ITEM_TTL = float(os.getenv("HN_ITEM_TTL", "300"))
+
+# Comment thread loading
+COMMENT_TREE_CACHE_SIZE = int(os.getenv("COMMENT_TREE_CACHE_SIZE", "200"))
+COMMENT_TREE_TTL = float(os.getenv("COMMENT_TREE_TTL", "300"))
+HN_MAX_COMMENT_PAGES = int(os.getenv("HN_MAX_COMMENT_PAGES", "20"))
+
+# HN shows 30 stories per page
+STORIES_PER_PAGE = 30
+
+# Extracts every comment row of an item page plus its "More" link in one round trip
+COMMENT_ROWS_SCRIPT = """
+() => {
+    const rows = Array.from(document.querySelectorAll('tr.athing.comtr')).map(row => {
+        const user = row.querySelector('.hnuser');
+        const comment = row.querySelector('.comment');
+        const ind = row.querySelector('td.ind');
+        let depth = 0;
+        if (ind && ind.hasAttribute('indent')) {
+            depth = parseInt(ind.getAttribute('indent'), 10) || 0;
+        } else if (ind && ind.querySelector('img')) {
+            depth = Math.floor((parseInt(ind.querySelector('img').getAttribute('width'), 10) || 0) / 40);
+        }
+        return {
+            id: row.id || '',
+            author: user ? user.innerText : 'anonymous',
+            text: comment ? comment.innerText : '',
+            depth: depth
+        };
+    });
+    const more = document.querySelector('a.morelink');
+    return [rows, more ? more.getAttribute('href') : null];
+}
+"""
+
+# Extracts the submission row of an item page (title, link, score, author, comment count)
+STORY_ROW_SCRIPT = """
+() => {
+    const row = document.querySelector('tr.athing.submission') || document.querySelector('tr.athing');
+    if (!row) return null;
+    const title = row.querySelector('.titleline a');
+    const subtext = row.nextElementSibling;
+    const score = subtext && subtext.querySelector('.score');
+    const user = subtext && subtext.querySelector('.hnuser');
+    const age = subtext && subtext.querySelector('.age');
+    const links = subtext ? Array.from(subtext.querySelectorAll('a')) : [];
+    const last = links.length ? links[links.length - 1].innerText : '';
+    return {
+        id: row.id,
+        title: title ? title.innerText : '',
+        href: title ? title.getAttribute('href') : null,
+        points: score ? parseInt(score.innerText, 10) || 0 : 0,
+        author: user ? user.innerText : 'unknown',
+        time: age && age.getAttribute('title') ? parseInt(age.getAttribute('title').split(' ').pop(), 10) || 0 : 0,
+        comments: last.includes('comment') ? parseInt(last, 10) || 0 : 0
+    };
+}
+"""
+
+class HNSource(ABC):
+    """Interface for Hacker News frontpage and comment backends."""
+
+    name = "base"
+
+    def __init__(self):
+        self._trees = CommentTreeCache(max_trees=COMMENT_TREE_CACHE_SIZE, ttl=COMMENT_TREE_TTL)
+
+    @abstractmethod
+    async def frontpage(self, limit: int = 10, offset: int = 0) -> Dict[str, Any]:
+        """Fetch frontpage stories.
+
+        Args:
+            limit: Maximum number of stories to return
+            offset: Number of stories to skip
+
+        Returns:
+            Dictionary containing stories and pagination info
+        """
+
+    @abstractmethod
+    async def stories(self, hn_ids: List[int]) -> Dict[int, Optional[Dict[str, Any]]]:
+        """Fetch story metadata for arbitrary story IDs.
+
+        Args:
+            hn_ids: Hacker News story IDs
+
+        Returns:
+            Dictionary mapping each ID to a story dictionary shaped like
+            the frontpage entries, or None if it is not a live story
+        """
+
+    @abstractmethod
+    async def load_comment_tree(self, hn_id) -> CommentTree:
+        """Fetch a story's full comment thread, following pagination.
+
+        Args:
+            hn_id: Hacker News story ID
+
+        Returns:
+            Frozen CommentTree for the thread
+        """
+
+    async def comment_tree(self, hn_id) -> CommentTree:
+        """Return the story's comment tree, loading it at most once per TTL."""
+        return await self._trees.get(hn_id, self.load_comment_tree)
+
+    async def comments(self, hn_id, offset: int = 0, limit: int = 10) -> Dict[str, Any]:
+        """Fetch a window of comments for a story in thread order.
+
+        Args:
+            hn_id: Hacker News story ID
+            offset: Number of comments to skip
+            limit: Maximum number of comments to return
+
+        Returns:
+            Dictionary containing comments list and pagination info, with
+            an error message (and no comments) if the thread failed to load
+        """
+        try:
+            tree = await self.comment_tree(hn_id)
+        except Exception as e:
+            logger.error(f"Error loading comments: {e}")
+            return {"comments": [], "has_more": False, "error": str(e) or type(e).__name__}
+
+        return {
+            "comments": tree.window(offset, limit),
+            "has_more": offset + limit < len(tree)
+        }
+
+    async def comment_subtree(self, hn_id, index: int, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Fetch a comment and all of its replies.
+
+        Args:
+            hn_id: Hacker News story ID
+            index: Thread index of the root comment
+            limit: Maximum number of comments to return
+
+        Returns:
+            Dictionary containing the subtree comments in thread order
+        """
+        tree = await self.comment_tree(hn_id)
+        return {"comments": tree.subtree(index, limit)}
+
+    async def warm_up(self):
+        """Open connections ahead of the first request."""
+
+    async def close(self):
+        """Release any resources held by the source."""
+
+class HTMLSource(HNSource):
+    """Scrapes rendered news.ycombinator.com pages with Playwright."""
+
+    name = "html"
+
+    def __init__(self, base_url: str = HN_BASE_URL):
+        super().__init__()
+        self.base_url = base_url
+
+    async def frontpage(self, limit: int = 10, offset: int = 0) -> Dict[str, Any]:
+        results = []
+        async with get_browser_context() as (browser, page):
+            try:
+                # Handle pagination
+                if offset > 0:
+                    page_num = (offset // STORIES_PER_PAGE) + 1
+                    await page.goto(f"{self.base_url}/news?p={page_num}")
+                else:
+                    await page.goto(f"{self.base_url}/")
+
+                story_rows = await page.query_selector_all('tr.athing')
+                start_idx = offset % STORIES_PER_PAGE
+                story_rows = story_rows[start_idx:start_idx + limit]
+
+                has_more = len(story_rows) > 0
+
+                for story_row in story_rows:
+                    # Extract story data
+                    title = await story_row.query_selector('.titleline a')
+                    title_text = await title.inner_text()
+                    url = await title.get_attribute('href')
+                    hn_id = await story_row.get_attribute('id')
+
+                    subtext_row = await page.query_selector(f'tr.athing[id="{hn_id}"] + tr')
+
+                    # Initialize default values
+                    points = 0
+                    author = "unknown"
+                    comments_count = 0
+
+                    if subtext_row:
+                        # Extract points
+                        score = await subtext_row.query_selector('.score')
+                        if score:
+                            score_text = await score.inner_text()
+                            points = int(score_text.split()[0]) if score_text else 0
+
+                        # Extract author
+                        user = await subtext_row.query_selector('.hnuser')
+                        if user:
+                            author = await user.inner_text()
+
+                        # Extract comments count
+                        links = await subtext_row.query_selector_all('a')
+                        if links:
+                            last_link = links[-1]
+                            comments_text = await last_link.inner_text()
+                            if "comments" in comments_text:
+                                comments_count = int(comments_text.split()[0]) if comments_text else 0
+                            elif "discuss" in comments_text:
+                                comments_count = 0
+
+                    results.append({
+                        "hn_id": int(hn_id),
+                        "title": title_text,
+                        "url": f"{self.base_url}/item?id={hn_id}",
+                        "article_url": url,
+                        "author": author,
+                        "points": points,
+                        "comments_count": comments_count
+                    })
+            except Exception as e:
+                logger.error(f"Error scraping frontpage: {e}")
+                raise
+
+        return {"stories": results, "has_more": has_more}
+
+    async def stories(self, hn_ids: List[int]) -> Dict[int, Optional[Dict[str, Any]]]:
+        results: Dict[int, Optional[Dict[str, Any]]] = {}
+        async with get_browser_context() as (browser, page):
+            for hn_id in hn_ids:
+                try:
+                    await page.goto(f"{self.base_url}/item?id={int(hn_id)}")
+                    row = await page.evaluate(STORY_ROW_SCRIPT)
+                except Exception as e:
+                    logger.warning(f"Error scraping HN item {hn_id}: {e}")
+                    row = None
+                if not row or str(row["id"]) != str(hn_id) or not row["title"]:
+                    # Missing, dead, or a comment (whose page has no submission row)
+                    results[hn_id] = None
+                    continue
+                results[hn_id] = {
+                    "hn_id": int(hn_id),
+                    "title": row["title"],
+                    "url": f"{self.base_url}/item?id={hn_id}",
+                    "article_url": urljoin(f"{self.base_url}/", row["href"] or f"item?id={hn_id}"),
+                    "author": row["author"],
+                    "points": row["points"],
+                    "comments_count": row["comments"],
+                    "time": row["time"]
+                }
+        return results
+
+    async def load_comment_tree(self, hn_id) -> CommentTree:
+        tree = CommentTree(hn_id)
+        url = f"{self.base_url}/item?id={hn_id}"
+        pages = 0
+        async with get_browser_context() as (browser, page):
+            while url and pages < HN_MAX_COMMENT_PAGES:
+                await page.goto(url)
+                rows, more = await page.evaluate(COMMENT_ROWS_SCRIPT)
+                for row in rows:
+                    tree.append(
+                        row["author"],
+                        row["text"],
+                        row["depth"],
+                        item_id=int(row["id"]) if row["id"].isdigit() else 0,
+                    )
+                pages += 1
+                # Threads longer than one page continue behind a "More" link
+                url = urljoin(page.url, more) if more else None
+        if url:
+            logger.warning(f"Stopped loading comments for {hn_id} after {pages} pages")
+        return tree.freeze()
+
+def comment_html_to_text(html: str) -> str:
+    """Convert HN API comment markup to the plain text the HTML scraper yields.
+
+    Args:
+        html: Comment body as returned by the item API
+
+    Returns:
+        Plain text with paragraphs separated by blank lines
+    """
+    if not html:
+        return ""
+    # The API separates paragraphs with bare <p> tags
+    soup = BeautifulSoup(html.replace("<p>", "\n\n"), "html.parser")
+    return soup.get_text()
+
+def story_from_item(item: Optional[Dict[str, Any]], site_url: str = HN_BASE_URL) -> Optional[Dict[str, Any]]:
+    """Convert an API item to a story dictionary, or None if it is not a live story.
+
+    Args:
+        item: Item dictionary as returned by the item API
+        site_url: HN site the story's discussion links point to
+    """
+    if not item or item.get("deleted") or item.get("dead") or item.get("type") == "comment":
+        return None
+    hn_id = item["id"]
+    return {
+        "hn_id": hn_id,
+        "title": item.get("title", ""),
+        "url": f"{site_url}/item?id={hn_id}",
+        "article_url": item.get("url") or f"{site_url}/item?id={hn_id}",
+        "author": item.get("by", "unknown"),
+        "points": item.get("score", 0),
+        "comments_count": item.get("descendants", 0),
+        "time": item.get("time", 0)
+    }
+
+class APISource(HNSource):
+    """Fetches stories and comments from the HN JSON item API."""
+
+    name = "api"
+
+    def __init__(
+        self,
+        base_url: str = HN_API_BASE,
+        max_connections: int = HN_API_MAX_CONNECTIONS,
+        cache_size: int = HN_ITEM_CACHE_SIZE,
+        item_ttl: float = HN_ITEM_TTL,
+    ):
+        super().__init__()
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.cache_size = cache_size
+        self.item_ttl = item_ttl
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+        self._items: "OrderedDict[int, tuple]" = OrderedDict()
+        self._inflight: Dict[int, asyncio.Future] = {}
+        # Item fetches wait here rather than in the connection pool, whose wait times out
+        self._fetch_slots = asyncio.Semaphore(max_connections)
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared keep-alive client, creating it on first use."""
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    self._client = httpx.AsyncClient(
+                        base_url=self.base_url,
+                        timeout=HN_API_TIMEOUT,
+                        limits=httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections,
+                        ),
+                    )
+        return self._client
+
+    def _cache_get(self, item_id: int) -> Optional[Dict[str, Any]]:
+        entry = self._items.get(item_id)
+        if entry is None:
+            return None
+        fetched_at, item = entry
+        if time.monotonic() - fetched_at > self.item_ttl:
+            del self._items[item_id]
+            return None
+        self._items.move_to_end(item_id)
+        return item
+
+    def _cache_put(self, item_id: int, item: Dict[str, Any]):
+        self._items[item_id] = (time.monotonic(), item)
+        self._items.move_to_end(item_id)
+        while len(self._items) > self.cache_size:
+            self._items.popitem(last=False)
+
+    async def _fetch_json(self, path: str):
+        client = await self._get_client()
+        response = await client.get(path)
+        response.raise_for_status()
+        return response.json()
+
+    async def get_item(self, item_id: int) -> Optional[Dict[str, Any]]:
+        """Fetch a single item, served from the cache when fresh.
+
+        Concurrent requests for the same uncached item share one fetch, and
+        at most max_connections fetches run at once.
+
+        Args:
+            item_id: HN item ID
+
+        Returns:
+            Item dictionary, or None if the item does not exist
+        """
+        item_id = int(item_id)
+        item = self._cache_get(item_id)
+        if item is not None:
+            return item
+
+        pending = self._inflight.get(item_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[item_id] = future
+        try:
+            async with self._fetch_slots:
+                item = await self._fetch_json(f"/item/{item_id}.json")
+            if item is not None:
+                self._cache_put(item_id, item)
+            future.set_result(item)
+            return item
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so waiters without a handler don't warn
+            future.exception()
+            raise
+        finally:
+            del self._inflight[item_id]
+            if not future.done():
+                # Cancelled mid-fetch; waiters must not hang on a future nobody settles
+                future.set_exception(RuntimeError(f"Fetch of HN item {item_id} was cancelled"))
+                future.exception()
+
+    async def get_items(self, item_ids: List[int]) -> List[Optional[Dict[str, Any]]]:
+        """Fetch many items concurrently, preserving input order.
+
+        Failed fetches are logged and returned as None.
+
+        Args:
+            item_ids: HN item IDs
+
+        Returns:
+            List of item dictionaries (or None) in the same order as item_ids
+        """
+        results = await asyncio.gather(
+            *(self.get_item(item_id) for item_id in item_ids),
+            return_exceptions=True
+        )
+        items = []
+        for item_id, result in zip(item_ids, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Error fetching HN item {item_id}: {result}")
+                items.append(None)
+            else:
+                items.append(result)
+        return items
+
+    async def frontpage(self, limit: int = 10, offset: int = 0) -> Dict[str, Any]:
+        try:
+            top_ids = await self._fetch_json("/topstories.json") or []
+        except Exception as e:
+            logger.error(f"Error fetching top stories: {e}")
+            raise
+
+        window = top_ids[offset:offset + limit]
+        results = []
+        for item in await self.get_items(window):
+            story = story_from_item(item)
+            if story is not None:
+                results.append(story)
+
+        return {"stories": results, "has_more": offset + limit < len(top_ids)}
+
+    async def stories(self, hn_ids: List[int]) -> Dict[int, Optional[Dict[str, Any]]]:
+        items = await self.get_items(hn_ids)
+        return {hn_id: story_from_item(item) for hn_id, item in zip(hn_ids, items)}
+
+    async def fetch_thread(self, hn_id) -> List[Dict[str, Any]]:
+        """Fetch every comment of a story, one concurrent batch per tree level.
+
+        Args:
+            hn_id: Hacker News story ID
+
+        Returns:
+            Comments in thread (pre-order) order with their depth
+        """
+        root = await self.get_item(hn_id)
+        if not root:
+            return []
+
+        children: Dict[int, List[int]] = {}
+        items: Dict[int, Dict[str, Any]] = {}
+        level = [int(hn_id)]
+        items[int(hn_id)] = root
+        while level:
+            next_level = []
+            for item_id in level:
+                kids = items[item_id].get("kids") or []
+                children[item_id] = kids
+                next_level.extend(kids)
+            fetched = await self.get_items(next_level)
+            level = []
+            for kid_id, item in zip(next_level, fetched):
+                if item is None:
+                    continue
+                if (item.get("deleted") or item.get("dead")) and not item.get("kids"):
+                    continue
+                items[kid_id] = item
+                level.append(kid_id)
+
+        results = []
+        stack = [(kid_id, 0) for kid_id in reversed(children[int(hn_id)])]
+        while stack:
+            item_id, depth = stack.pop()
+            item = items.get(item_id)
+            if item is None:
+                continue
+            results.append({
+                "id": item_id,
+                "author": item.get("by", "anonymous"),
+                "text": comment_html_to_text(item.get("text", "")),
+                "depth": depth,
+                "time": item.get("time", 0)
+            })
+            for kid_id in reversed(children.get(item_id, [])):
+                stack.append((kid_id, depth + 1))
+        return results
+
+    async def load_comment_tree(self, hn_id) -> CommentTree:
+        return CommentTree.from_comments(hn_id, await self.fetch_thread(hn_id))
+
+    async def warm_up(self):
+        """Open a keep-alive connection (TLS included) to the API."""
+        client = await self._get_client()
+        response = await client.get("/maxitem.json")
+        response.raise_for_status()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+SOURCES = {
+    HTMLSource.name: HTMLSource,
+    APISource.name: APISource,
+}
+
+_source: Optional[HNSource] = None
+
+def get_source() -> HNSource:
+    """Return the configured HN source, creating it on first use.
+
+    Raises:
+        ValueError: If HN_SOURCE names an unknown backend
+    """
+    global _source
+    if _source is None:
+        source_cls = SOURCES.get(HN_SOURCE)
+        if source_cls is None:
+            raise ValueError(f"Unknown HN_SOURCE '{HN_SOURCE}', expected one of: {', '.join(SOURCES)}")
+        _source = source_cls()
+        logger.info(f"Using HN source: {_source.name}")
+    return _source
+
+async def close_source():
+    """Close the active HN source if one was created."""
+    global _source
+    if _source is not None:
+        await _source.close()
+        _source = None
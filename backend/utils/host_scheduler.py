@@ -0,0 +1,184 @@
+"""Per-host scheduling and negative caching for article fetches.
+
+This module provides:
+- A per-host concurrency limit shared by the scraper and the screenshot manager
+- A negative cache of hosts and URLs that recently blocked us, timed out or
+  failed, with exponential back-off, so they are skipped instead of costing
+  the full page load timeout on every uncached story
+
+Bot blocks and load timeouts mark the whole host; other errors only mark
+the URL. A successful fetch clears both.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+from metrics import HOST_SKIPS, HOST_FAILURES
+
+logger = logging.getLogger(__name__)
+
+# Concurrent page loads per host, with per-host overrides ("github.com=4,medium.com=1")
+HOST_MAX_CONCURRENCY = int(os.getenv("HOST_MAX_CONCURRENCY", "2"))
+HOST_CONCURRENCY = os.getenv("HOST_CONCURRENCY", "")
+
+# Back-off for failing hosts/URLs: BASE * 2^(failures - 1), capped at MAX
+NEGATIVE_CACHE_BASE_TTL = float(os.getenv("NEGATIVE_CACHE_BASE_TTL", "300"))
+NEGATIVE_CACHE_MAX_TTL = float(os.getenv("NEGATIVE_CACHE_MAX_TTL", "21600"))
+NEGATIVE_CACHE_SIZE = int(os.getenv("NEGATIVE_CACHE_SIZE", "2048"))
+
+# Failure kinds that mark the whole host rather than a single URL
+HOST_WIDE_FAILURES = ("blocked", "timeout")
+
+def host_of(url: str) -> str:
+    """Return the normalized host of a URL (lowercase, without 'www.')."""
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+def parse_concurrency_overrides(spec: str) -> Dict[str, int]:
+    """Parse 'host=limit,host=limit' into a dictionary."""
+    overrides = {}
+    for item in spec.split(","):
+        host, _, limit = item.strip().partition("=")
+        if host and limit.strip().isdigit():
+            overrides[host_of(f"//{host.strip()}")] = max(1, int(limit))
+    return overrides
+
+class HostScheduler:
+    """Per-host concurrency limits plus a negative cache with back-off."""
+
+    def __init__(
+        self,
+        max_concurrency: int = HOST_MAX_CONCURRENCY,
+        overrides: Optional[Dict[str, int]] = None,
+        base_ttl: float = NEGATIVE_CACHE_BASE_TTL,
+        max_ttl: float = NEGATIVE_CACHE_MAX_TTL,
+        cache_size: int = NEGATIVE_CACHE_SIZE
+    ):
+        self.max_concurrency = max_concurrency
+        self.overrides = overrides if overrides is not None else parse_concurrency_overrides(HOST_CONCURRENCY)
+        self.base_ttl = base_ttl
+        self.max_ttl = max_ttl
+        self.cache_size = cache_size
+        self._slots: "weakref.WeakValueDictionary[str, asyncio.Semaphore]" = weakref.WeakValueDictionary()
+        # key -> {"kind", "reason", "failures", "until"}; expired entries are
+        # kept (until evicted) so repeated failures keep doubling the back-off
+        self._negative: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def limit_for(self, host: str) -> int:
+        return self.overrides.get(host, self.max_concurrency)
+
+    @asynccontextmanager
+    async def slot(self, url: str, timeout: Optional[float] = None):
+        """Hold one of the host's concurrent page-load slots.
+
+        Args:
+            url: URL whose host's slots are used
+            timeout: Longest to wait for a slot, in seconds
+
+        Yields:
+            True once a slot is held, or False (holding none) if no slot
+            was free within timeout
+        """
+        host = host_of(url)
+        semaphore = self._slots.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.limit_for(host))
+            self._slots[host] = semaphore
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            semaphore.release()
+
+    def check(self, url: str) -> Optional[Dict[str, Any]]:
+        """Return the active negative-cache entry for a URL or its host.
+
+        Returns:
+            Dictionary with scope, kind, reason, failures and retry_in
+            seconds, or None if the URL may be fetched
+        """
+        now = time.monotonic()
+        for scope, key in (("host", f"host:{host_of(url)}"), ("url", f"url:{url}")):
+            entry = self._negative.get(key)
+            if entry and entry["until"] > now:
+                HOST_SKIPS.labels(entry["kind"]).inc()
+                return {
+                    "scope": scope,
+                    "kind": entry["kind"],
+                    "reason": entry["reason"],
+                    "failures": entry["failures"],
+                    "retry_in": round(entry["until"] - now),
+                }
+        return None
+
+    def record_failure(self, url: str, kind: str, reason: str, host_wide: Optional[bool] = None) -> float:
+        """Negative-cache a failed fetch.
+
+        Args:
+            url: URL that failed
+            kind: "blocked", "timeout" or "error"
+            reason: Human-readable reason reported to clients
+            host_wide: Mark the whole host (defaults to True for blocks and timeouts)
+
+        Returns:
+            Back-off in seconds before the host or URL is tried again
+        """
+        if host_wide is None:
+            host_wide = kind in HOST_WIDE_FAILURES
+        key = f"host:{host_of(url)}" if host_wide else f"url:{url}"
+        previous = self._negative.pop(key, None)
+        failures = (previous["failures"] if previous else 0) + 1
+        ttl = min(self.base_ttl * 2 ** (failures - 1), self.max_ttl)
+        self._negative[key] = {
+            "kind": kind,
+            "reason": reason,
+            "failures": failures,
+            "until": time.monotonic() + ttl,
+        }
+        while len(self._negative) > self.cache_size:
+            self._negative.popitem(last=False)
+        HOST_FAILURES.labels(kind).inc()
+        logger.info(f"Backing off {key} for {ttl:.0f}s after {failures} failure(s): {reason}")
+        return ttl
+
+    def record_timeout(self, url: str, timeout: float, full_timeout: float) -> Optional[float]:
+        """Negative-cache a page load that timed out, if the timeout was a fair test.
+
+        Loads given less than full_timeout (because the story deadline was
+        running out) say nothing about the host, so only a timeout at the
+        full limit backs it off.
+
+        Args:
+            url: URL that timed out
+            timeout: Seconds the load was given
+            full_timeout: The stage's configured load timeout
+
+        Returns:
+            Back-off in seconds, or None if the timeout was not recorded
+        """
+        if timeout < full_timeout:
+            return None
+        return self.record_failure(url, "timeout", "page load timed out")
+
+    def record_success(self, url: str):
+        """Clear negative-cache entries for a URL and its host."""
+        self._negative.pop(f"host:{host_of(url)}", None)
+        self._negative.pop(f"url:{url}", None)
+
+# Process-wide scheduler shared by the scraper and the screenshot manager
+host_scheduler = HostScheduler()
+
+def skip_message(entry: Dict[str, Any]) -> str:
+    """Describe a negative-cache entry for screenshot_error/metadata."""
+    target = "host" if entry["scope"] == "host" else "URL"
+    return f"Skipped: {target} recently failed ({entry['reason']}); retry in {entry['retry_in']}s"
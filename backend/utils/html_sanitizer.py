@@ -0,0 +1,179 @@
+"""Sanitizing and minification of extracted article HTML.
+
+This module provides functions to:
+- Keep a whitelist of semantic tags and attributes, unwrapping other tags
+  and dropping scripts, styles, forms and navigation with their content
+- Collapse whitespace and remove comments and empty elements
+- Report how much the article HTML shrank
+"""
+
+import re
+from typing import Any, Dict, List
+from bs4 import Comment, NavigableString, Tag
+from bs4.element import CData, Declaration, Doctype, ProcessingInstruction
+
+# Tags kept as-is; any other tag is unwrapped (its children are kept)
+ALLOWED_TAGS = frozenset({
+    "a", "abbr", "article", "b", "blockquote", "br", "caption", "cite", "code",
+    "dd", "del", "details", "dfn", "div", "dl", "dt", "em", "figcaption", "figure",
+    "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img", "ins", "kbd", "li",
+    "main", "mark", "ol", "p", "pre", "q", "s", "samp", "section", "small", "source",
+    "span", "strong", "sub", "summary", "sup", "table", "tbody", "td", "tfoot", "th",
+    "thead", "tr", "u", "ul", "var", "video",
+})
+
+# Tags removed together with their content
+DROPPED_TAGS = frozenset({
+    "script", "style", "noscript", "template", "iframe", "object", "embed", "canvas",
+    "svg", "math", "form", "input", "button", "select", "textarea", "label",
+    "nav", "aside", "dialog", "link", "meta", "head", "title",
+})
+
+# Attributes kept per tag; everything else (style, class, id, data-*, on*,
+# srcset, tracking attributes) is removed
+ALLOWED_ATTRIBUTES = {
+    "a": frozenset({"href", "title"}),
+    "img": frozenset({"src", "alt", "width", "height", "loading"}),
+    "video": frozenset({"src", "poster", "controls"}),
+    "source": frozenset({"src", "type"}),
+    "td": frozenset({"colspan", "rowspan"}),
+    "th": frozenset({"colspan", "rowspan"}),
+    "ol": frozenset({"start"}),
+    "blockquote": frozenset({"cite"}),
+    "q": frozenset({"cite"}),
+}
+
+# Elements kept even without content
+VOID_TAGS = frozenset({"img", "br", "hr", "video", "source", "td", "th"})
+
+# Block-level tags: whitespace-only text next to them is dropped
+BLOCK_TAGS = frozenset({
+    "article", "blockquote", "dd", "details", "div", "dl", "dt", "figcaption", "figure",
+    "h1", "h2", "h3", "h4", "h5", "h6", "hr", "li", "main", "ol", "p", "pre",
+    "section", "summary", "table", "tbody", "td", "tfoot", "th", "thead", "tr", "ul",
+})
+
+# Elements whose whitespace is significant
+PREFORMATTED_TAGS = frozenset({"pre", "code"})
+
+# URL schemes kept in links and media; relative URLs are kept too
+SAFE_URL_SCHEMES = frozenset({"http", "https", "mailto"})
+
+# Inline raster images (SVG can carry script) are kept in image sources
+SAFE_DATA_IMAGE_TYPES = ("data:image/png", "data:image/jpeg", "data:image/gif", "data:image/webp")
+
+URL_ATTRIBUTES = frozenset({"href", "src", "poster", "cite"})
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# Browsers ignore these when resolving a URL ("java\tscript:" is "javascript:")
+_URL_IGNORED_RE = re.compile(r"[\x00-\x20\x7f]+")
+_URL_SCHEME_RE = re.compile(r"([a-zA-Z][a-zA-Z0-9+.-]*):")
+_SPECIAL_STRINGS = (Comment, CData, Declaration, Doctype, ProcessingInstruction)
+
+def is_safe_url(value: str, tag_name: str = "a") -> bool:
+    """Return whether a URL attribute may be kept: relative, or an allowed scheme."""
+    url = _URL_IGNORED_RE.sub("", value).lower()
+    match = _URL_SCHEME_RE.match(url)
+    if match is None:
+        return True
+    if match.group(1) in SAFE_URL_SCHEMES:
+        return True
+    return tag_name == "img" and url.startswith(SAFE_DATA_IMAGE_TYPES)
+
+def _clean_attributes(tag: Tag):
+    allowed = ALLOWED_ATTRIBUTES.get(tag.name, frozenset())
+    attrs = {}
+    for name, value in tag.attrs.items():
+        if name not in allowed:
+            continue
+        if name in URL_ATTRIBUTES:
+            if not isinstance(value, str) or not is_safe_url(value, tag.name):
+                continue
+        attrs[name] = value
+    tag.attrs = attrs
+
+def _prune(article: Tag) -> List[Tag]:
+    """Drop unwanted subtrees and comments and clean attributes in one walk.
+
+    Returns:
+        Tags to unwrap (not in ALLOWED_TAGS)
+    """
+    to_unwrap = []
+    stack = [article]
+    while stack:
+        tag = stack.pop()
+        for child in list(tag.contents):
+            if isinstance(child, Tag):
+                if child.name in DROPPED_TAGS:
+                    child.decompose()
+                    continue
+                if child.name in ALLOWED_TAGS:
+                    _clean_attributes(child)
+                else:
+                    to_unwrap.append(child)
+                stack.append(child)
+            elif isinstance(child, _SPECIAL_STRINGS):
+                child.extract()
+    return to_unwrap
+
+def _text_nodes(article: Tag) -> List[NavigableString]:
+    """Return text nodes whose whitespace may be collapsed (outside pre/code)."""
+    nodes = []
+    stack = [article]
+    while stack:
+        tag = stack.pop()
+        for child in tag.contents:
+            if isinstance(child, Tag):
+                if child.name not in PREFORMATTED_TAGS:
+                    stack.append(child)
+            else:
+                nodes.append(child)
+    return nodes
+
+def _is_block(node) -> bool:
+    return isinstance(node, Tag) and node.name in BLOCK_TAGS
+
+def sanitize_article(article: Tag) -> Dict[str, Any]:
+    """Sanitize and minify an article element in place.
+
+    Args:
+        article: BeautifulSoup tag containing the article (modified in place)
+
+    Returns:
+        Dictionary with the minified html and its original_bytes,
+        sanitized_bytes and reduction (fraction of bytes removed)
+    """
+    original_bytes = len(str(article).encode("utf-8"))
+
+    _clean_attributes(article)
+    for tag in _prune(article):
+        tag.unwrap()
+
+    # Whitespace (adjacent strings left by unwrapping are merged first)
+    article.smooth()
+    for node in _text_nodes(article):
+        collapsed = _WHITESPACE_RE.sub(" ", node)
+        if collapsed == " ":
+            previous, following = node.previous_sibling, node.next_sibling
+            at_block_edge = (previous is None or following is None) and _is_block(node.parent)
+            if at_block_edge or _is_block(previous) or _is_block(following):
+                node.extract()
+                continue
+        if collapsed != node:
+            node.replace_with(NavigableString(collapsed))
+
+    # Empty elements, innermost first so emptied parents go too
+    for tag in reversed(article.find_all(True)):
+        if tag.name in VOID_TAGS or tag.name in PREFORMATTED_TAGS:
+            continue
+        if not tag.contents:
+            tag.decompose()
+
+    html = str(article)
+    sanitized_bytes = len(html.encode("utf-8"))
+    return {
+        "html": html,
+        "original_bytes": original_bytes,
+        "sanitized_bytes": sanitized_bytes,
+        "reduction": round(1 - sanitized_bytes / original_bytes, 3) if original_bytes else 0.0,
+    }
@@ -0,0 +1,177 @@
+"""Token-budgeted packing of article text and comments into LLM prompts.
+
+This module provides functions to:
+- Estimate the token count of prompt text
+- Rank comments by signal (top-level first, substance, uniqueness)
+- Fill a configurable token budget split between article and discussion
+"""
+
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+# Budget configuration (tokens)
+ANALYSIS_TOKEN_BUDGET = int(os.getenv("ANALYSIS_TOKEN_BUDGET", "2000"))
+ANALYSIS_ARTICLE_SHARE = float(os.getenv("ANALYSIS_ARTICLE_SHARE", "0.6"))
+MAX_COMMENT_TOKENS = int(os.getenv("MAX_COMMENT_TOKENS", "150"))
+
+# Rough English average for Gemini/SentencePiece-style tokenizers
+CHARS_PER_TOKEN = 4
+
+# Comments sharing more than this fraction of words with an already chosen
+# comment are treated as near-duplicates
+DUPLICATE_OVERLAP = 0.6
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in text.
+
+    Args:
+        text: Prompt text
+
+    Returns:
+        Approximate token count
+    """
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, preferring a word boundary.
+
+    Args:
+        text: Text to shorten
+        max_tokens: Token allowance
+
+    Returns:
+        The text, shortened with an ellipsis if it did not fit
+    """
+    if max_tokens <= 0:
+        return ""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars - 3]
+    space = cut.rfind(" ")
+    if space > max_chars // 2:
+        cut = cut[:space]
+    return cut.rstrip() + "..."
+
+def format_comment(number: int, comment: Dict[str, Any]) -> str:
+    """Render one comment the way it appears in the analysis prompt."""
+    return f"Comment {number} by {comment['author']}: {comment['text']}"
+
+def _signal_score(comment: Dict[str, Any]) -> float:
+    """Score a comment by position in the thread and substance."""
+    depth = comment.get("depth", 0) or 0
+    position = 1.0 / (1 + depth)
+    # Longer comments carry more argument, with diminishing returns
+    substance = min(math.log1p(len(comment["text"])) / math.log1p(1200), 1.0)
+    return 0.6 * position + 0.4 * substance
+
+def rank_comments(comments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Order comments by signal, pushing near-duplicates to the end.
+
+    Args:
+        comments: Validated comment dictionaries with author/text/depth
+
+    Returns:
+        New list of the same comments, best first
+    """
+    scored = sorted(
+        enumerate(comments),
+        key=lambda pair: (-_signal_score(pair[1]), pair[0])
+    )
+    chosen, duplicates = [], []
+    seen_words: List[set] = []
+    for _, comment in scored:
+        words = set(_WORD_RE.findall(comment["text"].lower()))
+        is_duplicate = False
+        if words:
+            for other in seen_words:
+                overlap = len(words & other) / min(len(words), len(other))
+                if overlap > DUPLICATE_OVERLAP:
+                    is_duplicate = True
+                    break
+        if is_duplicate:
+            duplicates.append(comment)
+        else:
+            chosen.append(comment)
+            # Comments without words (CJK, emoji) cannot be compared by overlap
+            if words:
+                seen_words.append(words)
+    return chosen + duplicates
+
+def pack_analysis_input(
+    article_text: str,
+    comments: List[Dict[str, Any]],
+    token_budget: Optional[int] = None,
+    article_share: Optional[float] = None
+) -> Dict[str, Any]:
+    """Fit article text and the best comments into a token budget.
+
+    The article gets article_share of the budget and the discussion the
+    rest; whatever one side leaves unused is given to the other.
+
+    Args:
+        article_text: Cleaned article text
+        comments: Validated comment dictionaries
+        token_budget: Total tokens for article plus comments
+        article_share: Fraction of the budget reserved for the article
+
+    Returns:
+        Dictionary with the packed article, formatted comments text,
+        selected comments and token accounting
+    """
+    if token_budget is None:
+        token_budget = ANALYSIS_TOKEN_BUDGET
+    if article_share is None:
+        article_share = ANALYSIS_ARTICLE_SHARE
+
+    article_tokens_full = estimate_tokens(article_text)
+    article_allowance = int(token_budget * article_share)
+
+    # Prepare candidate comment lines, each capped individually
+    ranked = rank_comments(comments or [])
+    candidates = []
+    for comment in ranked:
+        text = truncate_to_tokens(comment["text"], MAX_COMMENT_TOKENS)
+        candidates.append({**comment, "text": text})
+    comments_tokens_full = sum(
+        estimate_tokens(format_comment(i + 1, c)) + 1 for i, c in enumerate(candidates)
+    )
+
+    # Hand unused allowance from either side to the other
+    comment_allowance = token_budget - article_allowance
+    if comments_tokens_full < comment_allowance:
+        article_allowance = token_budget - comments_tokens_full
+    if article_tokens_full < article_allowance:
+        comment_allowance = token_budget - article_tokens_full
+
+    article = truncate_to_tokens(article_text, article_allowance)
+    article_tokens = estimate_tokens(article)
+
+    selected, lines = [], []
+    comment_tokens = 0
+    for comment in candidates:
+        line = format_comment(len(selected) + 1, comment)
+        cost = estimate_tokens(line) + 1
+        if comment_tokens + cost > comment_allowance:
+            continue
+        selected.append(comment)
+        lines.append(line)
+        comment_tokens += cost
+
+    return {
+        "article": article,
+        "comments": selected,
+        "comments_text": "\n".join(lines),
+        "article_tokens": article_tokens,
+        "comment_tokens": comment_tokens,
+        "total_tokens": article_tokens + comment_tokens,
+        "token_budget": token_budget,
+        "article_truncated": len(article) < len(article_text),
+        "comments_dropped": len(candidates) - len(selected)
+    }
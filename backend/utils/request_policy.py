@@ -0,0 +1,139 @@
+"""Request blocking for browser pages.
+
+This module provides:
+- Routing profiles deciding which subresources a page may load: "extract"
+  (article text extraction, which needs neither images nor fonts) and
+  "screenshot" (which renders the page as a reader would see it)
+- Block lists by resource type (per profile) and by domain (ads,
+  analytics and other trackers, shared plus per profile)
+- Counters of requests blocked and allowed and an estimate of the bytes
+  not downloaded
+
+A blocked request is aborted before it leaves the browser, so its size is
+unknown; the bytes are estimated from the mean Content-Length of allowed
+responses of the same resource type. The page itself (the main frame's
+navigation) is never blocked.
+"""
+
+import logging
+import os
+from typing import Dict, FrozenSet, Iterable, List, Optional
+from urllib.parse import urlsplit
+from metrics import REQUESTS_ALLOWED, REQUESTS_BLOCKED, REQUEST_BYTES_BLOCKED
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_DOMAINS = (
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com", "adservice.google.com",
+    "google-analytics.com", "googletagmanager.com", "googletagservices.com",
+    "amazon-adsystem.com", "adnxs.com", "criteo.com", "criteo.net", "taboola.com", "outbrain.com",
+    "scorecardresearch.com", "quantserve.com", "chartbeat.com", "chartbeat.net",
+    "hotjar.com", "mixpanel.com", "segment.com", "segment.io", "optimizely.com", "nr-data.net",
+    "connect.facebook.net", "ads-twitter.com", "static.ads-twitter.com", "bat.bing.com", "clarity.ms",
+)
+
+DEFAULT_BLOCK_TYPES = {
+    "extract": "image,media,font,texttrack,manifest",
+    "screenshot": "media,texttrack,manifest",
+}
+
+def parse_list(spec: str) -> FrozenSet[str]:
+    """Parse a comma-separated list into lowercase entries."""
+    return frozenset(item.strip().lower() for item in spec.split(",") if item.strip())
+
+# Set to 0 to let pages load every resource
+REQUEST_POLICY = os.getenv("REQUEST_POLICY", "1") == "1"
+
+# Domains blocked in every profile (subdomains included)
+BLOCK_DOMAINS = parse_list(os.getenv("BLOCK_DOMAINS", ",".join(DEFAULT_BLOCK_DOMAINS)))
+
+class RequestPolicy:
+    """What one routing profile lets a page load."""
+
+    def __init__(self, profile: str, block_types: Iterable[str], block_domains: Iterable[str]):
+        """Initialize a profile.
+
+        Args:
+            profile: Profile name used in metrics
+            block_types: Playwright resource types to block (image, font, media, ...)
+            block_domains: Domains whose requests are blocked, subdomains included
+        """
+        self.profile = profile
+        self.block_types = frozenset(block_types)
+        self.block_domains = frozenset(block_domains)
+
+    def block_reason(self, resource_type: str, url: str) -> Optional[str]:
+        """Return why a subresource request is blocked ("type" or "domain"), or None to allow it."""
+        if resource_type in self.block_types:
+            return "type"
+        host = (urlsplit(url).hostname or "").lower()
+        # Match the host and each parent domain against the block list
+        while host:
+            if host in self.block_domains:
+                return "domain"
+            _, _, host = host.partition(".")
+        return None
+
+    async def _route(self, route):
+        request = route.request
+        resource_type = request.resource_type
+        try:
+            navigation = request.is_navigation_request() and request.frame.parent_frame is None
+        except Exception:
+            # Service worker requests have no frame
+            navigation = False
+        reason = None if navigation else self.block_reason(resource_type, request.url)
+        try:
+            if reason is None:
+                REQUESTS_ALLOWED.labels(self.profile).inc()
+                await route.continue_()
+                return
+            await route.abort("blockedbyclient")
+        except Exception as e:
+            # The page closed while the request was in flight
+            logger.debug(f"Routing {request.url} failed: {e}")
+            return
+        REQUESTS_BLOCKED.labels(self.profile, resource_type, reason).inc()
+        REQUEST_BYTES_BLOCKED.labels(self.profile).inc(estimated_size(resource_type))
+
+    async def install(self, target):
+        """Route the requests of a page or browser context through this policy."""
+        if not REQUEST_POLICY:
+            return
+        target.on("response", observe_response)
+        await target.route("**/*", self._route)
+
+# Content-Length totals and counts of allowed responses by resource type
+_sizes: Dict[str, List[int]] = {}
+
+def observe_response(response):
+    """Record a response's Content-Length for the blocked-bytes estimate."""
+    length = response.headers.get("content-length")
+    if length and length.isdigit():
+        resource_type = response.request.resource_type
+        totals = _sizes.setdefault(resource_type, [0, 0])
+        totals[0] += int(length)
+        totals[1] += 1
+
+def estimated_size(resource_type: str) -> float:
+    """Return the mean Content-Length seen for a resource type (0 before any was seen)."""
+    total, count = _sizes.get(resource_type, (0, 0))
+    return total / count if count else 0.0
+
+# Routing profiles; BLOCK_TYPES_<PROFILE> and BLOCK_DOMAINS_<PROFILE> override or extend them
+PROFILES = {
+    profile: RequestPolicy(
+        profile,
+        parse_list(os.getenv(f"BLOCK_TYPES_{profile.upper()}", types)),
+        BLOCK_DOMAINS | parse_list(os.getenv(f"BLOCK_DOMAINS_{profile.upper()}", "")),
+    )
+    for profile, types in DEFAULT_BLOCK_TYPES.items()
+}
+
+async def apply_policy(target, profile: str):
+    """Install a routing profile on a page or browser context.
+
+    Raises:
+        KeyError: If profile is unknown
+    """
+    await PROFILES[profile].install(target)
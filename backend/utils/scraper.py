@@ -6,25 +6,24 @@ This module provides functions to:
 - Handle bot detection and content validation
 """
 
-from playwright.async_api import async_playwright, Browser, Page
 from bs4 import BeautifulSoup
-import requests
 from urllib.parse import urljoin, urlparse
-import re
-import asyncio
 import logging
-from typing import List, Dict, Any, Optional
-from contextlib import asynccontextmanager
+from typing import Optional
+from utils.browser import get_browser_context, close_browser
+from utils.hn_source import get_source, close_source
+from utils.host_scheduler import host_scheduler, skip_message
+from utils.html_sanitizer import sanitize_article
+from metrics import ARTICLE_HTML_BYTES
+from image_proxy import proxy_url
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from tracing import trace_event
+from deadline import Deadline, LLM_RESERVE_SECONDS, MIN_STAGE_SECONDS, stage_timeout
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Global browser instance for reuse
-_browser: Optional[Browser] = None
-_browser_lock = asyncio.Lock()
-_playwright = None
-
 # Common phrases that indicate bot detection
 BOT_DETECTION_PHRASES = [
     "verify you are human",
@@ -32,57 +31,6 @@ BOT_DETECTION_PHRASES = [
     "enable javascript",
 ]
 
-@asynccontextmanager
-async def get_browser_context():
-    """Get or create a browser context with proper cleanup.
-    
-    Yields:
-        Tuple of (browser, page) for use in a context manager
-    """
-    global _browser, _playwright
-    browser = None
-    page = None
-    
-    try:
-        async with _browser_lock:
-            if _browser is None or _browser.is_connected() is False:
-                if _playwright is None:
-                    _playwright = await async_playwright().start()
-                _browser = await _playwright.chromium.launch(
-                    headless=True,
-                    args=[
-                        "--disable-blink-features=AutomationControlled",
-                        "--no-sandbox",
-                        "--disable-dev-shm-usage"
-                    ]
-                )
-            browser = _browser
-            page = await browser.new_page()
-            yield browser, page
-    finally:
-        if page and not page.is_closed():
-            await page.close()
-
-async def close_browser():
-    """Close the global browser instance and playwright if they exist."""
-    global _browser, _playwright
-    async with _browser_lock:
-        if _browser is not None:
-            try:
-                if _browser.is_connected():
-                    await _browser.close()
-            except Exception as e:
-                logger.error(f"Error closing browser: {e}")
-            finally:
-                _browser = None
-        if _playwright is not None:
-            try:
-                await _playwright.stop()
-            except Exception as e:
-                logger.error(f"Error stopping playwright: {e}")
-            finally:
-                _playwright = None
-
 async def scrape_hn_frontpage(limit=10, offset=0):
     """Scrape stories from Hacker News frontpage.
     
@@ -93,72 +41,7 @@ async def scrape_hn_frontpage(limit=10, offset=0):
     Returns:
         Dictionary containing stories and pagination info
     """
-    results = []
-    async with get_browser_context() as (browser, page):
-        try:
-            # Handle pagination
-            if offset > 0:
-                page_num = (offset // 30) + 1  # HN shows 30 stories per page
-                await page.goto(f"https://news.ycombinator.com/news?p={page_num}")
-            else:
-                await page.goto("https://news.ycombinator.com/")
-
-            story_rows = await page.query_selector_all('tr.athing')
-            start_idx = offset % 30
-            story_rows = story_rows[start_idx:start_idx + limit]
-            
-            has_more = len(story_rows) > 0
-            
-            for story_row in story_rows:
-                # Extract story data
-                title = await story_row.query_selector('.titleline a')
-                title_text = await title.inner_text()
-                url = await title.get_attribute('href')
-                hn_id = await story_row.get_attribute('id')
-                
-                subtext_row = await page.query_selector(f'tr.athing[id="{hn_id}"] + tr')
-                
-                # Initialize default values
-                points = 0
-                author = "unknown"
-                comments_count = 0
-                
-                if subtext_row:
-                    # Extract points
-                    score = await subtext_row.query_selector('.score')
-                    if score:
-                        score_text = await score.inner_text()
-                        points = int(score_text.split()[0]) if score_text else 0
-                    
-                    # Extract author
-                    user = await subtext_row.query_selector('.hnuser')
-                    if user:
-                        author = await user.inner_text()
-                    
-                    # Extract comments count
-                    links = await subtext_row.query_selector_all('a')
-                    if links:
-                        last_link = links[-1]
-                        comments_text = await last_link.inner_text()
-                        if "comments" in comments_text:
-                            comments_count = int(comments_text.split()[0]) if comments_text else 0
-                        elif "discuss" in comments_text:
-                            comments_count = 0
-
-                results.append({
-                    "hn_id": int(hn_id),
-                    "title": title_text,
-                    "url": f"https://news.ycombinator.com/item?id={hn_id}",
-                    "article_url": url, 
-                    "author": author,
-                    "points": points,
-                    "comments_count": comments_count
-                })
-        except Exception as e:
-            logger.error(f"Error scraping frontpage: {e}")
-            raise
-            
-    return {"stories": results, "has_more": has_more}
+    return await get_source().frontpage(limit=limit, offset=offset)
 
 def has_bot_detection(text):
     """Check if text contains bot detection phrases.
@@ -175,31 +58,77 @@ def has_bot_detection(text):
             return phrase
     return None
 
-async def scrape_full_article(url):
-    """Scrape and process article content.
+def rewrite_article_urls(article, url):
+    """Make media and link URLs in an article absolute and lazy-loaded.
+    
+    Images are pointed at the caching image proxy (see image_proxy.py).
     
     Args:
-        url: Article URL to scrape
-        
-    Returns:
-        Dictionary containing article content and metadata
+        article: BeautifulSoup tag containing the article (modified in place)
+        url: Article URL used to resolve relative references
     """
-    async with get_browser_context() as (browser, page):
-        try:
-            await page.goto(url, timeout=30000)
-            await page.wait_for_load_state('networkidle', timeout=5000)
+    # Process images
+    for img in article.find_all('img'):
+        src = img.get('src', '')
+        if src:
+            if not bool(urlparse(src).netloc):
+                src = urljoin(url, src)
             
-            content = await page.content()
-            trigger = has_bot_detection(content)
-            if trigger:
-                logger.warning(f"Bot detection triggered on {url} by phrase: '{trigger}'")
-                return {"error": f"Bot detection triggered by: {trigger}", "html": "<p>Article requires human verification</p>", "text": ""}
+            img['src'] = proxy_url(src)
+            if not img.get('alt'):
+                img['alt'] = 'Article image'
             
-            html = await page.content()
-        except Exception as e:
-            logger.error(f"Error loading page {url}: {str(e)}")
-            return {"error": f"Error loading page: {str(e)}", "html": "<p>Error loading page</p>", "text": ""}
+            img['loading'] = 'lazy'
+    
+    # Process videos
+    for video in article.find_all('video'):
+        src = video.get('src', '')
+        if src:
+            if not bool(urlparse(src).netloc):
+                src = urljoin(url, src)
+            video['src'] = src
+    
+    # Process links
+    for a in article.find_all('a'):
+        href = a.get('href', '')
+        if href and not bool(urlparse(href).netloc):
+            a['href'] = urljoin(url, href)
+
+def find_article_element(soup):
+    """Find the main content container of a parsed page.
+    
+    Args:
+        soup: Parsed page
+        
+    Returns:
+        The <main> or <article> element, else the div with the most text
+        (if it has more than 500 characters), else None
+    """
+    article = soup.find("main") or soup.find("article")
+    
+    if not article:
+        # Fallback: find largest div with substantial text
+        candidates = sorted(
+            soup.find_all("div"),
+            key=lambda tag: len(tag.get_text(strip=True)),
+            reverse=True
+        )
+        for tag in candidates:
+            if len(tag.get_text(strip=True)) > 500:
+                article = tag
+                break
+    return article
 
+def extract_article(html, url):
+    """Extract the main article and metadata from a rendered page.
+    
+    Args:
+        html: Full page HTML
+        url: Article URL used to resolve relative references
+        
+    Returns:
+        Dictionary containing article content and metadata, or an error
+    """
     try:
         soup = BeautifulSoup(html, "html.parser")
         
@@ -208,21 +137,7 @@ async def scrape_full_article(url):
             logger.warning(f"Bot detection triggered in parsed content for {url} by phrase: '{trigger}'")
             return {"error": f"Bot detection triggered by: {trigger}", "html": "<p>Article requires human verification</p>", "text": ""}
         
-        # Find main content container
-        article = soup.find("main") or soup.find("article")
-        
-        if not article:
-            # Fallback: find largest div with substantial text
-            candidates = sorted(
-                soup.find_all("div"),
-                key=lambda tag: len(tag.get_text(strip=True)),
-                reverse=True
-            )
-            for tag in candidates:
-                if len(tag.get_text(strip=True)) > 500:
-                    article = tag
-                    break
-        
+        article = find_article_element(soup)
         if not article:
             return {"error": "No content found", "html": "", "text": ""}
         
@@ -237,40 +152,21 @@ async def scrape_full_article(url):
             'og_image': og_image.get('content', '') if og_image else ''
         }
         
-        # Process images
-        for img in article.find_all('img'):
-            src = img.get('src', '')
-            if src:
-                if not bool(urlparse(src).netloc):
-                    src = urljoin(url, src)
-                
-                img['src'] = src
-                if not img.get('alt'):
-                    img['alt'] = 'Article image'
-                
-                img['loading'] = 'lazy'
-                img['data-src'] = src
-                img['onerror'] = "this.style.display='none'"
-        
-        # Process videos
-        for video in article.find_all('video'):
-            src = video.get('src', '')
-            if src:
-                if not bool(urlparse(src).netloc):
-                    src = urljoin(url, src)
-                video['src'] = src
-                video['onerror'] = "this.style.display='none'"
-        
-        # Process links
-        for a in article.find_all('a'):
-            href = a.get('href', '')
-            if href and not bool(urlparse(href).netloc):
-                a['href'] = urljoin(url, href)
+        rewrite_article_urls(article, url)
+        sanitized = sanitize_article(article)
+        ARTICLE_HTML_BYTES.labels("original").inc(sanitized["original_bytes"])
+        ARTICLE_HTML_BYTES.labels("sanitized").inc(sanitized["sanitized_bytes"])
+        trace_event(
+            "sanitize",
+            original_bytes=sanitized["original_bytes"],
+            sanitized_bytes=sanitized["sanitized_bytes"],
+            reduction=sanitized["reduction"]
+        )
         
         text = article.get_text(separator=" ", strip=True)
         
         return {
-            'html': str(article),
+            'html': sanitized["html"],
             'text': text,
             'metadata': metadata,
             'url': url
@@ -279,6 +175,74 @@ async def scrape_full_article(url):
         logger.error(f"Error processing article content: {e}")
         return {"error": f"Error processing content: {str(e)}", "html": "", "text": ""}
 
+# Default page load timeouts in seconds
+ARTICLE_GOTO_TIMEOUT = 30
+ARTICLE_IDLE_TIMEOUT = 5
+
+async def scrape_full_article(url, deadline: Optional[Deadline] = None):
+    """Scrape and process article content.
+    
+    Hosts that recently blocked us or timed out (and URLs that recently
+    failed) are skipped without loading the page; the result then carries
+    `skipped` with the negative-cache entry.
+    
+    Args:
+        url: Article URL to scrape
+        deadline: Story deadline; page load timeouts are shortened to fit
+            it, keeping LLM_RESERVE_SECONDS for the LLM stages
+        
+    Returns:
+        Dictionary containing article content and metadata
+    """
+    skip = host_scheduler.check(url)
+    if skip:
+        trace_event("negative_cache", stage="scrape_full_article", **skip)
+        return {"error": skip_message(skip), "html": "<p>Error loading page</p>", "text": "", "skipped": skip}
+
+    skipped = {"error": "Skipped: story deadline reached", "html": "<p>Error loading page</p>", "text": ""}
+    if stage_timeout(deadline, ARTICLE_GOTO_TIMEOUT, reserve=LLM_RESERVE_SECONDS) < MIN_STAGE_SECONDS:
+        trace_event("deadline", stage="scrape_full_article", action="skipped")
+        return skipped
+
+    # Wait for a slot on the host only while a page load could still start in time
+    slot_timeout = None if deadline is None else max(0.0, deadline.remaining() - LLM_RESERVE_SECONDS - MIN_STAGE_SECONDS)
+    async with host_scheduler.slot(url, timeout=slot_timeout) as granted:
+        goto_timeout = stage_timeout(deadline, ARTICLE_GOTO_TIMEOUT, reserve=LLM_RESERVE_SECONDS)
+        if not granted or goto_timeout < MIN_STAGE_SECONDS:
+            trace_event("deadline", stage="scrape_full_article", action="skipped", waited_for_host=not granted)
+            return skipped
+        async with get_browser_context() as (browser, page):
+            try:
+                await page.goto(url, timeout=goto_timeout * 1000)
+            except PlaywrightTimeoutError as e:
+                logger.error(f"Timeout loading page {url}: {str(e)}")
+                host_scheduler.record_timeout(url, goto_timeout, ARTICLE_GOTO_TIMEOUT)
+                return {"error": f"Error loading page: {str(e)}", "html": "<p>Error loading page</p>", "text": ""}
+            except Exception as e:
+                logger.error(f"Error loading page {url}: {str(e)}")
+                host_scheduler.record_failure(url, "error", str(e).splitlines()[0] if str(e) else type(e).__name__)
+                return {"error": f"Error loading page: {str(e)}", "html": "<p>Error loading page</p>", "text": ""}
+            try:
+                idle_timeout = stage_timeout(deadline, ARTICLE_IDLE_TIMEOUT, reserve=LLM_RESERVE_SECONDS)
+                if idle_timeout > 0:
+                    await page.wait_for_load_state('networkidle', timeout=idle_timeout * 1000)
+            except PlaywrightTimeoutError:
+                logger.warning(f"Network did not become idle on {url}, continuing anyway")
+            try:
+                html = await page.content()
+            except Exception as e:
+                logger.error(f"Error reading page {url}: {str(e)}")
+                return {"error": f"Error loading page: {str(e)}", "html": "<p>Error loading page</p>", "text": ""}
+
+    trigger = has_bot_detection(html)
+    if trigger:
+        logger.warning(f"Bot detection triggered on {url} by phrase: '{trigger}'")
+        host_scheduler.record_failure(url, "blocked", f"bot detection: {trigger}")
+        return {"error": f"Bot detection triggered by: {trigger}", "html": "<p>Article requires human verification</p>", "text": ""}
+    host_scheduler.record_success(url)
+
+    return extract_article(html, url)
+
 async def scrape_hn_comments(hn_id, offset=0, limit=10):
     """Scrape comments from a Hacker News story.
     
@@ -290,42 +254,17 @@ async def scrape_hn_comments(hn_id, offset=0, limit=10):
     Returns:
         Dictionary containing comments list and pagination info
     """
-    async with get_browser_context() as (browser, page):
-        try:
-            await page.goto(f"https://news.ycombinator.com/item?id={hn_id}")
-            
-            comment_rows = await page.query_selector_all('tr.athing.comtr')
-            comment_rows = comment_rows[offset:offset + limit]
-            results = []
-            
-            for row in comment_rows:
-                # Extract comment data
-                author = await row.query_selector('.hnuser')
-                author_text = await author.inner_text() if author else "anonymous"
-                
-                comment = await row.query_selector('.comment')
-                comment_text = await comment.inner_text() if comment else ""
-                
-                # Calculate comment depth
-                indent = await row.query_selector('.ind')
-                depth = 0
-                if indent:
-                    img = await indent.query_selector('img')
-                    if img:
-                        width = await img.get_attribute('width')
-                        if width:
-                            depth = int(width) // 40  # HN uses 40px per level
-                
-                results.append({
-                    'author': author_text,
-                    'text': comment_text,
-                    'depth': depth
-                })
-                
-            return {
-                "comments": results,
-                "has_more": len(comment_rows) == limit
-            }
-        except Exception as e:
-            logger.error(f"Error scraping comments: {e}")
-            return {"comments": [], "has_more": False}
\ No newline at end of file
+    return await get_source().comments(hn_id, offset=offset, limit=limit)
+
+async def scrape_hn_comment_subtree(hn_id, index, limit=None):
+    """Get a comment and all of its replies from a story's cached thread.
+    
+    Args:
+        hn_id: Hacker News story ID
+        index: Thread index of the root comment
+        limit: Maximum number of comments to return
+        
+    Returns:
+        Dictionary containing the subtree comments in thread order
+    """
+    return await get_source().comment_subtree(hn_id, index, limit=limit)
@@ -38,6 +38,8 @@ export interface Story {
   analysis?: any;
   /** Flag indicating if more content is available (optional) */
   has_more?: boolean;
+  /** Service mode the story was produced in under load, e.g. "hook_only" or "cache_only" for a pending placeholder (optional) */
+  degraded?: string | null;
   /** UI state for expanded view (optional) */
   expanded?: boolean;
   /** UI state for article visibility (optional) */